@@ -0,0 +1,169 @@
+# --- Almacén de imágenes direccionado por contenido (SHA-256) ---
+# La tabla imagenes_muebles solo guarda la clave y metadatos; los bytes viven
+# en disco local o en un bucket compatible con S3 (AWS, MinIO, R2...).
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+
+def clave_de(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+
+def tipo_mime(datos):
+    if datos[:4] == b"RIFF" and datos[8:12] == b"WEBP":
+        return "image/webp"
+    if datos[4:12] in (b"ftypavif", b"ftypavis"):
+        return "image/avif"
+    if datos[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if datos[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return "application/octet-stream"
+
+
+class AlmacenImagenes(ABC):
+    """Interfaz común: las claves son el SHA-256 hex de los bytes guardados."""
+
+    def guardar(self, datos):
+        clave = clave_de(datos)
+        if not self.existe(clave):
+            self._escribir(clave, datos)
+        return clave
+
+    @abstractmethod
+    def leer(self, clave):
+        ...
+
+    @abstractmethod
+    def existe(self, clave):
+        ...
+
+    @abstractmethod
+    def borrar(self, clave):
+        ...
+
+    @abstractmethod
+    def _escribir(self, clave, datos):
+        ...
+
+
+class AlmacenLocal(AlmacenImagenes):
+    def __init__(self, raiz):
+        self.raiz = os.path.abspath(raiz)
+        os.makedirs(self.raiz, exist_ok=True)
+
+    def _ruta(self, clave):
+        # Dos niveles de subcarpetas para no acumular miles de ficheros juntos
+        return os.path.join(self.raiz, clave[:2], clave[2:4], clave)
+
+    def _escribir(self, clave, datos):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica: nunca queda un fichero a medias con la clave final
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta))
+        with os.fdopen(fd, "wb") as f:
+            f.write(datos)
+        os.replace(tmp, ruta)
+
+    def leer(self, clave):
+        with open(self._ruta(clave), "rb") as f:
+            return f.read()
+
+    def existe(self, clave):
+        return os.path.exists(self._ruta(clave))
+
+    def borrar(self, clave):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+
+
+class AlmacenS3(AlmacenImagenes):
+    def __init__(self, bucket, prefijo="imagenes/", **opciones_cliente):
+        import boto3
+        from botocore.exceptions import ClientError
+        self._ClientError = ClientError
+        self.bucket = bucket
+        self.prefijo = prefijo
+        self.cliente = boto3.client("s3", **opciones_cliente)
+
+    def _key(self, clave):
+        return f"{self.prefijo}{clave[:2]}/{clave}"
+
+    def _escribir(self, clave, datos):
+        self.cliente.put_object(
+            Bucket=self.bucket, Key=self._key(clave), Body=datos,
+            ContentType=tipo_mime(datos),
+            CacheControl="public, max-age=31536000, immutable",
+        )
+
+    def leer(self, clave):
+        return self.cliente.get_object(Bucket=self.bucket, Key=self._key(clave))["Body"].read()
+
+    def existe(self, clave):
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._key(clave))
+            return True
+        except self._ClientError:
+            return False
+
+    def borrar(self, clave):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._key(clave))
+
+
+def crear_almacen(cfg=None):
+    """Crea el backend según la sección [imagenes] de secrets (local por defecto)."""
+    cfg = dict(cfg or {})
+    backend = cfg.get("backend", "local")
+    if backend == "local":
+        return AlmacenLocal(cfg.get("ruta", "almacen_imagenes"))
+    if backend == "s3":
+        opciones = {k: cfg[k] for k in ("endpoint_url", "region_name",
+                                         "aws_access_key_id", "aws_secret_access_key")
+                    if cfg.get(k)}
+        return AlmacenS3(cfg["bucket"], cfg.get("prefijo", "imagenes/"), **opciones)
+    raise ValueError(f"Backend de imágenes desconocido: {backend}")
+
+
+def guardar_variantes(almacen, variantes):
+    """Guarda las variantes de procesado_imagenes.generar_variantes().
+
+    Devuelve el índice que se guarda en imagenes_muebles.variantes:
+    {"webp": {"160": clave, "400": clave, ...}, "avif": {...}}.
+    """
+    indice = {}
+    for (formato, tamano), (datos, _, _) in variantes.items():
+        indice.setdefault(formato, {})[str(tamano)] = almacen.guardar(datos)
+    return indice
+
+
+def registro_imagen(almacen, variantes):
+    """Guarda las variantes y devuelve el dict de imagen para insertar_imagenes().
+
+    La imagen de referencia (clave, ancho, alto, bytes) es la WEBP más grande.
+    """
+    indice = guardar_variantes(almacen, variantes)
+    mayor = max(tamano for formato, tamano in variantes if formato == "webp")
+    datos, ancho, alto = variantes[("webp", mayor)]
+    return {"clave": indice["webp"][str(mayor)], "formato": "webp",
+            "ancho": ancho, "alto": alto, "bytes": len(datos), "variantes": indice}
+
+
+def elegir_variante(variantes, ancho_objetivo=None, formato="webp"):
+    """Clave de la variante más pequeña que cubre `ancho_objetivo` (la mayor si ninguna llega).
+
+    `variantes` es el JSON guardado en imagenes_muebles: {"webp": {"160": clave, ...}}.
+    """
+    por_tamano = (variantes or {}).get(formato) or {}
+    if not por_tamano:
+        return None
+    tamanos = sorted(int(t) for t in por_tamano)
+    if ancho_objetivo is None:
+        return por_tamano[str(tamanos[-1])]
+    for tamano in tamanos:
+        if tamano >= ancho_objetivo:
+            return por_tamano[str(tamano)]
+    return por_tamano[str(tamanos[-1])]
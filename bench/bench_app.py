@@ -0,0 +1,303 @@
+# --- Benchmark de la app completa con catálogos sintéticos ---
+# Uso: BENCH_DSN=postgresql://... python -m bench.bench_app [--tamanos 100 1000 10000]
+#          [--repeticiones 20] [--salida res.json]
+#      python -m bench.bench_app --comparar antes.json despues.json
+#
+# Siembra un esquema bench_app_<n> por tamaño (muebles con 1-10 imágenes
+# generadas, en un almacén local temporal) y ejecuta muebles_app.py sin
+# navegador con streamlit.testing.v1.AppTest. Cada escenario corre en un
+# proceso nuevo, así que la memoria pico (RSS) es la suya y las cachés de
+# Streamlit empiezan vacías; la primera ejecución se anota aparte.
+#
+# Por rerun: latencia p50/p95, consultas SQL (contador de instrumentacion.py)
+# y bytes enviados al navegador (mensajes del script + ficheros de imagen).
+# El Postgres necesita las extensiones unaccent y pg_trgm (migración 3).
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+from psycopg2.extensions import parse_dsn
+from psycopg2.extras import RealDictCursor
+
+from almacen_imagenes import AlmacenLocal, registro_imagen
+from bench.sintetico import conectar, crear_esquema, sembrar_muebles
+from db import cargar_secrets
+from migraciones import migrar
+from procesado_imagenes import generar_variantes
+from repositorio import insertar_imagenes_muebles
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(RAIZ, "muebles_app.py")
+FOTOS_DISTINTAS = 20
+ESCENARIOS = ["listado_anonimo", "listado_filtrado", "enlace_id", "edicion_admin", "exportacion"]
+FILTROS = [("El Rastro", 0), ("Regueros", 1), ("Todas", 2), ("Regueros", 0)]
+
+
+# --- Datos ---
+def fotos_sinteticas(n, semilla=0):
+    """JPEG de 1200x900 con degradados y bandas de colores aleatorios."""
+    from PIL import Image, ImageDraw
+    rnd = random.Random(semilla)
+    for _ in range(n):
+        img = Image.linear_gradient("L").resize((1200, 900)).convert("RGB")
+        dibujo = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rnd.randint(0, 1100), rnd.randint(0, 800)
+            dibujo.rectangle((x, y, x + rnd.randint(40, 400), y + rnd.randint(40, 300)),
+                             fill=tuple(rnd.randint(0, 255) for _ in range(3)))
+        salida = io.BytesIO()
+        img.save(salida, "JPEG", quality=85)
+        yield salida.getvalue()
+
+
+def sembrar(c, n, almacen_ruta, semilla=0):
+    """Esquema bench_app_<n> migrado, con n muebles y 1-10 imágenes cada uno."""
+    esquema = f"bench_app_{n}"
+    crear_esquema(c, esquema)
+    migrar(c)
+    sembrar_muebles(c, n, semilla)
+    almacen = AlmacenLocal(almacen_ruta)
+    imagenes = [registro_imagen(almacen, generar_variantes(datos))
+                for datos in fotos_sinteticas(FOTOS_DISTINTAS, semilla)]
+    c.execute("SELECT id FROM muebles ORDER BY id")
+    rnd = random.Random(semilla)
+    insertar_imagenes_muebles(c, {f["id"]: rnd.sample(imagenes, rnd.randint(1, 10))
+                                  for f in c.fetchall()})
+    c.execute("ANALYZE")
+    c.execute("SELECT MIN(id) AS id FROM muebles WHERE vendido = FALSE")
+    return esquema, c.fetchone()["id"]
+
+
+def config_postgres(esquema):
+    """Sección [postgres] para la app apuntando al esquema del benchmark."""
+    dsn = os.environ.get("BENCH_DSN")
+    cfg = dict(parse_dsn(dsn)) if dsn else dict(cargar_secrets()["postgres"])
+    cfg.setdefault("host", "")
+    cfg.setdefault("password", "")
+    cfg.setdefault("port", 5432)
+    cfg.setdefault("sslmode", "prefer")
+    cfg["options"] = f"-c search_path={esquema},public"
+    return cfg
+
+
+# --- Medición (en un proceso aparte por escenario) ---
+class Contadores:
+    """Bytes que el script manda al navegador: mensajes y ficheros de medios."""
+
+    def __init__(self):
+        from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        self.bytes = 0
+        contadores = self
+        encolar = ForwardMsgQueue.enqueue
+        cargar = MemoryMediaFileStorage.load_and_get_id
+
+        def enqueue(cola, msg):
+            contadores.bytes += msg.ByteSize()
+            return encolar(cola, msg)
+
+        def load_and_get_id(almacen, path_or_data, *args, **kwargs):
+            contadores.bytes += (len(path_or_data) if isinstance(path_or_data, bytes)
+                                 else os.path.getsize(path_or_data))
+            return cargar(almacen, path_or_data, *args, **kwargs)
+
+        ForwardMsgQueue.enqueue = enqueue
+        MemoryMediaFileStorage.load_and_get_id = load_and_get_id
+
+
+def consultas_hechas():
+    from instrumentacion import METRICAS
+    return sum(v for (nombre, _), v in METRICAS.contadores.items() if nombre == "muebles_consultas_total")
+
+
+def percentiles(valores):
+    valores = sorted(valores)
+    return {"p50": statistics.median(valores), "p95": valores[max(0, int(len(valores) * 0.95) - 1)]}
+
+
+def _selectbox(at, etiqueta):
+    return next(s for s in at.selectbox if s.label == etiqueta)
+
+
+def _boton(at, etiqueta):
+    return next(b for b in at.button if b.label == etiqueta)
+
+
+def pasos_escenario(escenario, at, mueble_id):
+    """Prepara la sesión y devuelve la función que hace un paso del escenario."""
+    if escenario == "enlace_id":
+        at.query_params["id"] = str(mueble_id)
+    if escenario in ("edicion_admin", "exportacion"):
+        at.session_state["es_admin"] = True
+
+    if escenario == "listado_filtrado":
+        def paso(i):
+            tienda, tipo = FILTROS[i % len(FILTROS)]
+            _selectbox(at, "Filtrar por tienda").set_value(tienda)
+            filtro_tipo = _selectbox(at, "Filtrar por tipo")
+            filtro_tipo.set_value(filtro_tipo.options[min(tipo, len(filtro_tipo.options) - 1)])
+            return [at.run]
+    elif escenario == "edicion_admin":
+        # Abrir el formulario de la primera tarjeta del listado y guardar un cambio de nombre
+        def paso(i):
+            editar = next(b for b in at.button if (b.key or "").startswith("editar_"))
+            id_editado = editar.key.removeprefix("editar_")
+
+            def guardar():
+                at.text_input(key=f"nombre_{id_editado}").set_value(f"Mueble editado {i}")
+                _boton(at, "💾 Guardar cambios").click().run()
+            return [editar.click().run, guardar]
+    else:
+        def paso(i):
+            return [at.run]
+    return paso
+
+
+def medir_exportacion(secrets, repeticiones):
+    from db import crear_pool
+    from exportar import FORMATOS, exportar_a_temporal
+    pool = crear_pool(secrets["postgres"])
+    resultado = {}
+    for formato in FORMATOS:
+        tiempos, tamano = [], 0
+        try:
+            for _ in range(max(1, repeticiones // 4)):
+                inicio = time.perf_counter()
+                with exportar_a_temporal(pool, formato, con_imagenes=True, con_ventas=True) as f:
+                    tamano = f.seek(0, os.SEEK_END)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+        except RuntimeError as e:
+            # Falta la dependencia opcional del formato (openpyxl, pyarrow)
+            resultado[formato] = {"error": str(e)}
+            continue
+        resultado[formato] = {"ms": percentiles(tiempos), "bytes": tamano}
+    pool.cerrar()
+    return resultado
+
+
+def medir_escenario(escenario, secrets, mueble_id, repeticiones):
+    from streamlit.testing.v1 import AppTest
+    contadores = Contadores()
+    at = AppTest.from_file(SCRIPT, default_timeout=120)
+    at.secrets.update(secrets)
+    paso = pasos_escenario(escenario, at, mueble_id)
+
+    inicio = time.perf_counter()
+    at.run()
+    primera_ms = (time.perf_counter() - inicio) * 1000
+    if at.exception:
+        raise RuntimeError(f"{escenario}: la app falló: {at.exception[0].message}")
+
+    tiempos, consultas, enviados = [], [], []
+    for i in range(repeticiones):
+        for rerun in paso(i):
+            antes_consultas, antes_bytes = consultas_hechas(), contadores.bytes
+            inicio = time.perf_counter()
+            rerun()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(consultas_hechas() - antes_consultas)
+            enviados.append(contadores.bytes - antes_bytes)
+        if at.exception:
+            raise RuntimeError(f"{escenario}: la app falló: {at.exception[0].message}")
+
+    resultado = {
+        "primera_ms": primera_ms,
+        "reruns": len(tiempos),
+        "ms": percentiles(tiempos),
+        "consultas_por_rerun": statistics.mean(consultas),
+        "bytes_por_rerun": statistics.mean(enviados),
+    }
+    if escenario == "exportacion":
+        resultado["ficheros"] = medir_exportacion(secrets, repeticiones)
+    # ru_maxrss va en KiB en Linux
+    resultado["rss_pico_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return resultado
+
+
+# --- Informe ---
+def metadatos():
+    import streamlit
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "fecha": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "streamlit": streamlit.__version__}
+
+
+def comparar(ruta_antes, ruta_despues):
+    with open(ruta_antes) as f:
+        antes = json.load(f)
+    with open(ruta_despues) as f:
+        despues = json.load(f)
+    print(f"{antes['meta']['commit']} -> {despues['meta']['commit']}")
+    for tamano, escenarios in despues["resultados"].items():
+        for escenario, r in escenarios.items():
+            previo = antes["resultados"].get(tamano, {}).get(escenario)
+            if not previo:
+                continue
+            print(f"{tamano:>6} {escenario:<17}"
+                  f" p50 {previo['ms']['p50']:8.1f} -> {r['ms']['p50']:8.1f} ms"
+                  f"  p95 {previo['ms']['p95']:8.1f} -> {r['ms']['p95']:8.1f} ms"
+                  f"  consultas {previo['consultas_por_rerun']:5.1f} -> {r['consultas_por_rerun']:5.1f}"
+                  f"  KB {previo['bytes_por_rerun'] / 1024:8.1f} -> {r['bytes_por_rerun'] / 1024:8.1f}"
+                  f"  RSS {previo['rss_pico_mb']:6.0f} -> {r['rss_pico_mb']:6.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de muebles_app.py con AppTest")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100, 1_000, 10_000])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=ESCENARIOS)
+    parser.add_argument("--salida", help="fichero JSON con los resultados")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"),
+                        help="comparar dos ficheros de resultados y salir")
+    parser.add_argument("--conservar", action="store_true", help="no borrar los esquemas sembrados")
+    args = parser.parse_args()
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    conn = conectar()
+    conn.autocommit = True
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix="bench_app_") as almacen_ruta, \
+            conn.cursor(cursor_factory=RealDictCursor) as c:
+        for n in args.tamanos:
+            esquema, mueble_id = sembrar(c, n, almacen_ruta)
+            secrets = {"postgres": config_postgres(esquema),
+                       "imagenes": {"backend": "local", "ruta": almacen_ruta}}
+            resultados[str(n)] = {}
+            for escenario in args.escenarios:
+                # spawn: un intérprete limpio, sin cachés ni memoria de escenarios anteriores
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as ejecutor:
+                    r = ejecutor.submit(medir_escenario, escenario, secrets, mueble_id,
+                                        args.repeticiones).result()
+                resultados[str(n)][escenario] = r
+                print(f"{n:>6} muebles  {escenario:<17} p50 {r['ms']['p50']:8.1f} ms"
+                      f"  p95 {r['ms']['p95']:8.1f} ms  {r['consultas_por_rerun']:5.1f} consultas"
+                      f"  {r['bytes_por_rerun'] / 1024:8.1f} KB  RSS {r['rss_pico_mb']:6.0f} MB")
+            if not args.conservar:
+                c.execute(f"DROP SCHEMA {esquema} CASCADE")
+    conn.close()
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"meta": metadatos(), "repeticiones": args.repeticiones,
+                       "resultados": resultados}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
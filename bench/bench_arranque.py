@@ -0,0 +1,176 @@
+# --- Arranque en frío de muebles_app.py ---
+# Uso: BENCH_DSN=postgresql://... python -m bench.bench_arranque [--tamano 1000]
+#          [--repeticiones 5] [--salida res.json]
+#      python -m bench.bench_arranque --comparar antes.json despues.json
+#
+# Cada repetición es un intérprete nuevo lanzado con -X importtime que ejecuta
+# la app una vez con AppTest sobre un catálogo sembrado como en bench_app.py.
+# El proceso hijo solo importa Streamlit antes de la app, así que lo que
+# importtime anota después de la marca es lo que cuesta importar la app.
+#
+# Por repetición:
+# - streamlit_ms: del lanzamiento del intérprete a tener Streamlit importado
+# - importacion_ms: importaciones durante la primera ejecución (la app y lo que
+#   Streamlit carga tarde), con los módulos que más pesan
+# - primera_tarjeta_ms: del lanzamiento a empezar a pintar la primera tarjeta
+#   (el tramo "tarjeta" del perfil de instrumentacion.py)
+# - primera_ejecucion_ms: la primera ejecución completa del script
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(RAIZ, "muebles_app.py")
+MARCA = "--- bench_arranque: ejecución de la app ---"
+MODULOS_MOSTRADOS = 12
+
+
+# --- Proceso hijo (lo mínimo importado antes de la app) ---
+def _primer_tramo(tramo, nombre):
+    if tramo.nombre == nombre:
+        return tramo
+    encontrados = [t for t in (_primer_tramo(h, nombre) for h in tramo.hijos) if t]
+    return min(encontrados, key=lambda t: t.inicio) if encontrados else None
+
+
+def hijo(secrets_json):
+    from streamlit.testing.v1 import AppTest
+    importado = time.time()
+    at = AppTest.from_file(SCRIPT, default_timeout=120)
+    at.secrets.update(json.loads(secrets_json))
+    print(MARCA, file=sys.stderr, flush=True)
+    inicio = time.perf_counter()
+    at.run()
+    fin = time.perf_counter()
+    if at.exception:
+        raise SystemExit(f"La app falló: {at.exception[0].message}")
+
+    # La app ya importó instrumentacion: aquí no cuesta nada
+    from instrumentacion import PERFILES
+    perfil = next(p for p in PERFILES if p.nombre == "app")
+    tarjeta = _primer_tramo(perfil.raiz, "tarjeta")
+    # perf_counter -> hora de reloj, para compararla con el lanzamiento del padre
+    desfase = time.time() - time.perf_counter()
+    print(json.dumps({
+        "importado": importado,
+        "inicio": inicio + desfase,
+        "fin": fin + desfase,
+        "tarjeta": tarjeta.inicio + desfase if tarjeta else None,
+    }))
+
+
+# --- Proceso padre ---
+def importaciones(stderr):
+    """{módulo: ms acumulados} de las importaciones de primer nivel tras la marca."""
+    lineas = stderr.split(MARCA, 1)[-1].splitlines()
+    modulos = {}
+    for linea in lineas:
+        if not linea.startswith("import time:"):
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        # Los submódulos van sangrados; cada nivel de primer nivel lleva un espacio
+        if not acumulado.strip().isdigit() or nombre.startswith("   "):
+            continue
+        modulos[nombre.strip()] = int(acumulado) / 1000
+    return modulos
+
+
+def medir_arranque(secrets):
+    lanzado = time.time()
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "bench.bench_arranque", "--hijo", json.dumps(secrets)],
+        cwd=RAIZ, capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr[-2000:])
+    marcas = json.loads(proceso.stdout.strip().splitlines()[-1])
+    modulos = importaciones(proceso.stderr)
+    return {
+        "streamlit_ms": (marcas["importado"] - lanzado) * 1000,
+        "importacion_ms": sum(modulos.values()),
+        "primera_tarjeta_ms": (marcas["tarjeta"] - lanzado) * 1000 if marcas["tarjeta"] else None,
+        "primera_ejecucion_ms": (marcas["fin"] - marcas["inicio"]) * 1000,
+        "modulos": modulos,
+    }
+
+
+def resumir(repeticiones):
+    resultado = {}
+    for campo in ("streamlit_ms", "importacion_ms", "primera_tarjeta_ms", "primera_ejecucion_ms"):
+        valores = [r[campo] for r in repeticiones if r[campo] is not None]
+        resultado[campo] = statistics.median(valores) if valores else None
+    nombres = {m for r in repeticiones for m in r["modulos"]}
+    medianas = {m: statistics.median(r["modulos"].get(m, 0) for r in repeticiones) for m in nombres}
+    resultado["modulos"] = dict(sorted(medianas.items(), key=lambda m: -m[1])[:MODULOS_MOSTRADOS])
+    return resultado
+
+
+def imprimir(r):
+    tarjeta = f"{r['primera_tarjeta_ms']:8.1f}" if r["primera_tarjeta_ms"] is not None else "     -  "
+    print(f"streamlit {r['streamlit_ms']:8.1f} ms  importación app {r['importacion_ms']:8.1f} ms"
+          f"  primera tarjeta {tarjeta} ms  primera ejecución {r['primera_ejecucion_ms']:8.1f} ms")
+    for modulo, ms in r["modulos"].items():
+        print(f"    {ms:8.1f} ms  {modulo}")
+
+
+def comparar(ruta_antes, ruta_despues):
+    with open(ruta_antes) as f:
+        antes = json.load(f)
+    with open(ruta_despues) as f:
+        despues = json.load(f)
+    print(f"{antes['meta']['commit']} -> {despues['meta']['commit']}")
+    for campo in ("streamlit_ms", "importacion_ms", "primera_tarjeta_ms", "primera_ejecucion_ms"):
+        previo, actual = antes["resultado"][campo], despues["resultado"][campo]
+        if previo is not None and actual is not None:
+            print(f"{campo:<22} {previo:8.1f} -> {actual:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranque en frío de muebles_app.py")
+    parser.add_argument("--tamano", type=int, default=1_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--salida", help="fichero JSON con los resultados")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"),
+                        help="comparar dos ficheros de resultados y salir")
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo:
+        hijo(args.hijo)
+        return
+    if args.comparar:
+        comparar(*args.comparar)
+        return
+
+    # Solo el padre siembra: el hijo no debe tener nada importado de antemano
+    from psycopg2.extras import RealDictCursor
+    from bench.bench_app import config_postgres, metadatos, sembrar
+    from bench.sintetico import conectar
+
+    conn = conectar()
+    conn.autocommit = True
+    with tempfile.TemporaryDirectory(prefix="bench_arranque_") as almacen_ruta, \
+            conn.cursor(cursor_factory=RealDictCursor) as c:
+        esquema, _ = sembrar(c, args.tamano, almacen_ruta)
+        secrets = {"postgres": config_postgres(esquema),
+                   "imagenes": {"backend": "local", "ruta": almacen_ruta}}
+        # La primera vez compila los .pyc: no cuenta
+        medir_arranque(secrets)
+        repeticiones = [medir_arranque(secrets) for _ in range(args.repeticiones)]
+        c.execute(f"DROP SCHEMA {esquema} CASCADE")
+    conn.close()
+
+    resultado = resumir(repeticiones)
+    imprimir(resultado)
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump({"meta": metadatos(), "tamano": args.tamano, "repeticiones": repeticiones,
+                       "resultado": resultado}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
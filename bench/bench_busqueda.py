@@ -0,0 +1,68 @@
+# --- Benchmark de "Buscar por nombre" a 10k y 100k filas ---
+# Uso: BENCH_DSN=postgresql://... python -m bench.bench_busqueda [--salida res.json]
+# Compara la búsqueda indexada (tsvector + trigramas) con el LIKE anterior.
+import argparse
+import json
+import statistics
+import time
+
+from bench.sintetico import conectar, crear_esquema, sembrar_muebles
+from repositorio import asegurar_busqueda, buscar_muebles
+
+TERMINOS = ["comoda", "Cómoda isabelina", "espjo", "marqueteria", "mesa de caoba", "bargueno"]
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {"p50_ms": statistics.median(tiempos),
+            "p95_ms": tiempos[max(0, int(len(tiempos) * 0.95) - 1)]}
+
+
+def like_anterior(c, termino):
+    c.execute("SELECT id FROM muebles WHERE vendido = FALSE AND LOWER(nombre) LIKE %s",
+              (f"%{termino.lower()}%",))
+    return c.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=30)
+    parser.add_argument("--salida")
+    args = parser.parse_args()
+
+    from psycopg2.extras import RealDictCursor
+    conn = conectar()
+    conn.autocommit = True
+    resultados = {}
+    with conn.cursor(cursor_factory=RealDictCursor) as c:
+        for n in args.filas:
+            esquema = f"bench_busqueda_{n}"
+            crear_esquema(c, esquema)
+            sembrar_muebles(c, n)
+            asegurar_busqueda(c)
+            c.execute("ANALYZE muebles")
+            resultados[n] = {}
+            for termino in TERMINOS:
+                indexada = medir(lambda: buscar_muebles(c, termino), args.repeticiones)
+                anterior = medir(lambda: like_anterior(c, termino), args.repeticiones)
+                aciertos = len(buscar_muebles(c, termino))
+                resultados[n][termino] = {"indexada": indexada, "like": anterior, "resultados": aciertos}
+                print(f"{n:>7} filas  {termino:<18} indexada p50 {indexada['p50_ms']:7.2f} ms"
+                      f"  p95 {indexada['p95_ms']:7.2f} ms  |  LIKE p50 {anterior['p50_ms']:7.2f} ms"
+                      f"  ({aciertos} resultados)")
+            c.execute(f"DROP SCHEMA {esquema} CASCADE")
+    conn.close()
+
+    if args.salida:
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# --- Catálogos sintéticos para benchmarks ---
+# Cada benchmark trabaja en un esquema propio para no tocar los datos reales.
+import os
+import random
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import cargar_secrets
+
+TIPOS = ["Mesa", "Consola", "Buffet", "Biblioteca", "Armario", "Cómoda",
+         "Columna", "Espejo", "Copa", "Asiento", "Otro artículo"]
+PIEZAS = ["Cómoda", "Mesa de comedor", "Consola", "Espejo", "Armario", "Biblioteca",
+          "Aparador", "Bargueño", "Velador", "Sillón", "Columna", "Copa", "Butaca"]
+ESTILOS = ["isabelina", "Luis XV", "Imperio", "modernista", "art déco", "castellana",
+           "de caoba", "de nogal", "lacada", "con marquetería", "alfonsina", "provenzal"]
+DETALLES = ["Tapa de mármol original.", "Herrajes de bronce dorado.", "Restaurada a muñequilla.",
+            "Cajones con llave.", "Patas torneadas.", "Luna biselada.", "Marquetería de limoncillo.",
+            "Procedente de una casa señorial de Segovia.", "Pequeñas faltas en la chapa."]
+
+ESQUEMA_BASE = """
+CREATE TABLE muebles (
+    id SERIAL PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    precio NUMERIC(10, 2) NOT NULL,
+    descripcion TEXT,
+    tienda TEXT NOT NULL,
+    vendido BOOLEAN NOT NULL DEFAULT FALSE,
+    tipo TEXT,
+    fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+    alto REAL, largo REAL, fondo REAL, diametro REAL, diametro_base REAL,
+    diametro_boca REAL, alto_respaldo REAL, alto_asiento REAL, ancho REAL
+);
+CREATE TABLE imagenes_muebles (
+    mueble_id INTEGER NOT NULL,
+    imagen_base64 TEXT,
+    es_principal BOOLEAN NOT NULL DEFAULT FALSE
+);
+"""
+
+
+def conectar():
+    """Conexión al Postgres de pruebas: BENCH_DSN o, si no, el de secrets.toml."""
+    dsn = os.environ.get("BENCH_DSN")
+    if dsn:
+        return psycopg2.connect(dsn)
+    cfg = cargar_secrets()["postgres"]
+    return psycopg2.connect(host=cfg["host"], dbname=cfg["dbname"], user=cfg["user"],
+                            password=cfg["password"], port=cfg["port"],
+                            sslmode=cfg.get("sslmode", "require"))
+
+
+def crear_esquema(c, nombre):
+    c.execute(f"DROP SCHEMA IF EXISTS {nombre} CASCADE")
+    c.execute(f"CREATE SCHEMA {nombre}")
+    c.execute(f"SET search_path = {nombre}, public")
+    c.execute(ESQUEMA_BASE)
+
+
+def muebles_sinteticos(n, semilla=0):
+    rnd = random.Random(semilla)
+    ahora = datetime.now()
+    for _ in range(n):
+        vendido = rnd.random() < 0.3
+        yield (
+            f"{rnd.choice(PIEZAS)} {rnd.choice(ESTILOS)}",
+            round(rnd.uniform(40, 4000), 0),
+            " ".join(rnd.sample(DETALLES, 3)),
+            rnd.choice(["El Rastro", "Regueros"]),
+            vendido,
+            rnd.choice(TIPOS),
+            ahora - timedelta(days=rnd.randint(0, 900)),
+            rnd.choice([None, rnd.randint(40, 220)]),
+            rnd.choice([None, rnd.randint(40, 250)]),
+            rnd.choice([None, rnd.randint(30, 80)]),
+        )
+
+
+def sembrar_muebles(c, n, semilla=0):
+    execute_values(c, """
+        INSERT INTO muebles (nombre, precio, descripcion, tienda, vendido, tipo, fecha,
+                             alto, largo, fondo)
+        VALUES %s
+    """, muebles_sinteticos(n, semilla), page_size=1000)
+
+
+def sembrar_imagenes(c, por_mueble=3):
+    """Filas de imagenes_muebles (sin blobs) para los muebles ya sembrados.
+
+    Necesita las columnas del almacén de imágenes (migración 2).
+    """
+    c.execute("""
+        INSERT INTO imagenes_muebles (mueble_id, clave, formato, es_principal)
+        SELECT m.id, md5(m.id || '-' || g), 'webp', g = 1
+        FROM muebles m, generate_series(1, %s) AS g
+    """, (por_mueble,))
@@ -0,0 +1,35 @@
+# --- Versiones del catálogo para invalidar las lecturas cacheadas ---
+# Cada lectura cacheada (listado, tipos, estadísticas, detalle de un mueble)
+# incluye en su clave la versión de su área. Las escrituras del admin suben
+# solo las versiones de las áreas que cambian, y las entradas afectadas dejan
+# de coincidir sin tocar el resto.
+import threading
+
+# Áreas que invalida cada tipo de escritura
+EFECTOS = {
+    "crear": ("listado", "tipos", "estadisticas", "ventas"),
+    "editar": ("listado", "estadisticas", "ventas"),
+    "eliminar": ("listado", "tipos", "estadisticas"),
+    "vendido": ("listado", "estadisticas", "ventas"),
+    "imagenes": ("listado",),
+}
+
+
+class VersionesCatalogo:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._areas = {}
+        self._muebles = {}
+
+    def version(self, area):
+        return self._areas.get(area, 0)
+
+    def version_mueble(self, mueble_id):
+        return self._muebles.get(mueble_id, 0)
+
+    def registrar_escritura(self, evento, mueble_id=None):
+        with self._lock:
+            for area in EFECTOS[evento]:
+                self._areas[area] = self._areas.get(area, 0) + 1
+            if mueble_id is not None:
+                self._muebles[mueble_id] = self._muebles.get(mueble_id, 0) + 1
@@ -0,0 +1,67 @@
+# --- Caché de imágenes listas para mostrar, compartida por todas las sesiones ---
+# Guarda los bytes ya preparados para st.image (JPEG/PNG, ver
+# procesado_imagenes.preparar_para_mostrar) bajo la clave de contenido de la
+# imagen. Con la caché caliente, un rerun no abre ninguna imagen con PIL ni
+# lee el almacén.
+#
+# El límite es de bytes, no de entradas: las miniaturas ocupan poco y las
+# fotos completas mucho. Al pasarse se expulsan las menos usadas (LRU).
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def clave_base64(imagen_base64):
+    # Filas antiguas sin almacén: la clave es el hash del propio base64
+    return "b64:" + hashlib.sha256(imagen_base64.encode()).hexdigest()
+
+
+class CacheImagenes:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._contadores = {"aciertos": 0, "fallos": 0, "expulsiones": 0, "invalidaciones": 0}
+
+    def obtener(self, clave, cargar):
+        """Los bytes de `clave`; si no están, los calcula con cargar() y los guarda."""
+        with self._lock:
+            datos = self._entradas.get(clave)
+            if datos is not None:
+                self._entradas.move_to_end(clave)
+                self._contadores["aciertos"] += 1
+                return datos
+            self._contadores["fallos"] += 1
+        # Fuera del lock: dos sesiones pueden preparar la misma imagen a la vez,
+        # pero ninguna espera a que otra decodifique la suya
+        datos = cargar()
+        if len(datos) > self.max_bytes:
+            return datos
+        with self._lock:
+            if clave not in self._entradas:
+                self._entradas[clave] = datos
+                self._bytes += len(datos)
+                while self._bytes > self.max_bytes:
+                    _, expulsada = self._entradas.popitem(last=False)
+                    self._bytes -= len(expulsada)
+                    self._contadores["expulsiones"] += 1
+        return datos
+
+    def invalidar(self, claves):
+        with self._lock:
+            for clave in claves:
+                datos = self._entradas.pop(clave, None)
+                if datos is not None:
+                    self._bytes -= len(datos)
+                    self._contadores["invalidaciones"] += 1
+
+    def metricas(self):
+        with self._lock:
+            m = dict(self._contadores)
+            m["entradas"] = len(self._entradas)
+            m["bytes"] = self._bytes
+        m["max_bytes"] = self.max_bytes
+        consultas = m["aciertos"] + m["fallos"]
+        m["tasa_aciertos"] = m["aciertos"] / consultas if consultas else 0.0
+        return m
@@ -0,0 +1,355 @@
+# --- Catálogo estático para visitantes anónimos ---
+# Genera en HTML/JSON lo mismo que muestra la pestaña "Disponibles": páginas
+# del listado (las más recientes primero), una ficha por mueble y un
+# catalogo.json. Son ficheros estáticos, así que quien solo mira el catálogo
+# no abre una sesión de Streamlit ni una conexión a la base de datos. La app
+# queda para el admin y la búsqueda.
+#
+# La generación es incremental: cada fichero guarda en .huellas.json la huella
+# de los datos con que se pintó (filas e imágenes de sus muebles), y solo se
+# vuelven a escribir los que cambian; las fichas de muebles vendidos o
+# borrados se eliminan.
+#
+# Las fotos se enlazan por URL al servidor de imágenes (url_publica en la
+# sección [imagenes] de secrets): sin él no se puede generar.
+#
+# La carpeta de salida es local (en la app, el disco del proceso de
+# Streamlit), así que por sí sola no la sirve nadie. Con `bucket` en la
+# sección [catalogo_estatico], tras cada generación se suben al bucket (S3 o
+# compatible, bajo `prefijo`) los ficheros reescritos y se borran los que
+# sobran; desde ahí se publica con lectura pública o detrás de un CDN. Los
+# enlaces entre páginas son relativos, así que funciona bajo cualquier ruta.
+# Las huellas nuevas solo se guardan cuando la subida termina bien: si falla a
+# medias, la siguiente generación vuelve a escribir y subir lo pendiente.
+#
+# Uso: python catalogo_estatico.py [--salida catalogo]
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+from html import escape
+
+from almacen_imagenes import elegir_variante
+from db import cargar_secrets, crear_pool
+from repositorio import imagenes_por_mueble, listar_todos_disponibles
+
+logger = logging.getLogger("catalogo_estatico")
+
+POR_PAGINA = 24
+ANCHO_MINIATURA = 400
+MAX_MUEBLES = 50_000
+URL_APP = "https://muebles-app-kntlnhehoh6c2o9bbvofft.streamlit.app/"
+# Subirla cuando cambien las plantillas para que se regenere todo
+VERSION_PLANTILLA = 3
+FICHERO_HUELLAS = ".huellas.json"
+TIPOS_CONTENIDO = {".html": "text/html; charset=utf-8", ".json": "application/json", ".css": "text/css"}
+# Las páginas cambian con el catálogo: caché corta, no inmutable como las fotos
+CACHE_PUBLICADO = "public, max-age=300"
+
+ETIQUETAS_MEDIDAS = {
+    "alto": "Alto", "largo": "Largo", "fondo": "Fondo", "diametro": "Diámetro",
+    "diametro_base": "Ø Base", "diametro_boca": "Ø Boca", "alto_respaldo": "Alto respaldo",
+    "alto_asiento": "Alto asiento", "ancho": "Ancho",
+}
+
+ESTILOS = """
+body { margin: 0; font-family: 'Playfair Display', Georgia, serif; background: #E6F0F8; color: #1a1a1a; }
+header { background: #023e8a; color: white; padding: 1rem; text-align: center; }
+header a { color: white; }
+main { max-width: 1100px; margin: 0 auto; padding: 1rem; }
+.rejilla { display: grid; grid-template-columns: repeat(auto-fill, minmax(240px, 1fr)); gap: 1rem; }
+.tarjeta { background: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 6px rgba(0,0,0,.15);
+           color: inherit; text-decoration: none; }
+.tarjeta img { width: 100%; aspect-ratio: 4 / 3; object-fit: cover; display: block; }
+.tarjeta div { padding: .6rem .8rem; }
+.precio { font-weight: bold; color: #023e8a; }
+.paginas { display: flex; justify-content: space-between; margin: 1.5rem 0; }
+.galeria img { max-width: 100%; border-radius: 8px; margin-bottom: .8rem; }
+.boton { display: inline-block; padding: .6rem 1.4rem; background: #023e8a; color: white;
+         border-radius: 8px; text-decoration: none; }
+"""
+
+
+# --- Plantillas ---
+def url_imagen(url_imagenes, fila, ancho=None, formato="webp"):
+    clave = elegir_variante(fila.get("variantes"), ancho, formato)
+    if not clave and formato == "webp":
+        clave = fila.get("clave")
+    return f"{url_imagenes}/img/{clave}" if clave else None
+
+
+def _picture(url_imagenes, fila, ancho=None):
+    avif = url_imagen(url_imagenes, fila, ancho, "avif")
+    fuente = f'<source type="image/avif" srcset="{avif}">' if avif else ""
+    return (f'<picture>{fuente}<img src="{url_imagen(url_imagenes, fila, ancho)}" '
+            f'loading="lazy" alt=""></picture>')
+
+
+def _medidas(mueble):
+    partes = [f"{nombre}: {mueble[campo]:g}cm" for campo, nombre in ETIQUETAS_MEDIDAS.items()
+              if mueble.get(campo) not in (None, 0)]
+    return " · ".join(partes) or "Sin medidas"
+
+
+def _documento(titulo, cuerpo):
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <meta name="theme-color" content="#E6F0F8">
+  <title>{escape(titulo)}</title>
+  <link rel="manifest" href="/muebles-app/manifest.json">
+  <link rel="stylesheet" href="catalogo.css">
+</head>
+<body>
+  <header><h1>Antigüedades El Jueves</h1>
+    <a href="index.html">Catálogo</a> · <a href="{URL_APP}">Buscar en la app</a></header>
+  <main>
+{cuerpo}
+  </main>
+</body>
+</html>
+"""
+
+
+def nombre_pagina(numero):
+    return "index.html" if numero == 1 else f"pagina-{numero}.html"
+
+
+def pagina_listado(muebles, imagenes, numero, total_paginas, url_imagenes):
+    tarjetas = []
+    for m in muebles:
+        principal = (imagenes.get(m["id"]) or [None])[0]
+        foto = _picture(url_imagenes, principal, ANCHO_MINIATURA) if principal else ""
+        tarjetas.append(
+            f'<a class="tarjeta" href="mueble-{m["id"]}.html">{foto}<div>'
+            f'<strong>{escape(m["nombre"])}</strong><br>{escape(m["tipo"] or "")} · {escape(m["tienda"])}<br>'
+            f'<span class="precio">{m["precio"]} €</span></div></a>'
+        )
+    anterior = (f'<a href="{nombre_pagina(numero - 1)}">← Anteriores</a>' if numero > 1 else "<span></span>")
+    siguiente = (f'<a href="{nombre_pagina(numero + 1)}">Más muebles →</a>' if numero < total_paginas else "")
+    cuerpo = (f'<div class="rejilla">{"".join(tarjetas) or "<p>No hay muebles disponibles</p>"}</div>\n'
+              f'<nav class="paginas">{anterior}<span>Página {numero} de {total_paginas}</span>{siguiente}</nav>')
+    return _documento(f"Catálogo · página {numero}", cuerpo)
+
+
+def ficha_mueble(mueble, imagenes, url_imagenes):
+    galeria = "".join(_picture(url_imagenes, fila) for fila in imagenes)
+    descripcion = f"<p>{escape(mueble['descripcion'])}</p>" if mueble["descripcion"] else ""
+    cuerpo = f"""<h2>{escape(mueble['nombre'])}</h2>
+<div class="galeria">{galeria}</div>
+<p><strong>Tipo:</strong> {escape(mueble['tipo'] or '')}<br>
+<strong>Precio:</strong> <span class="precio">{mueble['precio']} €</span><br>
+<strong>Tienda:</strong> {escape(mueble['tienda'])}<br>
+<strong>Medidas:</strong> {escape(_medidas(mueble))}</p>
+{descripcion}
+<a class="boton" href="{URL_APP}?id={mueble['id']}">Ver en la app</a>"""
+    return _documento(mueble["nombre"], cuerpo)
+
+
+def catalogo_json(muebles, imagenes, url_imagenes):
+    return json.dumps([{
+        "id": m["id"], "nombre": m["nombre"], "precio": float(m["precio"]), "tipo": m["tipo"],
+        "tienda": m["tienda"], "pagina": f"mueble-{m['id']}.html",
+        "miniatura": url_imagen(url_imagenes, imagenes[m["id"]][0], ANCHO_MINIATURA)
+        if imagenes.get(m["id"]) else None,
+    } for m in muebles], ensure_ascii=False)
+
+
+# --- Huellas para la generación incremental ---
+def _huella(*partes):
+    datos = json.dumps([VERSION_PLANTILLA, *partes], sort_keys=True, default=str)
+    return hashlib.sha1(datos.encode()).hexdigest()
+
+
+def cargar_huellas(salida):
+    try:
+        with open(os.path.join(salida, FICHERO_HUELLAS), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _guardar_huellas(salida, huellas):
+    _escribir(os.path.join(salida, FICHERO_HUELLAS), json.dumps(huellas))
+
+
+def _escribir(ruta, contenido):
+    # Escritura atómica: el servidor web nunca sirve una página a medias
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(tmp, ruta)
+
+
+# --- Generación ---
+def generar_catalogo(pool, salida, url_imagenes, publicacion=None):
+    """Regenera en `salida` los ficheros cuyos datos cambiaron y, con `publicacion`, los sube.
+
+    Devuelve {"escritos": [...], "borrados": [...], "ficheros": [...],
+    "publicados": {...} o None}; `ficheros` son todos los que forman el
+    catálogo actual.
+    """
+    if not url_imagenes:
+        raise RuntimeError("El catálogo estático necesita url_publica en [imagenes]")
+    url_imagenes = url_imagenes.rstrip("/")
+    with pool.cursor() as c:
+        muebles = listar_todos_disponibles(c, MAX_MUEBLES)
+        if muebles is None:
+            raise RuntimeError(f"Más de {MAX_MUEBLES} muebles disponibles: el catálogo estático no escala")
+        imagenes = imagenes_por_mueble(c, [m["id"] for m in muebles])
+    # Mismo orden que "Más reciente" en la app
+    muebles.reverse()
+
+    huellas_muebles = {m["id"]: _huella(m, imagenes.get(m["id"], [])) for m in muebles}
+    paginas = [muebles[i:i + POR_PAGINA] for i in range(0, len(muebles), POR_PAGINA)] or [[]]
+
+    # Cada fichero: (huella de sus datos, función que lo pinta)
+    ficheros = {
+        "catalogo.css": (_huella(ESTILOS), lambda: ESTILOS),
+        "catalogo.json": (_huella(list(huellas_muebles.items())),
+                          lambda: catalogo_json(muebles, imagenes, url_imagenes)),
+    }
+    for numero, grupo in enumerate(paginas, start=1):
+        ficheros[nombre_pagina(numero)] = (
+            _huella(numero, len(paginas), [huellas_muebles[m["id"]] for m in grupo]),
+            lambda g=grupo, n=numero: pagina_listado(g, imagenes, n, len(paginas), url_imagenes),
+        )
+    for m in muebles:
+        ficheros[f"mueble-{m['id']}.html"] = (
+            huellas_muebles[m["id"]],
+            lambda m=m: ficha_mueble(m, imagenes.get(m["id"], []), url_imagenes),
+        )
+
+    os.makedirs(salida, exist_ok=True)
+    anteriores = cargar_huellas(salida)
+    escritos = [nombre for nombre, (huella, _) in ficheros.items()
+                if anteriores.get(nombre) != huella or not os.path.exists(os.path.join(salida, nombre))]
+    # Antes de tocar nada se olvidan las huellas de lo que se va a reescribir:
+    # si la escritura o la subida fallan a medias, la próxima vez se repiten
+    _guardar_huellas(salida, {n: h for n, h in anteriores.items() if n not in escritos})
+    for nombre in escritos:
+        _escribir(os.path.join(salida, nombre), ficheros[nombre][1]())
+    borrados = sorted(set(anteriores) - set(ficheros))
+    for nombre in borrados:
+        try:
+            os.remove(os.path.join(salida, nombre))
+        except FileNotFoundError:
+            pass
+    cambios = {"escritos": escritos, "borrados": borrados, "ficheros": sorted(ficheros), "publicados": None}
+    if publicacion:
+        cambios["publicados"] = publicacion.publicar(salida, cambios)
+    _guardar_huellas(salida, {nombre: huella for nombre, (huella, _) in ficheros.items()})
+    return cambios
+
+
+# --- Publicación ---
+class PublicacionS3:
+    """Copia el catálogo generado a un bucket compatible con S3."""
+
+    def __init__(self, bucket, prefijo="catalogo/", **opciones_cliente):
+        import boto3
+        self.bucket = bucket
+        self.prefijo = prefijo
+        self.cliente = boto3.client("s3", **opciones_cliente)
+
+    def publicar(self, salida, cambios):
+        """Sube los ficheros reescritos y borra del bucket los que ya no son del catálogo.
+
+        Lo que sobra se decide listando el bucket y no con `cambios["borrados"]`:
+        si el disco local se perdió (p. ej. al reiniciar la app), las huellas
+        también, y las fichas de muebles vendidos entretanto seguirían publicadas.
+        """
+        for nombre in cambios["escritos"]:
+            with open(os.path.join(salida, nombre), "rb") as f:
+                self.cliente.put_object(
+                    Bucket=self.bucket, Key=self.prefijo + nombre, Body=f,
+                    ContentType=TIPOS_CONTENIDO[os.path.splitext(nombre)[1]],
+                    CacheControl=CACHE_PUBLICADO,
+                )
+        actuales = set(cambios["ficheros"])
+        sobrantes = [obj["Key"]
+                     for pagina in self.cliente.get_paginator("list_objects_v2").paginate(
+                         Bucket=self.bucket, Prefix=self.prefijo)
+                     for obj in pagina.get("Contents", [])
+                     if obj["Key"][len(self.prefijo):] not in actuales]
+        # delete_objects admite hasta 1000 claves por llamada
+        for i in range(0, len(sobrantes), 1000):
+            self.cliente.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": clave} for clave in sobrantes[i:i + 1000]], "Quiet": True})
+        return {"subidos": len(cambios["escritos"]), "borrados": len(sobrantes)}
+
+
+def crear_publicacion(cfg=None):
+    """PublicacionS3 según la sección [catalogo_estatico] de secrets, o None sin `bucket`."""
+    cfg = dict(cfg or {})
+    if not cfg.get("bucket"):
+        return None
+    opciones = {k: cfg[k] for k in ("endpoint_url", "region_name",
+                                     "aws_access_key_id", "aws_secret_access_key")
+                if cfg.get(k)}
+    return PublicacionS3(cfg["bucket"], cfg.get("prefijo", "catalogo/"), **opciones)
+
+
+class RegeneracionDiferida:
+    """Regenera el catálogo en un hilo aparte unos segundos después de la última escritura.
+
+    Varias escrituras seguidas del admin (p. ej. una importación) se agrupan
+    en una sola regeneración.
+    """
+
+    def __init__(self, pool, salida, url_imagenes, espera=5.0, publicacion=None):
+        self.pool = pool
+        self.salida = salida
+        self.url_imagenes = url_imagenes
+        self.espera = espera
+        self.publicacion = publicacion
+        self._lock = threading.Lock()
+        self._generando = threading.Lock()
+        self._temporizador = None
+
+    def programar(self):
+        with self._lock:
+            if self._temporizador:
+                self._temporizador.cancel()
+            self._temporizador = threading.Timer(self.espera, self._regenerar)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def _regenerar(self):
+        with self._generando:
+            try:
+                cambios = generar_catalogo(self.pool, self.salida, self.url_imagenes, self.publicacion)
+                logger.info("Catálogo estático: %d escritos, %d borrados",
+                            len(cambios["escritos"]), len(cambios["borrados"]))
+                if cambios["publicados"]:
+                    logger.info("Catálogo publicado: %(subidos)d subidos, %(borrados)d borrados",
+                                cambios["publicados"])
+            except Exception:
+                logger.exception("No se pudo regenerar el catálogo estático")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el catálogo estático de muebles disponibles")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--salida", default="catalogo", help="carpeta local de salida")
+    args = parser.parse_args()
+
+    secrets = cargar_secrets(args.secrets)
+    pool = crear_pool(secrets["postgres"])
+    publicacion = crear_publicacion(secrets.get("catalogo_estatico"))
+    cambios = generar_catalogo(pool, args.salida, (secrets.get("imagenes") or {}).get("url_publica", ""),
+                               publicacion)
+    pool.cerrar()
+    print(f"{len(cambios['escritos'])} ficheros escritos, {len(cambios['borrados'])} borrados en {args.salida}")
+    if publicacion:
+        publicados = cambios["publicados"]
+        print(f"Publicado en s3://{publicacion.bucket}/{publicacion.prefijo}: "
+              f"{publicados['subidos']} subidos, {publicados['borrados']} borrados")
+
+
+if __name__ == "__main__":
+    main()
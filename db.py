@@ -0,0 +1,189 @@
+# --- Pool de conexiones PostgreSQL compartido por todo el proceso ---
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger(__name__)
+
+
+class PoolAgotado(Exception):
+    """No se ha liberado ninguna conexión dentro del tiempo de espera."""
+
+
+class PoolConexiones:
+    """Pool thread-safe con comprobación de salud al sacar cada conexión.
+
+    Las conexiones que llevan más de `intervalo_ping` segundos sin usarse se
+    comprueban con un `SELECT 1` antes de entregarse; si el servidor las cerró
+    por inactividad se descartan y se abre una nueva.
+
+    psycopg2 solo guarda `minconn` conexiones libres y cierra las demás al
+    devolverlas, así que `minconn` debe cubrir la concurrencia habitual (los
+    reruns simultáneos): con menos, cada rerun de más abre y cierra la suya.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout_espera=10.0,
+                 intervalo_ping=30.0, **params_conexion):
+        params_conexion.setdefault("keepalives", 1)
+        params_conexion.setdefault("keepalives_idle", 30)
+        params_conexion.setdefault("keepalives_interval", 10)
+        params_conexion.setdefault("keepalives_count", 3)
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **params_conexion)
+        # psycopg2 lanza PoolError si se agota; el semáforo hace que se espere
+        self._huecos = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._ultimo_uso = {}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout_espera = timeout_espera
+        self.intervalo_ping = intervalo_ping
+        self._metricas = {
+            "checkouts": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+            "esperas_lentas": 0,
+            "timeouts": 0,
+            "reconexiones": 0,
+            "en_uso": 0,
+        }
+
+    # --- Checkout / devolución ---
+    def obtener(self):
+        inicio = time.perf_counter()
+        if not self._huecos.acquire(timeout=self.timeout_espera):
+            with self._lock:
+                self._metricas["timeouts"] += 1
+            raise PoolAgotado(f"Sin conexiones libres tras {self.timeout_espera}s")
+        try:
+            conn = self._sacar_sana()
+        except Exception:
+            self._huecos.release()
+            raise
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            m = self._metricas
+            m["checkouts"] += 1
+            m["espera_total_s"] += espera
+            m["espera_max_s"] = max(m["espera_max_s"], espera)
+            if espera > 0.1:
+                m["esperas_lentas"] += 1
+            m["en_uso"] += 1
+        return conn
+
+    def devolver(self, conn, cerrar=False):
+        try:
+            if not conn.closed and not cerrar:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            cerrar = cerrar or bool(conn.closed)
+            if cerrar:
+                self._ultimo_uso.pop(id(conn), None)
+            else:
+                self._ultimo_uso[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=cerrar)
+        except Exception:
+            logger.exception("Error devolviendo conexión al pool")
+            self._pool.putconn(conn, close=True)
+        finally:
+            with self._lock:
+                self._metricas["en_uso"] -= 1
+            self._huecos.release()
+
+    def _sacar_sana(self):
+        # Tras reiniciarse Postgres todas las libres están muertas: se descartan
+        # una a una. En el pool no caben más de maxconn, así que tras maxconn
+        # descartes getconn() ya no tiene libres y abre una conexión nueva.
+        for _ in range(self.maxconn):
+            conn = self._pool.getconn()
+            if self._esta_sana(conn):
+                return conn
+            self._ultimo_uso.pop(id(conn), None)
+            self._pool.putconn(conn, close=True)
+            with self._lock:
+                self._metricas["reconexiones"] += 1
+            logger.info("Conexión caída descartada")
+        return self._pool.getconn()
+
+    def _esta_sana(self, conn):
+        if conn.closed:
+            return False
+        ultimo = self._ultimo_uso.get(id(conn))
+        if ultimo is not None and time.monotonic() - ultimo < self.intervalo_ping:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    # --- Context managers ---
+    @contextmanager
+    def conexion(self):
+        conn = self.obtener()
+        roto = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            roto = True
+            raise
+        finally:
+            self.devolver(conn, cerrar=roto)
+
+    @contextmanager
+    def cursor(self, cursor_factory=RealDictCursor):
+        """Cursor en una transacción: commit al salir, rollback si hay error."""
+        with self.conexion() as conn:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                yield cur
+            conn.commit()
+
+    # --- Instrumentación ---
+    def metricas(self):
+        with self._lock:
+            m = dict(self._metricas)
+        m["espera_media_ms"] = (m["espera_total_s"] / m["checkouts"] * 1000) if m["checkouts"] else 0.0
+        m["minconn"] = self.minconn
+        m["maxconn"] = self.maxconn
+        return m
+
+    def cerrar(self):
+        self._pool.closeall()
+
+
+POOL_MIN = 4
+POOL_MAX = 10
+
+
+def crear_pool(cfg):
+    """Crea el pool a partir de la sección [postgres] de secrets o un dict equivalente."""
+    maxconn = int(cfg.get("pool_max", POOL_MAX))
+    return PoolConexiones(
+        minconn=min(int(cfg.get("pool_min", POOL_MIN)), maxconn),
+        maxconn=maxconn,
+        timeout_espera=float(cfg.get("pool_timeout", 10)),
+        intervalo_ping=float(cfg.get("pool_ping", 30)),
+        host=cfg["host"],
+        dbname=cfg["dbname"],
+        user=cfg["user"],
+        password=cfg["password"],
+        port=cfg["port"],
+        sslmode=cfg.get("sslmode", "require"),
+        # Opciones de sesión de libpq, p. ej. "-c search_path=..." en los benchmarks
+        options=cfg.get("options", ""),
+        connect_timeout=3,
+        client_encoding="UTF8",  # ✅ tildes
+    )
+
+
+def cargar_secrets(ruta=".streamlit/secrets.toml"):
+    """Lee el mismo secrets.toml que Streamlit para los scripts de línea de comandos."""
+    import tomllib
+    with open(ruta, "rb") as f:
+        return tomllib.load(f)
@@ -0,0 +1,151 @@
+# --- Exportación del inventario en streaming (CSV, XLSX, Parquet) ---
+# Al generar el fichero las filas nunca se cargan todas en memoria: CSV sale
+# de Postgres con COPY ... TO STDOUT directo a un fichero temporal, y
+# XLSX/Parquet leen con un cursor con nombre (del lado del servidor) por lotes.
+#
+# La descarga desde la app es otra cosa: st.download_button lee el fichero
+# terminado entero y lo guarda en memoria de Streamlit hasta que se descarga,
+# igual que el fichero de una exportación en cola al leerlo del almacén. Para
+# inventarios muy grandes, mejor exportar desde consola.
+#
+# Uso desde consola: python exportar.py --formato parquet --salida inventario.parquet
+import argparse
+import tempfile
+from datetime import datetime
+
+from db import cargar_secrets, crear_pool
+
+FORMATOS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+COLUMNAS_BASE = [
+    "id", "nombre", "precio", "descripcion", "tienda", "vendido", "tipo", "fecha",
+    "alto", "largo", "fondo", "diametro", "diametro_base", "diametro_boca",
+    "alto_respaldo", "alto_asiento", "ancho",
+]
+LOTE = 2000
+
+
+def consulta_exportacion(con_imagenes=False, con_ventas=False, url_imagenes=""):
+    """SQL y parámetros de la exportación, y los nombres de columna en orden."""
+    columnas = [f"m.{col}" for col in COLUMNAS_BASE]
+    nombres = list(COLUMNAS_BASE)
+    params = []
+    if con_ventas:
+        columnas.append("m.fecha_venta")
+        nombres.append("fecha_venta")
+    if con_imagenes:
+        # Una celda por mueble: URLs (o claves, sin servidor de imágenes)
+        # separadas por espacios, la principal primero
+        columnas.append("""(
+            SELECT string_agg(%s || i.clave, ' ' ORDER BY i.es_principal DESC)
+            FROM imagenes_muebles i
+            WHERE i.mueble_id = m.id AND i.clave IS NOT NULL
+        ) AS imagenes""")
+        nombres.append("imagenes")
+        params.append(f"{url_imagenes.rstrip('/')}/img/" if url_imagenes else "")
+    sql = f"SELECT {', '.join(columnas)} FROM muebles m ORDER BY m.id"
+    return sql, params, nombres
+
+
+def _lotes(conn, sql, params):
+    # Cursor con nombre: Postgres va entregando las filas de LOTE en LOTE
+    with conn.cursor(name="exportar_inventario") as cur:
+        cur.itersize = LOTE
+        cur.execute(sql, params)
+        while True:
+            filas = cur.fetchmany(LOTE)
+            if not filas:
+                break
+            yield filas
+
+
+def _csv(conn, sql, params, nombres, destino):
+    with conn.cursor() as cur:
+        consulta = cur.mogrify(sql, params).decode()
+        cur.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true)", destino)
+
+
+def _xlsx(conn, sql, params, nombres, destino):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("La exportación a XLSX necesita openpyxl (pip install openpyxl)")
+    # write_only: cada fila se vuelca al fichero según se añade
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Inventario")
+    hoja.append(nombres)
+    for filas in _lotes(conn, sql, params):
+        for fila in filas:
+            hoja.append([float(v) if nombre == "precio" and v is not None else v
+                         for nombre, v in zip(nombres, fila)])
+    libro.save(destino)
+
+
+def _parquet(conn, sql, params, nombres, destino):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación a Parquet necesita pyarrow (pip install pyarrow)")
+    tipos = {"id": pa.int32(), "precio": pa.decimal128(10, 2), "vendido": pa.bool_(),
+             "fecha": pa.timestamp("us"), "fecha_venta": pa.timestamp("us")}
+    medidas = set(COLUMNAS_BASE[COLUMNAS_BASE.index("alto"):])
+    esquema = pa.schema([(n, tipos.get(n, pa.float32() if n in medidas else pa.string()))
+                         for n in nombres])
+    # Un row group por lote: en memoria solo hay un lote a la vez
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for filas in _lotes(conn, sql, params):
+            columnas = list(zip(*filas))
+            escritor.write_batch(pa.record_batch(
+                [pa.array(col, type=campo.type) for col, campo in zip(columnas, esquema)],
+                schema=esquema))
+
+
+ESCRITORES = {"csv": _csv, "xlsx": _xlsx, "parquet": _parquet}
+
+
+def exportar_inventario(pool, formato, destino, con_imagenes=False, con_ventas=False, url_imagenes=""):
+    """Escribe el inventario en `destino` (fichero binario abierto o ruta)."""
+    sql, params, nombres = consulta_exportacion(con_imagenes, con_ventas, url_imagenes)
+    # Al devolver la conexión, el pool cierra la transacción de solo lectura
+    with pool.conexion() as conn:
+        ESCRITORES[formato](conn, sql, params, nombres, destino)
+
+
+def exportar_a_temporal(pool, formato, **opciones):
+    """Exporta a un fichero temporal en disco y lo devuelve abierto al principio."""
+    fichero = tempfile.TemporaryFile()
+    exportar_inventario(pool, formato, fichero, **opciones)
+    fichero.seek(0)
+    return fichero
+
+
+def nombre_fichero(formato):
+    return f"inventario_{datetime.now():%Y%m%d_%H%M}.{formato}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta el inventario de muebles")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--formato", choices=list(FORMATOS), default="csv")
+    parser.add_argument("--salida", help="fichero de destino (por defecto inventario_<fecha>.<formato>)")
+    parser.add_argument("--imagenes", action="store_true", help="incluir las URLs de las imágenes")
+    parser.add_argument("--ventas", action="store_true", help="incluir la fecha de venta")
+    args = parser.parse_args()
+
+    secrets = cargar_secrets(args.secrets)
+    pool = crear_pool(secrets["postgres"])
+    salida = args.salida or nombre_fichero(args.formato)
+    with open(salida, "wb") as destino:
+        exportar_inventario(pool, args.formato, destino, con_imagenes=args.imagenes, con_ventas=args.ventas,
+                            url_imagenes=(secrets.get("imagenes") or {}).get("url_publica", ""))
+    pool.cerrar()
+    print(f"Inventario exportado a {salida}")
+
+
+if __name__ == "__main__":
+    main()
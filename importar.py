@@ -0,0 +1,297 @@
+# --- Importación masiva: CSV de muebles + carpeta o zip de fotos ---
+# Uso: python importar.py lote.csv fotos.zip [--simular]
+#
+# 1. Se valida todo antes de escribir nada: campos, números y que cada foto
+#    citada exista en la carpeta o el zip.
+# 2. Las fotos se procesan en paralelo y se guardan en el almacén. Cada foto
+#    terminada se anota en un fichero de estado, así que si el proceso se
+#    corta, al relanzarlo con el mismo CSV continúa por donde iba.
+# 3. Todos los muebles (INSERT ... RETURNING id) y sus imágenes se insertan
+#    en una sola transacción.
+#
+# El CSV lleva una fila por mueble con las columnas de CAMPOS_ALTA (sin las
+# fechas) y una columna "imagenes" con los nombres de fichero separados por
+# "|" (o por "," o ";" si van entre comillas).
+import argparse
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+from almacen_imagenes import crear_almacen, registro_imagen
+from db import cargar_secrets, crear_pool
+from procesado_imagenes import generar_variantes
+from migraciones import migrar
+from repositorio import insertar_imagenes_muebles, insertar_muebles, tipos_en_catalogo
+
+logger = logging.getLogger("importar")
+
+TIENDAS = ("El Rastro", "Regueros")
+MEDIDAS = ("alto", "largo", "fondo", "diametro", "diametro_base", "diametro_boca",
+           "alto_respaldo", "alto_asiento", "ancho")
+EXTENSIONES_FOTO = (".jpg", ".jpeg", ".png", ".webp")
+# Punto de miles sin coma decimal: "1.200", "12.500.000"
+MILES = re.compile(r"-?\d{1,3}(\.\d{3})+")
+DIRECTORIO_ESTADO = "importaciones"
+
+
+# --- Origen de las fotos ---
+class FuenteFotos:
+    """Fotos de una carpeta o de un zip, localizadas por nombre de fichero.
+
+    Los nombres se comparan sin ruta y sin distinguir mayúsculas.
+    """
+
+    def __init__(self, origen):
+        if isinstance(origen, str) and os.path.isdir(origen):
+            self._zip = None
+            self._rutas = {
+                nombre.lower(): os.path.join(raiz, nombre)
+                for raiz, _, ficheros in os.walk(origen) for nombre in ficheros
+                if nombre.lower().endswith(EXTENSIONES_FOTO)
+            }
+        else:
+            # Ruta a un .zip o fichero subido (cualquier objeto tipo fichero)
+            self._zip = zipfile.ZipFile(origen)
+            self._rutas = {
+                os.path.basename(info.filename).lower(): info.filename
+                for info in self._zip.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(EXTENSIONES_FOTO)
+            }
+
+    def __contains__(self, nombre):
+        return nombre.lower() in self._rutas
+
+    def tamano(self, nombre):
+        ruta = self._rutas[nombre.lower()]
+        return self._zip.getinfo(ruta).file_size if self._zip else os.path.getsize(ruta)
+
+    def leer(self, nombre):
+        ruta = self._rutas[nombre.lower()]
+        if self._zip:
+            return self._zip.read(ruta)
+        with open(ruta, "rb") as f:
+            return f.read()
+
+
+# --- Validación ---
+def _numero(texto):
+    # Acepta la coma decimal de las hojas de cálculo en español
+    texto = (texto or "").strip().replace("€", "").replace(" ", "")
+    if not texto:
+        return None
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    elif MILES.fullmatch(texto):
+        # "1.200" son 1200 €, no 1,2 €: punto seguido de tres cifras = miles
+        texto = texto.replace(".", "")
+    return float(texto)
+
+
+def _booleano(texto):
+    return (texto or "").strip().lower() in ("1", "si", "sí", "s", "true", "x", "vendido")
+
+
+def leer_csv(datos):
+    """Filas del CSV como dicts; detecta si el separador es "," o ";"."""
+    texto = datos.decode("utf-8-sig") if isinstance(datos, bytes) else datos
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=",;")
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.DictReader(io.StringIO(texto), dialect=dialecto)
+    # Las celdas sobrantes de una fila (clave None) se descartan
+    return [{k.strip().lower(): (v or "").strip() for k, v in fila.items() if k is not None}
+            for fila in lector]
+
+
+def validar(filas, fotos, tipos_conocidos=()):
+    """Comprueba todas las filas sin escribir nada.
+
+    Devuelve (muebles, errores, avisos): los muebles listos para
+    insertar_muebles() con su lista de fotos, y los problemas por línea.
+    """
+    muebles, errores, avisos = [], [], []
+    tipos_nuevos = set()
+    ahora = datetime.now()
+    for linea, fila in enumerate(filas, start=2):
+        problemas = []
+        nombre = fila.get("nombre", "")
+        if not nombre:
+            problemas.append("falta el nombre")
+        try:
+            precio = _numero(fila.get("precio"))
+            if not precio or precio <= 0:
+                problemas.append("el precio debe ser mayor que 0")
+        except ValueError:
+            problemas.append(f"precio no numérico: {fila.get('precio')!r}")
+            precio = None
+        tienda = fila.get("tienda") or TIENDAS[0]
+        if tienda not in TIENDAS:
+            problemas.append(f"tienda desconocida: {tienda!r}")
+        medidas = {}
+        for campo in MEDIDAS:
+            try:
+                medidas[campo] = _numero(fila.get(campo)) or None
+            except ValueError:
+                problemas.append(f"{campo} no numérico: {fila.get(campo)!r}")
+        imagenes = [n.strip() for n in re.split(r"[|;,]", fila.get("imagenes", "")) if n.strip()]
+        if not imagenes:
+            problemas.append("sin imágenes")
+        for n in imagenes:
+            if n not in fotos:
+                problemas.append(f"no se encuentra la foto {n!r}")
+
+        if problemas:
+            errores.append(f"Línea {linea}: " + "; ".join(problemas))
+            continue
+        tipo = fila.get("tipo") or "Otro artículo"
+        if tipos_conocidos and tipo not in tipos_conocidos:
+            tipos_nuevos.add(tipo)
+        vendido = _booleano(fila.get("vendido"))
+        muebles.append({
+            "nombre": nombre, "precio": precio, "descripcion": fila.get("descripcion") or None,
+            "tienda": tienda, "vendido": vendido, "tipo": tipo,
+            "fecha": ahora, "fecha_venta": ahora if vendido else None,
+            **medidas, "imagenes": imagenes,
+        })
+    if tipos_nuevos:
+        avisos.append("Tipos nuevos en el catálogo: " + ", ".join(sorted(tipos_nuevos)))
+    return muebles, errores, avisos
+
+
+def informe_simulacion(muebles, errores, avisos, fotos, estado):
+    """Resumen de lo que haría la importación (modo --simular)."""
+    nombres = {n for m in muebles for n in m["imagenes"]}
+    return {
+        "muebles": len(muebles),
+        "fotos": len(nombres),
+        "fotos_ya_procesadas": len(nombres & set(estado["imagenes"])),
+        "megabytes_fotos": round(sum(fotos.tamano(n) for n in nombres) / 1e6, 1),
+        "ya_importado": estado["ids"] is not None,
+        "errores": errores,
+        "avisos": avisos,
+    }
+
+
+# --- Estado para poder retomar ---
+def huella(datos_csv):
+    return hashlib.sha256(datos_csv).hexdigest()
+
+
+def ruta_estado(huella_csv, directorio=DIRECTORIO_ESTADO):
+    return os.path.join(directorio, f"{huella_csv[:16]}.json")
+
+
+def cargar_estado(ruta):
+    """Estado guardado de una importación: fotos ya procesadas e ids si terminó."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"imagenes": {}, "ids": None}
+
+
+def guardar_estado(ruta, estado):
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    tmp = f"{ruta}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+    os.replace(tmp, ruta)
+
+
+# --- Importación ---
+def procesar_fotos(nombres, fotos, almacen, ejecutor, estado, ruta, progreso=None, en_vuelo=8):
+    """Genera y guarda las variantes de las fotos que aún no estén en `estado`.
+
+    Como mucho `en_vuelo` fotos leídas a la vez, para no cargar el zip entero
+    en memoria. `progreso(hechas, total)` se llama tras cada foto.
+    """
+    pendientes = [n for n in dict.fromkeys(nombres) if n not in estado["imagenes"]]
+    total, hechas = len(pendientes), 0
+    futuros = {}
+    while pendientes or futuros:
+        while pendientes and len(futuros) < en_vuelo:
+            nombre = pendientes.pop(0)
+            futuros[ejecutor.submit(generar_variantes, fotos.leer(nombre))] = nombre
+        listos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+        for futuro in listos:
+            nombre = futuros.pop(futuro)
+            estado["imagenes"][nombre] = registro_imagen(almacen, futuro.result())
+            guardar_estado(ruta, estado)
+            hechas += 1
+            if progreso:
+                progreso(hechas, total)
+
+
+def insertar_lote(pool, muebles, estado, ruta):
+    """Inserta todos los muebles y sus imágenes en una transacción; devuelve los ids."""
+    with pool.cursor() as c:
+        ids = insertar_muebles(c, muebles)
+        insertar_imagenes_muebles(c, {
+            mueble_id: [estado["imagenes"][n] for n in mueble["imagenes"]]
+            for mueble_id, mueble in zip(ids, muebles)
+        })
+    estado["ids"] = ids
+    guardar_estado(ruta, estado)
+    return ids
+
+
+def importar(pool, almacen, ejecutor, muebles, fotos, estado, ruta, progreso=None):
+    """Procesa las fotos pendientes e inserta el lote. Si ya se importó, no repite."""
+    if estado["ids"] is not None:
+        return estado["ids"]
+    procesar_fotos([n for m in muebles for n in m["imagenes"]], fotos, almacen, ejecutor,
+                   estado, ruta, progreso)
+    return insertar_lote(pool, muebles, estado, ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un lote de muebles desde CSV y fotos")
+    parser.add_argument("csv", help="CSV con una fila por mueble")
+    parser.add_argument("fotos", help="carpeta o .zip con las fotos citadas en el CSV")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--simular", action="store_true", help="solo validar y mostrar el informe")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    with open(args.csv, "rb") as f:
+        datos_csv = f.read()
+    secrets = cargar_secrets(args.secrets)
+    pool = crear_pool(secrets["postgres"])
+    with pool.cursor() as c:
+        migrar(c)
+        tipos = tipos_en_catalogo(c)
+
+    fotos = FuenteFotos(args.fotos)
+    muebles, errores, avisos = validar(leer_csv(datos_csv), fotos, tipos)
+    ruta = ruta_estado(huella(datos_csv))
+    estado = cargar_estado(ruta)
+
+    if not muebles and not errores:
+        raise SystemExit("El CSV no tiene muebles")
+    if args.simular or errores:
+        print(json.dumps(informe_simulacion(muebles, errores, avisos, fotos, estado),
+                         indent=2, ensure_ascii=False))
+        if errores:
+            raise SystemExit("Hay errores: corrige el CSV antes de importar")
+        return
+    for aviso in avisos:
+        logger.warning(aviso)
+
+    with ProcessPoolExecutor(max_workers=args.procesos) as ejecutor:
+        ids = importar(pool, crear_almacen(secrets.get("imagenes")), ejecutor, muebles, fotos,
+                       estado, ruta, progreso=lambda h, t: logger.info("Fotos procesadas: %d/%d", h, t))
+    pool.cerrar()
+    logger.info("Importados %d muebles (ids %d-%d)", len(ids), min(ids), max(ids))
+
+
+if __name__ == "__main__":
+    main()
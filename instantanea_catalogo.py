@@ -0,0 +1,78 @@
+# --- Instantánea en memoria de los muebles en venta ---
+# Con unos miles de muebles, los metadatos del listado caben de sobra en
+# memoria. La instantánea se carga una vez por versión del listado (dos
+# consultas) y después cada combinación de tienda, tipo y orden se resuelve
+# en el proceso, sin ir a Postgres:
+#
+# - los órdenes por id y por (precio, id) están precalculados como
+#   permutaciones de las posiciones;
+# - cada tienda y cada tipo tiene un bitmap (un int de Python, bit i = fila i)
+#   y los filtros se combinan con un AND;
+# - el resultado de cada combinación se memoriza, así que al cambiar de
+#   filtro y volver, o al pedir más páginas, solo se corta la lista.
+#
+# Las filas e imágenes son compartidas entre sesiones: no se modifican.
+from array import array
+
+from repositorio import ORDENES
+
+
+class InstantaneaCatalogo:
+    def __init__(self, filas, imagenes):
+        # `filas` llega ordenado por id ascendente: la posición es el orden por id
+        self.filas = filas
+        self.imagenes = imagenes
+        self.ids = array("q", (f["id"] for f in filas))
+        self.precios = array("d", (float(f["precio"]) for f in filas))
+        n = len(filas)
+        self.orden_id = array("l", range(n))
+        self.orden_precio = array("l", sorted(range(n), key=lambda i: (self.precios[i], self.ids[i])))
+        self.todos = (1 << n) - 1
+        self.por_tienda = self._bitmaps("tienda")
+        self.por_tipo = self._bitmaps("tipo")
+        self._resultados = {}
+
+    def _bitmaps(self, campo):
+        bits = {}
+        for i, fila in enumerate(self.filas):
+            bits[fila[campo]] = bits.get(fila[campo], 0) | (1 << i)
+        return bits
+
+    def __len__(self):
+        return len(self.filas)
+
+    def posiciones(self, tienda=None, tipo=None, orden="Más reciente"):
+        """Posiciones de las filas que cumplen el filtro, en el orden pedido."""
+        clave = (tienda, tipo, orden)
+        resultado = self._resultados.get(clave)
+        if resultado is not None:
+            return resultado
+        mascara = self.todos
+        if tienda:
+            mascara &= self.por_tienda.get(tienda, 0)
+        if tipo:
+            mascara &= self.por_tipo.get(tipo, 0)
+        columna, sentido = ORDENES[orden]
+        permutacion = self.orden_id if columna == "id" else self.orden_precio
+        if sentido == "DESC":
+            permutacion = reversed(permutacion)
+        if mascara == self.todos:
+            resultado = tuple(permutacion)
+        else:
+            # bin() da los bits de mayor a menor; invertido, el carácter i es el bit i
+            bits = bin(mascara)[:1:-1]
+            resultado = tuple(i for i in permutacion if i < len(bits) and bits[i] == "1")
+        self._resultados[clave] = resultado
+        return resultado
+
+    def listado(self, tienda=None, tipo=None, orden="Más reciente", limite=None):
+        """(filas, imágenes principales, completo) de las `limite` primeras filas."""
+        posiciones = self.posiciones(tienda, tipo, orden)
+        if limite is not None:
+            completo = len(posiciones) <= limite
+            posiciones = posiciones[:limite]
+        else:
+            completo = True
+        filas = [self.filas[i] for i in posiciones]
+        imagenes = {f["id"]: self.imagenes[f["id"]] for f in filas if f["id"] in self.imagenes}
+        return filas, imagenes, completo
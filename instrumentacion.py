@@ -0,0 +1,404 @@
+# --- Instrumentación: tiempos por rerun, consultas y métricas Prometheus ---
+# Cada ejecución del script (o de un fragmento) abre un perfil con un árbol de
+# tramos medidos: secciones de la página, cursores, consultas e imágenes. Al
+# terminar, el perfil se guarda en memoria para el panel del admin, se escribe
+# una línea JSON en el log "instrumentacion" y se acumula en las métricas.
+#
+# Las métricas se pueden volcar en formato texto de Prometheus a un fichero
+# para el textfile collector de node_exporter ([instrumentacion] en secrets).
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from psycopg2.extras import RealDictCursor
+
+logger = logging.getLogger("instrumentacion")
+
+PERFILES_GUARDADOS = 50
+CUBETAS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class Tramo:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        self.hijos = []
+
+    def cerrar(self):
+        if self.duracion is None:
+            self.duracion = time.perf_counter() - self.inicio
+
+    def como_dict(self, origen):
+        return {"nombre": self.nombre,
+                "inicio_ms": (self.inicio - origen) * 1000,
+                "ms": (self.duracion or 0) * 1000,
+                "hijos": [h.como_dict(origen) for h in self.hijos]}
+
+
+class Perfil:
+    """Tramos y consultas de una ejecución (rerun completo o de un fragmento)."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.fecha = time.time()
+        self.raiz = Tramo(nombre)
+        self.pila = [self.raiz]
+        self.seccion = None
+        self.consultas = []
+
+    def abrir(self, nombre):
+        tramo = Tramo(nombre)
+        self.pila[-1].hijos.append(tramo)
+        self.pila.append(tramo)
+        return tramo
+
+    def cerrar(self, tramo):
+        tramo.cerrar()
+        if tramo not in self.pila:
+            return
+        # Si algo se quedó abierto dentro (por una excepción), se cierra con él
+        while len(self.pila) > 1:
+            abierto = self.pila.pop()
+            abierto.cerrar()
+            if abierto is tramo:
+                break
+
+    def resumen(self):
+        return {
+            "nombre": self.nombre,
+            "fecha": self.fecha,
+            "ms": (self.raiz.duracion or 0) * 1000,
+            "consultas": len(self.consultas),
+            "ms_sql": sum(q["ms"] for q in self.consultas),
+            "filas": sum(q["filas"] for q in self.consultas),
+            "bytes": sum(q["bytes"] for q in self.consultas),
+        }
+
+
+# --- Métricas acumuladas del proceso ---
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+
+    def sumar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, segundos, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            h = self.histogramas.setdefault(clave, {"cubetas": [0] * len(CUBETAS_S), "suma": 0.0, "total": 0})
+            for i, limite in enumerate(CUBETAS_S):
+                if segundos <= limite:
+                    h["cubetas"][i] += 1
+            h["suma"] += segundos
+            h["total"] += 1
+
+    def prometheus(self):
+        """Exposición en formato texto de Prometheus."""
+        def etiquetas(pares, extra=()):
+            pares = list(pares) + list(extra)
+            if not pares:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+        with self._lock:
+            contadores = dict(self.contadores)
+            histogramas = {k: dict(v, cubetas=list(v["cubetas"])) for k, v in self.histogramas.items()}
+        lineas = []
+        for nombre in sorted({n for n, _ in contadores}):
+            lineas.append(f"# TYPE {nombre} counter")
+            for (n, pares), valor in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{nombre}{etiquetas(pares)} {valor}")
+        for nombre in sorted({n for n, _ in histogramas}):
+            lineas.append(f"# TYPE {nombre} histogram")
+            for (n, pares), h in sorted(histogramas.items()):
+                if n != nombre:
+                    continue
+                for limite, cuenta in zip(CUBETAS_S, h["cubetas"]):
+                    lineas.append(f"{nombre}_bucket{etiquetas(pares, [('le', limite)])} {cuenta}")
+                lineas.append(f"{nombre}_bucket{etiquetas(pares, [('le', '+Inf')])} {h['total']}")
+                lineas.append(f"{nombre}_sum{etiquetas(pares)} {h['suma']:.6f}")
+                lineas.append(f"{nombre}_count{etiquetas(pares)} {h['total']}")
+        return "\n".join(lineas) + "\n"
+
+
+METRICAS = Metricas()
+PERFILES = deque(maxlen=PERFILES_GUARDADOS)
+_PERFILES_LOCK = threading.Lock()
+_local = threading.local()
+_fichero_prometheus = {"ruta": None, "intervalo": 15.0, "ultimo": 0.0}
+
+
+def configurar(cfg=None):
+    """Lee la sección [instrumentacion] de secrets (todo opcional)."""
+    cfg = dict(cfg or {})
+    _fichero_prometheus["ruta"] = cfg.get("fichero_prometheus")
+    _fichero_prometheus["intervalo"] = float(cfg.get("intervalo_prometheus", 15))
+    if cfg.get("log_json") and not logger.handlers:
+        # Una línea JSON por ejecución, aparte del log de Streamlit
+        manejador = logging.StreamHandler()
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(manejador)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def _volcar_prometheus():
+    ruta = _fichero_prometheus["ruta"]
+    ahora = time.monotonic()
+    if not ruta or ahora - _fichero_prometheus["ultimo"] < _fichero_prometheus["intervalo"]:
+        return
+    _fichero_prometheus["ultimo"] = ahora
+    # Escritura atómica: el collector nunca lee un fichero a medias
+    tmp = f"{ruta}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            f.write(METRICAS.prometheus())
+        os.replace(tmp, ruta)
+    except OSError:
+        logger.exception("No se pudieron volcar las métricas en %s", ruta)
+
+
+# --- Perfil de la ejecución actual (uno por hilo de script) ---
+def perfil_actual():
+    return getattr(_local, "perfil", None)
+
+
+def iniciar_perfil(nombre="app"):
+    if perfil_actual() is not None:
+        # Un st.rerun() o st.stop() cortó la ejecución anterior sin cerrarla
+        terminar_perfil(interrumpido=True)
+    _local.perfil = Perfil(nombre)
+    return _local.perfil
+
+
+def terminar_perfil(interrumpido=False):
+    perfil = perfil_actual()
+    if perfil is None:
+        return None
+    _local.perfil = None
+    if interrumpido:
+        # Acaba donde acabó lo último medido, no al empezar la siguiente ejecución
+        perfil.raiz.duracion = max(_fin(perfil.raiz), perfil.raiz.inicio) - perfil.raiz.inicio
+    perfil.cerrar(perfil.raiz)
+    resumen = perfil.resumen()
+    resumen["interrumpido"] = interrumpido
+    with _PERFILES_LOCK:
+        PERFILES.append(perfil)
+    METRICAS.sumar("muebles_reruns_total", ejecucion=perfil.nombre)
+    METRICAS.observar("muebles_rerun_segundos", perfil.raiz.duracion, ejecucion=perfil.nombre)
+    logger.info(json.dumps({"evento": "rerun", **resumen}))
+    _volcar_prometheus()
+    return perfil
+
+
+def _fin(tramo):
+    propio = tramo.inicio + tramo.duracion if tramo.duracion is not None else tramo.inicio
+    return max([propio] + [_fin(h) for h in tramo.hijos])
+
+
+def seccion(nombre):
+    """Pasa a la siguiente sección de primer nivel del script (cierra la anterior)."""
+    perfil = perfil_actual()
+    if perfil is None:
+        return
+    if perfil.seccion is not None:
+        perfil.cerrar(perfil.seccion)
+    perfil.seccion = perfil.abrir(nombre)
+
+
+@contextmanager
+def tramo(nombre):
+    perfil = perfil_actual()
+    if perfil is None:
+        yield
+        return
+    t = perfil.abrir(nombre)
+    try:
+        yield
+    finally:
+        perfil.cerrar(t)
+        METRICAS.observar("muebles_tramo_segundos", t.duracion, tramo=nombre)
+
+
+def medido(nombre):
+    """Decorador: mide cada llamada como un tramo del perfil actual."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            with tramo(nombre):
+                return funcion(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+def perfilado(nombre):
+    """Como medido(), pero si no hay perfil abierto (rerun de un fragmento)
+    abre uno propio "fragmento:<nombre>" y lo cierra al salir."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            if perfil_actual() is not None:
+                with tramo(nombre):
+                    return funcion(*args, **kwargs)
+            iniciar_perfil(f"fragmento:{nombre}")
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                terminar_perfil()
+        return envoltorio
+    return decorador
+
+
+def accion(nombre):
+    """Decorador para las acciones que escriben. Los callbacks corren antes del
+    script, sin perfil abierto, así que abren uno propio "accion:<nombre>" y
+    sus sentencias SQL quedan medidas una a una; llamadas desde el script son
+    un tramo más del perfil en curso."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            if perfil_actual() is not None:
+                with tramo(f"accion:{nombre}"):
+                    return funcion(*args, **kwargs)
+            iniciar_perfil(f"accion:{nombre}")
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                terminar_perfil()
+        return envoltorio
+    return decorador
+
+
+# --- Cursor medido ---
+def normalizar_sql(sql):
+    """Forma canónica de una consulta para agrupar: sin literales ni espacios extra."""
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    sql = re.sub(r"'(?:[^']|'')*'", "?", str(sql))
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _tamano(filas):
+    # Aproximación barata de lo recibido: longitud de textos y binarios, 8 bytes el resto
+    total = 0
+    for fila in filas:
+        for valor in (fila.values() if isinstance(fila, dict) else fila):
+            total += len(valor) if isinstance(valor, (str, bytes, memoryview)) else 8
+    return total
+
+
+class CursorMedido(RealDictCursor):
+    """RealDictCursor que anota cada consulta (tiempo, filas, bytes) en el perfil actual."""
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._anotar(query, time.perf_counter() - inicio)
+
+    def _anotar(self, query, segundos):
+        self._consulta = {"sql": normalizar_sql(query), "ms": segundos * 1000,
+                          "filas": max(self.rowcount, 0) if self.description else 0, "bytes": 0}
+        METRICAS.sumar("muebles_consultas_total")
+        METRICAS.observar("muebles_consulta_segundos", segundos)
+        perfil = perfil_actual()
+        if perfil is not None:
+            perfil.consultas.append(self._consulta)
+            hoja = Tramo("SQL " + self._consulta["sql"][:60])
+            hoja.inicio -= segundos
+            hoja.duracion = segundos
+            perfil.pila[-1].hijos.append(hoja)
+
+    def _leidas(self, filas):
+        consulta = getattr(self, "_consulta", None)
+        tamano = _tamano(filas)
+        METRICAS.sumar("muebles_filas_leidas_total", len(filas))
+        METRICAS.sumar("muebles_bytes_leidos_total", tamano)
+        if consulta is not None:
+            consulta["bytes"] += tamano
+
+    def fetchone(self):
+        fila = super().fetchone()
+        if fila is not None:
+            self._leidas([fila])
+        return fila
+
+    def fetchmany(self, size=None):
+        filas = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._leidas(filas)
+        return filas
+
+    def fetchall(self):
+        filas = super().fetchall()
+        self._leidas(filas)
+        return filas
+
+
+# --- Datos para el panel del admin ---
+def perfiles_recientes(n=10):
+    with _PERFILES_LOCK:
+        return list(PERFILES)[-n:][::-1]
+
+
+def consultas_lentas(n=10):
+    """Consultas agrupadas por forma, de mayor a menor tiempo máximo."""
+    grupos = {}
+    with _PERFILES_LOCK:
+        perfiles = list(PERFILES)
+    for perfil in perfiles:
+        for q in perfil.consultas:
+            g = grupos.setdefault(q["sql"], {"sql": q["sql"], "veces": 0, "ms_total": 0.0,
+                                             "ms_max": 0.0, "filas": 0, "bytes": 0})
+            g["veces"] += 1
+            g["ms_total"] += q["ms"]
+            g["ms_max"] = max(g["ms_max"], q["ms"])
+            g["filas"] += q["filas"]
+            g["bytes"] += q["bytes"]
+    return sorted(grupos.values(), key=lambda g: g["ms_max"], reverse=True)[:n]
+
+
+def html_llamas(perfil, ancho_min_pct=0.5):
+    """Gráfico de llamas (icicle) del perfil en HTML: una fila por nivel,
+    cada tramo con ancho proporcional a su duración."""
+    origen = perfil.raiz.inicio
+    total = perfil.raiz.duracion or 1e-9
+    bloques = []
+
+    def pintar(tramo, nivel):
+        izquierda = (tramo.inicio - origen) / total * 100
+        ancho = (tramo.duracion or 0) / total * 100
+        if ancho < ancho_min_pct:
+            return
+        color = "#e76f51" if tramo.nombre.startswith("SQL") else ("#2a9d8f" if nivel else "#264653")
+        etiqueta = f"{tramo.nombre} · {(tramo.duracion or 0) * 1000:.1f} ms"
+        etiqueta = etiqueta.replace("&", "&amp;").replace("<", "&lt;").replace('"', "&quot;")
+        bloques.append(
+            f'<div title="{etiqueta}" style="position:absolute;left:{izquierda:.2f}%;width:{ancho:.2f}%;'
+            f'top:{nivel * 22}px;height:20px;background:{color};color:white;font-size:11px;'
+            f'overflow:hidden;white-space:nowrap;border-right:1px solid white;padding-left:2px">'
+            f'{etiqueta}</div>')
+        for hijo in tramo.hijos:
+            pintar(hijo, nivel + 1)
+
+    pintar(perfil.raiz, 0)
+
+    def profundidad(t):
+        return 1 + max((profundidad(h) for h in t.hijos), default=0)
+
+    alto = profundidad(perfil.raiz) * 22
+    return f'<div style="position:relative;width:100%;height:{alto}px">{"".join(bloques)}</div>'
@@ -0,0 +1,309 @@
+# --- Migraciones de esquema versionadas ---
+# Cada migración se aplica una sola vez y queda anotada en schema_migrations.
+# Se ejecutan al arrancar la app (preparar_esquema) o desde consola:
+#     python migraciones.py            aplica las pendientes
+#     python migraciones.py --estado   lista aplicadas y pendientes
+# Para cambiar el esquema se añade una función nueva al final de MIGRACIONES;
+# las ya publicadas no se editan. Por eso cada migración lleva su propio SQL
+# y no llama a funciones de repositorio.py o ventas.py, que siguen cambiando.
+import argparse
+
+from db import cargar_secrets, crear_pool
+
+# Clave del advisory lock: varias réplicas arrancando a la vez migran de una en una
+BLOQUEO_MIGRACIONES = 7_441_001
+
+
+def m001_esquema_base(c):
+    # Las tablas originales, tal como las creó la primera versión de la app
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS muebles (
+            id SERIAL PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            precio NUMERIC(10, 2) NOT NULL,
+            descripcion TEXT,
+            tienda TEXT NOT NULL,
+            vendido BOOLEAN NOT NULL DEFAULT FALSE,
+            tipo TEXT,
+            fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+            alto REAL, largo REAL, fondo REAL, diametro REAL, diametro_base REAL,
+            diametro_boca REAL, alto_respaldo REAL, alto_asiento REAL, ancho REAL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS imagenes_muebles (
+            mueble_id INTEGER NOT NULL,
+            imagen_base64 TEXT,
+            es_principal BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    """)
+
+
+def m002_almacen_imagenes_y_ventas(c):
+    # Columnas del almacén de imágenes; imagen_base64 queda solo para filas antiguas
+    c.execute("""
+        ALTER TABLE imagenes_muebles
+            ADD COLUMN IF NOT EXISTS clave TEXT,
+            ADD COLUMN IF NOT EXISTS formato TEXT,
+            ADD COLUMN IF NOT EXISTS ancho INTEGER,
+            ADD COLUMN IF NOT EXISTS alto INTEGER,
+            ADD COLUMN IF NOT EXISTS bytes INTEGER,
+            ADD COLUMN IF NOT EXISTS variantes JSONB,
+            ALTER COLUMN imagen_base64 DROP NOT NULL
+    """)
+    # Fecha en que se marcó como vendido (NULL mientras está a la venta)
+    c.execute("ALTER TABLE muebles ADD COLUMN IF NOT EXISTS fecha_venta TIMESTAMP")
+
+
+def m003_busqueda(c):
+    c.execute("CREATE EXTENSION IF NOT EXISTS unaccent SCHEMA public")
+    c.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public")
+    # unaccent() no es IMMUTABLE y no se puede indexar; este envoltorio sí
+    c.execute("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+    c.execute("""
+        ALTER TABLE muebles ADD COLUMN IF NOT EXISTS busqueda tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('spanish', f_unaccent(coalesce(nombre, ''))), 'A') ||
+            setweight(to_tsvector('spanish', f_unaccent(coalesce(descripcion, ''))), 'B')
+        ) STORED
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS muebles_busqueda_idx ON muebles USING gin (busqueda)")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS muebles_nombre_trgm_idx
+        ON muebles USING gin (f_unaccent(lower(nombre)) gin_trgm_ops)
+    """)
+
+
+def m004_id_imagen(c):
+    # Clave sustituta para borrar o marcar una imagen sin comparar el base64
+    c.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema()
+                  AND table_name = 'imagenes_muebles' AND column_name = 'id'
+            ) THEN
+                ALTER TABLE imagenes_muebles
+                    ADD COLUMN id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY;
+            END IF;
+        END $$
+    """)
+
+
+def m005_fk_imagenes(c):
+    # Imágenes huérfanas de muebles ya borrados: impedirían crear la FK
+    c.execute("""
+        DELETE FROM imagenes_muebles i
+        WHERE NOT EXISTS (SELECT 1 FROM muebles m WHERE m.id = i.mueble_id)
+    """)
+    c.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint
+                WHERE conname = 'imagenes_muebles_mueble_id_fkey'
+                  AND conrelid = 'imagenes_muebles'::regclass
+            ) THEN
+                ALTER TABLE imagenes_muebles
+                    ADD CONSTRAINT imagenes_muebles_mueble_id_fkey
+                    FOREIGN KEY (mueble_id) REFERENCES muebles (id) ON DELETE CASCADE;
+            END IF;
+        END $$
+    """)
+
+
+def m006_indices_listados(c):
+    # El listado siempre filtra vendido = FALSE: índices parciales con el
+    # mismo predicado, terminados en id para el orden y el cursor de páginas
+    for sql in (
+        "CREATE INDEX IF NOT EXISTS muebles_disponibles_id_idx ON muebles (id) WHERE vendido = FALSE",
+        "CREATE INDEX IF NOT EXISTS muebles_disponibles_tienda_idx ON muebles (tienda, id) WHERE vendido = FALSE",
+        "CREATE INDEX IF NOT EXISTS muebles_disponibles_tipo_idx ON muebles (tipo, id) WHERE vendido = FALSE",
+        "CREATE INDEX IF NOT EXISTS muebles_disponibles_precio_idx ON muebles (precio, id) WHERE vendido = FALSE",
+        "CREATE INDEX IF NOT EXISTS muebles_vendidos_fecha_idx ON muebles (fecha DESC) WHERE vendido = TRUE",
+        # Galerías: DISTINCT ON (mueble_id) ... ORDER BY mueble_id, es_principal DESC
+        "CREATE INDEX IF NOT EXISTS imagenes_muebles_mueble_idx ON imagenes_muebles (mueble_id, es_principal DESC)",
+        # Comprobación de referencias antes de borrar un blob del almacén
+        "CREATE INDEX IF NOT EXISTS imagenes_muebles_clave_idx ON imagenes_muebles (clave)",
+    ):
+        c.execute(sql)
+
+
+def m007_trabajos(c):
+    # Cola de trabajos en segundo plano (trabajos.py); los workers la leen con SKIP LOCKED
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS trabajos (
+            id BIGSERIAL PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            datos JSONB NOT NULL DEFAULT '{}',
+            estado TEXT NOT NULL DEFAULT 'pendiente'
+                CHECK (estado IN ('pendiente', 'en_curso', 'hecho', 'fallido')),
+            intentos INTEGER NOT NULL DEFAULT 0,
+            max_intentos INTEGER NOT NULL DEFAULT 5,
+            disponible_en TIMESTAMP NOT NULL DEFAULT NOW(),
+            creado TIMESTAMP NOT NULL DEFAULT NOW(),
+            empezado TIMESTAMP,
+            terminado TIMESTAMP,
+            error TEXT,
+            resultado JSONB
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS trabajos_pendientes_idx
+        ON trabajos (disponible_en, id) WHERE estado = 'pendiente'
+    """)
+
+
+def m008_ventas(c):
+    # Eventos de venta y sus resúmenes diarios (ventas.py). Sin FK: el
+    # historial se conserva aunque el mueble se borre
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS eventos_venta (
+            id BIGSERIAL PRIMARY KEY,
+            mueble_id INTEGER NOT NULL,
+            evento TEXT NOT NULL CHECK (evento IN ('venta', 'anulacion')),
+            signo SMALLINT NOT NULL,
+            fecha TIMESTAMP NOT NULL DEFAULT NOW(),
+            dia DATE NOT NULL,
+            tienda TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            banda SMALLINT NOT NULL,
+            precio NUMERIC(10, 2) NOT NULL,
+            dias_en_tienda REAL NOT NULL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS eventos_venta_mueble_idx ON eventos_venta (mueble_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS eventos_venta_dia_idx ON eventos_venta (dia)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ventas_diarias (
+            dia DATE NOT NULL,
+            tienda TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            banda SMALLINT NOT NULL,
+            ventas INTEGER NOT NULL,
+            ingresos NUMERIC(12, 2) NOT NULL,
+            dias_en_tienda REAL NOT NULL,
+            PRIMARY KEY (dia, tienda, tipo, banda)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS stock_diario (
+            dia DATE NOT NULL,
+            tienda TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            banda SMALLINT NOT NULL,
+            en_venta INTEGER NOT NULL,
+            PRIMARY KEY (dia, tienda, tipo, banda)
+        )
+    """)
+    # Historial: solo las ventas con fecha (las anteriores a m002 no la tienen),
+    # con las bandas de precio de entonces: 100, 300, 1000 y 3000 €
+    c.execute("""
+        WITH evento AS (
+            INSERT INTO eventos_venta (mueble_id, evento, signo, dia, tienda, tipo, banda, precio, dias_en_tienda)
+            SELECT id, 'venta', 1, fecha_venta::date, tienda, COALESCE(tipo, ''),
+                   width_bucket(precio, '{100, 300, 1000, 3000}'::numeric[]), precio,
+                   GREATEST(EXTRACT(EPOCH FROM fecha_venta - fecha) / 86400, 0)
+            FROM muebles
+            WHERE vendido = TRUE AND fecha_venta IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM eventos_venta e WHERE e.mueble_id = muebles.id)
+            RETURNING dia, tienda, tipo, banda, signo, precio, dias_en_tienda
+        )
+        INSERT INTO ventas_diarias (dia, tienda, tipo, banda, ventas, ingresos, dias_en_tienda)
+        SELECT dia, tienda, tipo, banda, SUM(signo), SUM(signo * precio), SUM(signo * dias_en_tienda)
+        FROM evento
+        GROUP BY dia, tienda, tipo, banda
+        ON CONFLICT (dia, tienda, tipo, banda) DO UPDATE SET
+            ventas = ventas_diarias.ventas + EXCLUDED.ventas,
+            ingresos = ventas_diarias.ingresos + EXCLUDED.ingresos,
+            dias_en_tienda = ventas_diarias.dias_en_tienda + EXCLUDED.dias_en_tienda
+    """)
+    # Primera foto de existencias en venta
+    c.execute("""
+        INSERT INTO stock_diario (dia, tienda, tipo, banda, en_venta)
+        SELECT CURRENT_DATE, tienda, COALESCE(tipo, ''),
+               width_bucket(precio, '{100, 300, 1000, 3000}'::numeric[]), COUNT(*)
+        FROM muebles
+        WHERE vendido = FALSE
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT DO NOTHING
+    """)
+
+def m009_latido_trabajos(c):
+    # Los workers lo refrescan mientras ejecutan: un trabajo lento pero vivo no
+    # se confunde con el de un worker caído
+    c.execute("ALTER TABLE trabajos ADD COLUMN IF NOT EXISTS latido TIMESTAMP")
+
+
+MIGRACIONES = [
+    (1, m001_esquema_base),
+    (2, m002_almacen_imagenes_y_ventas),
+    (3, m003_busqueda),
+    (4, m004_id_imagen),
+    (5, m005_fk_imagenes),
+    (6, m006_indices_listados),
+    (7, m007_trabajos),
+    (8, m008_ventas),
+    (9, m009_latido_trabajos),
+]
+
+
+def _asegurar_tabla_versiones(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            nombre TEXT NOT NULL,
+            aplicada TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def versiones_aplicadas(c):
+    _asegurar_tabla_versiones(c)
+    c.execute("SELECT version FROM schema_migrations")
+    return {f["version"] for f in c.fetchall()}
+
+
+def migrar(c):
+    """Aplica en orden las migraciones pendientes; devuelve sus nombres.
+
+    Todo va en la transacción del cursor: si una falla no queda ninguna a medias.
+    """
+    c.execute("SELECT pg_advisory_xact_lock(%s)", (BLOQUEO_MIGRACIONES,))
+    aplicadas = versiones_aplicadas(c)
+    nuevas = []
+    for version, funcion in MIGRACIONES:
+        if version in aplicadas:
+            continue
+        funcion(c)
+        c.execute("INSERT INTO schema_migrations (version, nombre) VALUES (%s, %s)",
+                  (version, funcion.__name__))
+        nuevas.append(funcion.__name__)
+    return nuevas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aplica las migraciones de esquema pendientes")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--estado", action="store_true", help="solo mostrar aplicadas y pendientes")
+    args = parser.parse_args()
+
+    pool = crear_pool(cargar_secrets(args.secrets)["postgres"])
+    with pool.cursor() as c:
+        if args.estado:
+            aplicadas = versiones_aplicadas(c)
+            for version, funcion in MIGRACIONES:
+                print(f"{version:>3} {funcion.__name__:<35} {'aplicada' if version in aplicadas else 'pendiente'}")
+        else:
+            nuevas = migrar(c)
+            print("\n".join(f"Aplicada {n}" for n in nuevas) or "El esquema ya está al día")
+    pool.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# --- Migración única: imagen_base64 -> almacén de imágenes por SHA-256 ---
+# Uso: python migrar_imagenes.py [--lote 50] [--conservar-base64]
+# Procesa las filas por lotes (un commit por lote), así que se puede
+# interrumpir y relanzar: solo toca las filas que aún no tienen clave. Una
+# imagen corrupta se registra en el log y se salta; no tumba su lote.
+# Después genera las variantes (160/400/800 px) de las filas que no las tengan.
+import argparse
+import base64
+import logging
+from io import BytesIO
+
+from PIL import Image
+from psycopg2.extras import Json
+
+from almacen_imagenes import crear_almacen, guardar_variantes
+from db import cargar_secrets, crear_pool
+from procesado_imagenes import generar_variantes
+from migraciones import migrar
+
+logger = logging.getLogger("migrar_imagenes")
+
+
+def _decodificar(fila, datos_de):
+    """Variantes de una imagen, o None si sus bytes no son una imagen válida.
+
+    Solo se captura el decodificado: un fallo del almacén sí debe abortar el lote.
+    """
+    try:
+        datos = datos_de(fila)
+        img = Image.open(BytesIO(datos))
+        return datos, img, generar_variantes(datos)
+    except Exception as e:
+        logger.warning("Imagen %s omitida, no se puede decodificar: %s", fila["ctid"], e)
+        return None
+
+
+def migrar_lote(pool, almacen, lote, conservar_base64, omitidas):
+    """Migra hasta `lote` filas. Las corruptas se apuntan en `omitidas` (ctid) y se saltan."""
+    with pool.cursor() as c:
+        c.execute("""
+            SELECT ctid, imagen_base64
+            FROM imagenes_muebles
+            WHERE clave IS NULL AND imagen_base64 IS NOT NULL AND ctid <> ALL(%s::tid[])
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (list(omitidas), lote))
+        filas = c.fetchall()
+        for fila in filas:
+            decodificada = _decodificar(fila, lambda f: base64.b64decode(f["imagen_base64"]))
+            if decodificada is None:
+                omitidas.add(fila["ctid"])
+                continue
+            datos, img, variantes = decodificada
+            clave = almacen.guardar(datos)
+            indice = guardar_variantes(almacen, variantes)
+            c.execute("""
+                UPDATE imagenes_muebles
+                SET clave = %s, formato = %s, ancho = %s, alto = %s, bytes = %s, variantes = %s,
+                    imagen_base64 = CASE WHEN %s THEN imagen_base64 END
+                WHERE ctid = %s
+            """, (clave, (img.format or "webp").lower(), img.width, img.height, len(datos),
+                  Json(indice), conservar_base64, fila["ctid"]))
+    return len(filas)
+
+
+def variantes_lote(pool, almacen, lote, omitidas):
+    with pool.cursor() as c:
+        c.execute("""
+            SELECT ctid, clave
+            FROM imagenes_muebles
+            WHERE clave IS NOT NULL AND variantes IS NULL AND ctid <> ALL(%s::tid[])
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (list(omitidas), lote))
+        filas = c.fetchall()
+        for fila in filas:
+            # Leer del almacén queda fuera de _decodificar: si falla, se aborta
+            datos = almacen.leer(fila["clave"])
+            decodificada = _decodificar(fila, lambda f: datos)
+            if decodificada is None:
+                omitidas.add(fila["ctid"])
+                continue
+            indice = guardar_variantes(almacen, decodificada[2])
+            c.execute("UPDATE imagenes_muebles SET variantes = %s WHERE ctid = %s",
+                      (Json(indice), fila["ctid"]))
+    return len(filas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mueve las imágenes base64 al almacén de imágenes")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--lote", type=int, default=50, help="filas por transacción")
+    parser.add_argument("--conservar-base64", action="store_true",
+                        help="no vaciar imagen_base64 tras copiar (para poder volver atrás)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    secrets = cargar_secrets(args.secrets)
+    pool = crear_pool(secrets["postgres"])
+    almacen = crear_almacen(secrets.get("imagenes"))
+
+    with pool.cursor() as c:
+        migrar(c)
+
+    # Las filas que no se pueden decodificar se saltan en esta ejecución (y se
+    # vuelven a intentar en la siguiente) sin bloquear el resto del lote
+    omitidas = set()
+    total = 0
+    while True:
+        n = migrar_lote(pool, almacen, args.lote, args.conservar_base64, omitidas)
+        if not n:
+            break
+        total += n
+        logger.info("Migradas %d imágenes", total - len(omitidas))
+    logger.info("Migración terminada: %d imágenes, %d omitidas", total - len(omitidas), len(omitidas))
+
+    omitidas_variantes = set()
+    total = 0
+    while True:
+        n = variantes_lote(pool, almacen, args.lote, omitidas_variantes)
+        if not n:
+            break
+        total += n
+        logger.info("Variantes generadas para %d imágenes", total - len(omitidas_variantes))
+    if omitidas_variantes:
+        logger.warning("Sin variantes por imagen corrupta: %d", len(omitidas_variantes))
+    pool.cerrar()
+
+
+if __name__ == "__main__":
+    main()
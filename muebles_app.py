@@ -1,19 +1,39 @@
 # --- Configuraciones iniciales ---
+# Las importaciones pesadas que solo usa el admin (PIL, multiprocessing, la
+# importación masiva, la cola de trabajos) se hacen dentro de las funciones
+# que las necesitan: el primer listado de un visitante no las paga.
 import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
-from dotenv import load_dotenv
-load_dotenv()
 import streamlit as st
 import hashlib
 import urllib.parse
-from PIL import Image
-from datetime import datetime
-from io import BytesIO
+from datetime import date, datetime, timedelta
 import base64
+from io import BytesIO
 import logging
+from contextlib import contextmanager
 from streamlit import config as _config
-from streamlit.components.v1 import html
+from db import crear_pool
+from migraciones import migrar
+from instrumentacion import (
+    CursorMedido, METRICAS, configurar as configurar_instrumentacion, consultas_lentas, html_llamas,
+    accion, iniciar_perfil, medido, perfilado, perfiles_recientes, seccion, terminar_perfil, tramo,
+)
+from exportar import FORMATOS as FORMATOS_EXPORTACION, exportar_a_temporal, nombre_fichero
+from cache_catalogo import VersionesCatalogo
+from instantanea_catalogo import InstantaneaCatalogo
+from almacen_imagenes import crear_almacen, elegir_variante, registro_imagen
+from cache_imagenes import CacheImagenes, clave_base64
+from ventas import mantenimiento_diario, resumen_ventas
+from repositorio import (
+    ORDENES, listar_disponibles, listar_todos_disponibles, principales_disponibles,
+    listar_vendidos, buscar_muebles, obtener_mueble,
+    imagenes_por_mueble, principales_por_mueble, tipos_en_catalogo, estadisticas,
+    crear_mueble, actualizar_mueble, marcar_vendido, borrar_mueble, borrar_imagen,
+    marcar_imagen_principal, claves_de_fila, borrar_blobs_sin_referencias,
+)
+
+iniciar_perfil("app")
 
 st.set_page_config(
     page_title="Inventario El Jueves",
@@ -29,203 +49,13 @@ if 'admin_token' not in st.session_state:
 if 'editar_mueble_id' not in st.session_state:
     st.session_state.editar_mueble_id = None
 
-# --- Estilos CSS unificados y globales ---
-# --- Estilos CSS separados ---
-css_global = """
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@700&display=swap');
-
-html, body, [class*="css"] {
-    font-family: 'Playfair Display', serif !important;
-}
-
-.header-title,
-.muebles-disponibles-title,
-.vendidos-title {
-    font-family: 'Playfair Display', serif !important;
-    font-weight: 700 !important;
-    letter-spacing: 1px !important;
-    color: #023e8a !important;
-    margin-bottom: 1rem !important;
-    text-align: center !important;
-}
-
-.stApp > header { display: none; }
-.stApp { background-color: #E6F0F8; padding: 2rem; }
-
-.custom-header {
-    display: flex;
-    flex-direction: column;
-    align-items: center;
-    background-color: white;
-    padding: 1rem 1.5rem;
-    border-radius: 8px;
-    box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-    margin-bottom: 2rem;
-    text-align: center;
-}
-
-.header-logo {
-    margin-bottom: 0.5rem;
-}
-
-.header-logo img {
-    height: 60px;
-    width: auto;
-}
-
-.header-title {
-    font-size: 1.8rem !important;
-    margin: 0 !important;
-}
-
-/* En pantallas pequeñas (móvil) */
-@media (max-width: 768px) {
-    .header-title {
-        font-size: 1.4rem !important;
-        line-height: 1.4;
-    }
-
-    .header-logo img {
-        height: 50px;
-    }
-
-    .custom-header {
-        padding: 1rem;
-    }
-}
-
-
-.mueble-image-container {
-    position: relative;
-    width: 100%;
-    margin-bottom: 10px;
-}
-
-.mueble-image {
-    width: 100%;
-    border-radius: 8px;
-    cursor: pointer;
-    transition: transform 0.2s;
-    object-fit: cover;
-    max-height: 300px;
-}
-
-.expand-button {
-    position: absolute;
-    bottom: 15px;
-    right: 15px;
-    background-color: rgba(0,0,0,0.7);
-    color: white;
-    border: none;
-    border-radius: 50%;
-    width: 40px;
-    height: 40px;
-    font-size: 20px;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    cursor: pointer;
-    z-index: 2;
-    transition: all 0.3s;
-}
-
-.expand-button:hover {
-    background-color: rgba(0,0,0,0.9);
-    transform: scale(1.1);
-}
-</style>
-"""
-
-css_modal = """
-<style>
-.image-modal {
-    display: none;
-    position: fixed;
-    top: 0;
-    left: 0;
-    width: 100%;
-    height: 100%;
-    background-color: rgba(0,0,0,0.95);
-    z-index: 2000;
-    overflow: hidden;
-    align-items: center;
-    justify-content: center;
-}
-
-.modal-content {
-    max-height: 90%;
-    max-width: 90%;
-    object-fit: contain;
-    border-radius: 10px;
-    box-shadow: 0 0 20px rgba(0,0,0,0.7);
-    animation: zoom 0.3s;
-}
-
-.close-modal {
-    position: fixed;
-    top: 20px;
-    right: 35px;
-    color: white;
-    font-size: 40px;
-    font-weight: bold;
-    cursor: pointer;
-    z-index: 2001;
-    transition: all 0.3s;
-}
-
-.close-modal:hover {
-    color: #ccc;
-}
-
-@keyframes zoom {
-    from { transform: scale(0.8); opacity: 0; }
-    to { transform: scale(1); opacity: 1; }
-}
-
-@media (max-width: 768px) {
-    .expand-button {
-        width: 36px;
-        height: 36px;
-        font-size: 18px;
-        bottom: 10px;
-        right: 10px;
-    }
-
-    .modal-content {
-        max-width: 95%;
-        max-height: 95%;
-    }
-
-    .close-modal {
-        top: 15px;
-        right: 20px;
-        font-size: 35px;
-    }
-}
-</style>
-"""
-
-# Aplicar los estilos al inicio de tu aplicación
-st.markdown(css_global, unsafe_allow_html=True)
-st.markdown(css_modal, unsafe_allow_html=True)
-st.components.v1.html("""
-<!-- Matomo -->
-<script>
-  var _paq = window._paq = window._paq || [];
-  /* tracker methods like "setCustomDimension" should be called before "trackPageView" */
-  _paq.push(['trackPageView']);
-  _paq.push(['enableLinkTracking']);
-  (function() {
-    var u="https://inventarioeljueves.matomo.cloud/";
-    _paq.push(['setTrackerUrl', u+'matomo.php']);
-    _paq.push(['setSiteId', '1']);
-    var d=document, g=d.createElement('script'), s=d.getElementsByTagName('script')[0];
-    g.async=true; g.src='https://cdn.matomo.cloud/inventarioeljueves.matomo.cloud/matomo.js'; s.parentNode.insertBefore(g,s);
-  })();
-</script>
-<!-- End Matomo Code -->
-""", height=0)
+seccion("estilos")
+# --- Estilos y scripts estáticos ---
+# Viven en static/ y Streamlit los sirve en /app/static/ (server.enableStaticServing
+# en .streamlit/config.toml): cada rerun solo manda la referencia y el navegador
+# cachea el fichero, en vez de reenviar varios KB de CSS y HTML.
+st.markdown("<style>@import url('/app/static/estilos.css');</style>", unsafe_allow_html=True)
+st.components.v1.iframe("/app/static/matomo.html", height=0)
 
 # --- Encabezado principal ---
 st.markdown("""
@@ -243,44 +73,254 @@ st.markdown("""
 # --- Configuración de seguridad ---
 ADMIN_PASSWORD_HASH = "c1c560d0e2bf0d3c36c85714d22c16be0be30efc9f480eff623b486778be2110"
 
-# --- Deshabilitar mensajes de Streamlit ---
-os.environ['STREAMLIT_HIDE_DEBUG'] = "true"
-os.environ['STREAMLIT_SERVER_LIFECYCLE'] = "false"
-_config.set_option('client.showErrorDetails', False)
-_config.set_option('client.showWarningMessages', False)
-_config.set_option('logger.level', 'error')
-logging.getLogger('streamlit').setLevel(logging.ERROR)
-logging.getLogger('streamlit.runtime').setLevel(logging.ERROR)
-logging.getLogger('streamlit.delta_generator').setLevel(logging.ERROR)
+# --- Preparación del proceso (una vez, no en cada rerun) ---
+@st.cache_resource
+def configurar_proceso():
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Deshabilitar mensajes de Streamlit
+    os.environ['STREAMLIT_HIDE_DEBUG'] = "true"
+    os.environ['STREAMLIT_SERVER_LIFECYCLE'] = "false"
+    _config.set_option('client.showErrorDetails', False)
+    _config.set_option('client.showWarningMessages', False)
+    _config.set_option('logger.level', 'error')
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    logging.getLogger('streamlit.runtime').setLevel(logging.ERROR)
+    logging.getLogger('streamlit.delta_generator').setLevel(logging.ERROR)
+    return True
+
+configurar_proceso()
 
 # --- Funciones faltantes que se habían omitido ---
-def image_to_base64(image, max_size=800, quality=85):
-    img = Image.open(image)
-    if max(img.size) > max_size:
-        img.thumbnail((max_size, max_size))
-    buffered = BytesIO()
-    img.save(buffered, format="WEBP", quality=quality)
-    return base64.b64encode(buffered.getvalue()).decode('utf-8')
-
-def base64_to_image(base64_str):
-    return Image.open(BytesIO(base64.b64decode(base64_str)))
-
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(
-            host=st.secrets["postgres"]["host"],
-            dbname=st.secrets["postgres"]["dbname"],
-            user=st.secrets["postgres"]["user"],
-            password=st.secrets["postgres"]["password"],
-            port=st.secrets["postgres"]["port"],
-            sslmode="require",
-            connect_timeout=3
+# Anchos (px) que se piden al elegir variante: tarjeta del listado y miniatura de galería
+ANCHO_TARJETA = 400
+ANCHO_MINIATURA = 160
+
+@st.cache_resource
+def get_almacen():
+    return crear_almacen(st.secrets.get("imagenes"))
+
+# Si hay servidor de imágenes (servidor_imagenes.py), las fotos se enlazan por
+# URL con su hash y el navegador las cachea; si no, se envían por Streamlit
+URL_IMAGENES = (st.secrets.get("imagenes") or {}).get("url_publica", "").rstrip("/")
+
+# Una sola caché por proceso para todas las sesiones, limitada en bytes
+# (cache_mb en [imagenes]); ver cache_imagenes.py
+@st.cache_resource
+def get_cache_imagenes():
+    return CacheImagenes(int(float((st.secrets.get("imagenes") or {}).get("cache_mb", 128)) * 1024 * 1024))
+
+@medido("imagen.leer")
+def leer_imagen(clave):
+    return get_almacen().leer(clave)
+
+@medido("imagen.preparar")
+def _preparar(datos):
+    from procesado_imagenes import preparar_para_mostrar
+    return preparar_para_mostrar(datos)
+
+def bytes_imagen(fila, ancho=None):
+    # La variante más pequeña que cubra el ancho pedido; sin ancho, la completa.
+    # Las claves son hashes de contenido: lo guardado nunca queda obsoleto
+    clave = elegir_variante(fila.get('variantes'), ancho) or fila.get('clave')
+    if clave:
+        return get_cache_imagenes().obtener(clave, lambda: _preparar(leer_imagen(clave)))
+    # Las filas aún no migradas conservan el base64 antiguo
+    datos = fila['imagen_base64']
+    return get_cache_imagenes().obtener(clave_base64(datos), lambda: _preparar(base64.b64decode(datos)))
+
+def olvidar_imagenes(filas):
+    # Las imágenes borradas no deben seguir ocupando la caché
+    claves = [clave for fila in filas for clave in claves_de_fila(fila)]
+    claves += [clave_base64(fila['imagen_base64']) for fila in filas if fila.get('imagen_base64')]
+    get_cache_imagenes().invalidar(claves)
+
+@medido("imagen.mostrar")
+def mostrar_imagen(fila, ancho=None):
+    if URL_IMAGENES and fila.get('clave'):
+        variantes = fila.get('variantes')
+        webp = elegir_variante(variantes, ancho) or fila['clave']
+        avif = elegir_variante(variantes, ancho, formato="avif")
+        fuente_avif = f'<source type="image/avif" srcset="{URL_IMAGENES}/img/{avif}">' if avif else ""
+        st.markdown(
+            f'<picture>{fuente_avif}<img src="{URL_IMAGENES}/img/{webp}" loading="lazy" '
+            f'class="mueble-image" alt=""></picture>',
+            unsafe_allow_html=True,
         )
-        conn.set_client_encoding('UTF8')  # ✅ Esta línea soluciona el problema de tildes
-        return conn
+    else:
+        st.image(bytes_imagen(fila, ancho), use_column_width=True)
+
+@st.cache_resource
+def get_pool_procesos():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # "spawn": hacer fork del servidor de Streamlit (con hilos) no es seguro
+    return ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1),
+                               mp_context=multiprocessing.get_context("spawn"))
+
+@medido("imagen.procesar")
+def preparar_imagenes(ficheros, progreso=None):
+    """Procesa las fotos subidas en paralelo y las guarda en el almacén.
+
+    Devuelve, en el orden de subida, los datos para insertar_imagenes().
+    """
+    from concurrent.futures import as_completed
+    from concurrent.futures.process import BrokenProcessPool
+    from procesado_imagenes import generar_variantes
+    originales = [f.getvalue() for f in ficheros]
+    resultados = [None] * len(originales)
+    try:
+        futuros = {get_pool_procesos().submit(generar_variantes, datos): i
+                   for i, datos in enumerate(originales)}
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            resultados[futuros[futuro]] = futuro.result()
+            if progreso:
+                progreso.progress(hechos / len(originales), text=f"Procesando imágenes {hechos}/{len(originales)}")
+    except BrokenProcessPool:
+        # Si el pool ha muerto, se recrea en la próxima subida y esta se procesa aquí
+        get_pool_procesos.clear()
+        resultados = [generar_variantes(datos) for datos in originales]
+
+    return [registro_imagen(get_almacen(), variantes) for variantes in resultados]
+
+@st.cache_resource
+def activar_instrumentacion():
+    configurar_instrumentacion(st.secrets.get("instrumentacion"))
+    return True
+
+activar_instrumentacion()
+
+@st.cache_resource
+def get_db_pool():
+    # Un único pool por proceso: las reruns reutilizan conexiones ya abiertas
+    return crear_pool(st.secrets["postgres"])
+
+@st.cache_resource
+def preparar_esquema(_pool):
+    with _pool.cursor() as c:
+        migrar(c)
+    return True
+
+@contextmanager
+def db_cursor():
+    try:
+        pool = get_db_pool()
+        preparar_esquema(pool)
     except Exception as e:
         st.error(f"Error de conexión: {str(e)}")
         st.stop()
+    with tramo("db"), pool.cursor(cursor_factory=CursorMedido) as c:
+        yield c
+
+# --- Lecturas cacheadas del catálogo ---
+# El argumento `version` forma parte de la clave de caché: las escrituras del
+# admin suben la versión del área afectada y las demás entradas siguen valiendo.
+# El TTL solo cubre cambios hechos desde fuera de este proceso.
+@st.cache_resource
+def get_versiones():
+    return VersionesCatalogo()
+
+# Catálogo estático para visitantes (catalogo_estatico.py): si está configurado,
+# cada escritura del admin programa su regeneración incremental
+@st.cache_resource
+def get_regenerador_catalogo():
+    cfg = st.secrets.get("catalogo_estatico") or {}
+    if not cfg.get("ruta") or not URL_IMAGENES:
+        return None
+    from catalogo_estatico import RegeneracionDiferida, crear_publicacion
+    return RegeneracionDiferida(get_db_pool(), cfg["ruta"], URL_IMAGENES, float(cfg.get("espera", 5)),
+                                crear_publicacion(cfg))
+
+def invalidar_catalogo(evento, mueble_id=None):
+    get_versiones().registrar_escritura(evento, mueble_id)
+    regenerador = get_regenerador_catalogo()
+    if regenerador:
+        regenerador.programar()
+
+# --- Cola de trabajos (trabajos.py) ---
+# Con [trabajos] activa = true y un worker en marcha, las fotos se procesan y
+# los blobs se borran fuera de la sesión; sin cola, todo sigue siendo síncrono.
+COLA_TRABAJOS = bool((st.secrets.get("trabajos") or {}).get("activa"))
+
+def encolar_trabajo(c, tipo, datos):
+    from trabajos import encolar
+    trabajo_id = encolar(c, tipo, datos)
+    # La sesión recuerda sus trabajos para mostrar su estado en la barra lateral
+    st.session_state['trabajos'] = (st.session_state.get('trabajos', []) + [trabajo_id])[-10:]
+    st.session_state['trabajos_activos'] = True
+    return trabajo_id
+
+def encolar_fotos(c, mueble_id, ficheros, primera_principal):
+    # Solo se guardan los originales; las variantes las genera el worker
+    originales = [get_almacen().guardar(f.getvalue()) for f in ficheros]
+    return encolar_trabajo(c, "procesar_imagenes", {
+        "mueble_id": mueble_id, "originales": originales, "primera_principal": primera_principal,
+    })
+
+@st.cache_data(ttl=600, max_entries=500, show_spinner=False)
+def cargar_pagina(tienda, tipo, orden, despues, limite, version):
+    with db_cursor() as c:
+        filas, siguiente = listar_disponibles(c, tienda, tipo, orden, despues=despues, limite=limite)
+        imagenes = principales_por_mueble(c, [m['id'] for m in filas])
+    return filas, siguiente, imagenes
+
+# Hasta este número de muebles en venta, el listado se filtra y ordena en
+# memoria sobre una instantánea; por encima se pide por páginas a Postgres.
+MAX_INSTANTANEA = 20_000
+
+# cache_resource y no cache_data: todas las sesiones comparten el mismo objeto
+# en vez de deserializar una copia de miles de filas en cada rerun
+@st.cache_resource(ttl=600, max_entries=2, show_spinner=False)
+def cargar_instantanea(version):
+    with db_cursor() as c:
+        filas = listar_todos_disponibles(c, MAX_INSTANTANEA)
+        if filas is None:
+            return None
+        imagenes = principales_disponibles(c)
+    return InstantaneaCatalogo(filas, imagenes)
+
+@st.cache_data(ttl=600, max_entries=200, show_spinner=False)
+def cargar_busqueda(termino, tienda, tipo, version):
+    with db_cursor() as c:
+        filas = buscar_muebles(c, termino, tienda, tipo)
+        imagenes = principales_por_mueble(c, [m['id'] for m in filas])
+    return filas, imagenes
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_tipos(version):
+    with db_cursor() as c:
+        return tipos_en_catalogo(c)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_estadisticas(version):
+    with db_cursor() as c:
+        return estadisticas(c)
+
+@st.cache_data(ttl=600, max_entries=50, show_spinner=False)
+def cargar_resumen_ventas(desde, hasta, tienda, version):
+    with db_cursor() as c:
+        return resumen_ventas(c, desde, hasta, tienda)
+
+# El worker es opcional: sin él, la foto de existencias del día la toma la
+# primera vista de análisis (una comprobación por día y proceso)
+@st.cache_data(max_entries=1, show_spinner=False)
+def preparar_resumen_ventas(dia):
+    with db_cursor() as c:
+        hecho = mantenimiento_diario(c)
+    if hecho:
+        cargar_resumen_ventas.clear()
+    return hecho
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def cargar_imagenes_mueble(mueble_id, version):
+    with db_cursor() as c:
+        return imagenes_por_mueble(c, [mueble_id]).get(mueble_id, [])
+
+@st.cache_data(ttl=600, max_entries=1000, show_spinner=False)
+def cargar_mueble(mueble_id, version):
+    # Vista de detalle de los enlaces ?id=: una búsqueda por clave primaria
+    with db_cursor() as c:
+        return obtener_mueble(c, mueble_id)
 
 
 def init_session():
@@ -309,36 +349,22 @@ def verificar_admin(password):
         return True
     return False
 
+seccion("sesion")
 init_session()
 
-check_auth_js = """
-<script>
-function getQueryParam(name) {
-    const urlParams = new URLSearchParams(window.location.search);
-    return urlParams.get(name);
-}
+st.components.v1.iframe("/app/static/sesion.html", height=0, width=0)
 
-if (!getQueryParam('admin_token') && localStorage.getItem('admin_token')) {
-    window.location.search = '?admin_token=' + localStorage.getItem('admin_token');
-}
-</script>
-"""
-st.components.v1.html(check_auth_js, height=0, width=0)
-
-conn = get_db_connection()
 # Detectar el parámetro ?id=... en la URL
 query_params = st.query_params.to_dict()
 id_param = query_params.get("id")
 
+mueble_id_destacado = None
 if id_param:
     try:
         mueble_id_destacado = int(id_param)
-        st.session_state['mueble_destacado'] = mueble_id_destacado
     except:
         st.warning("El ID proporcionado no es válido.")
 
-c = conn.cursor(cursor_factory=RealDictCursor)
-
 TIPOS_PLURAL = {
     "Mesa": "Mesas",
     "Consola": "Consolas",
@@ -354,6 +380,7 @@ TIPOS_PLURAL = {
 }
 
 
+seccion("alta")
 if st.session_state.es_admin:
     with st.expander("📥 Añadir nueva antigüedad", expanded=False):
         with st.form(key="form_nuevo_mueble"):
@@ -394,53 +421,152 @@ if st.session_state.es_admin:
                 if not nombre or precio <= 0 or not imagenes:
                     st.warning("Por favor, rellena todos los campos obligatorios, incluyendo al menos una imagen.")
                     st.stop()
+
+                imagenes_listas = [] if COLA_TRABAJOS else preparar_imagenes(
+                    imagenes, st.progress(0.0, text="Procesando imágenes..."))
             
-                # Insertar en muebles
-                c.execute("""
-                    INSERT INTO muebles (
-                        nombre, precio, descripcion, tienda, vendido, tipo, fecha,
-                        alto, largo, fondo, diametro, diametro_base, diametro_boca,
-                        alto_respaldo, alto_asiento, ancho)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s,
-                            %s, %s, %s, %s, %s, %s,
-                            %s, %s, %s)
-
-
-                """, (
-                    nombre, precio, descripcion, tienda, vendido, tipo, datetime.now(),
-                    medidas["alto"] or None,
-                    medidas["largo"] or None,
-                    medidas["fondo"] or None,
-                    medidas["diametro"] or None,
-                    medidas["diametro_base"] or None,
-                    medidas["diametro_boca"] or None,
-                    medidas["alto_respaldo"] or None,
-                    medidas["alto_asiento"] or None,
-                    medidas["ancho"] or None
-
-                ))
-            
-                c.execute("SELECT LASTVAL() AS lastval")
-                mueble_id = c.fetchone()['lastval']
-            
-                # Insertar imágenes
-                for i, img in enumerate(imagenes):
-                    img_base64 = image_to_base64(img)
-                    es_principal = (i == 0)
-                    c.execute("""
-                        INSERT INTO imagenes_muebles (mueble_id, imagen_base64, es_principal)
-                        VALUES (%s, %s, %s)
-                    """, (int(mueble_id), str(img_base64), bool(es_principal)))
+                ahora = datetime.now()
+                mueble = {
+                    "nombre": nombre, "precio": precio, "descripcion": descripcion,
+                    "tienda": tienda, "vendido": vendido, "tipo": tipo,
+                    "fecha": ahora, "fecha_venta": ahora if vendido else None,
+                    **{clave: valor or None for clave, valor in medidas.items()},
+                }
+                # Mueble e imágenes en una sola transacción (INSERT ... RETURNING id)
+                with tramo("alta"), db_cursor() as c:
+                    mueble_id = crear_mueble(c, mueble, imagenes_listas)
+                    if COLA_TRABAJOS:
+                        encolar_fotos(c, mueble_id, imagenes, primera_principal=True)
 
             
-                conn.commit()
                 st.success("✅ ¡Mueble añadido con éxito!")
+                invalidar_catalogo("crear")
                 st.rerun()
 
+    with st.expander("📦 Importación masiva (CSV + fotos)", expanded=False):
+        st.caption("Una fila por mueble con las columnas del formulario y una columna «imagenes» "
+                   "con los nombres de las fotos separados por «|». Para lotes muy grandes: "
+                   "`python importar.py lote.csv fotos/`")
+        csv_lote = st.file_uploader("CSV de muebles", type=["csv"], key="importar_csv")
+        zip_fotos = st.file_uploader("Zip con las fotos", type=["zip"], key="importar_zip")
+        if csv_lote and zip_fotos:
+            from importar import (
+                FuenteFotos, cargar_estado, huella, importar, informe_simulacion, leer_csv, ruta_estado,
+                validar,
+            )
+            datos_csv = csv_lote.getvalue()
+            fotos_lote = FuenteFotos(zip_fotos)
+            muebles_lote, errores_lote, avisos_lote = validar(
+                leer_csv(datos_csv), fotos_lote, cargar_tipos(get_versiones().version("tipos")))
+            ruta_lote = ruta_estado(huella(datos_csv))
+            estado_lote = cargar_estado(ruta_lote)
+
+            # Informe previo (simulación): nada se escribe hasta pulsar Importar
+            informe = informe_simulacion(muebles_lote, errores_lote, avisos_lote, fotos_lote, estado_lote)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Muebles válidos", informe["muebles"])
+            col2.metric("Fotos", informe["fotos"], help=f"{informe['fotos_ya_procesadas']} ya procesadas")
+            col3.metric("Tamaño fotos", f"{informe['megabytes_fotos']} MB")
+            for error in errores_lote:
+                st.error(error)
+            for aviso in avisos_lote:
+                st.warning(aviso)
+
+            if informe["ya_importado"]:
+                st.info("Este CSV ya se importó")
+            elif muebles_lote and not errores_lote:
+                if st.button(f"📥 Importar {len(muebles_lote)} muebles", key="importar_lote"):
+                    barra = st.progress(0.0, text="Procesando fotos...")
+                    ids = importar(get_db_pool(), get_almacen(), get_pool_procesos(), muebles_lote,
+                                   fotos_lote, estado_lote, ruta_lote,
+                                   progreso=lambda h, t: barra.progress(h / t, text=f"Procesando fotos {h}/{t}"))
+                    invalidar_catalogo("crear")
+                    st.success(f"✅ {len(ids)} muebles importados")
+
+
+@st.fragment(key="estadisticas")
+@perfilado("estadisticas")
+def bloque_estadisticas():
+    # Fragmento con clave: las acciones de las tarjetas lo repintan con
+    # st.rerun([tarjeta, "estadisticas"]) sin re-ejecutar la página entera
+    st.markdown("## 📊 Estadísticas")
+    try:
+        stats = cargar_estadisticas(get_versiones().version("estadisticas"))
+        st.metric("🔵 En El Rastro", stats["en_rastro"])
+        st.metric("🔴 En Regueros", stats["en_regueros"])
+        st.metric("💰 Vendidos", stats["vendidos"])
+
+        if st.session_state.es_admin:
+            st.metric("💶 Stock en El Rastro", f"{stats['valor_rastro']:,.0f} €")
+            st.metric("💶 Stock en Regueros", f"{stats['valor_regueros']:,.0f} €")
+            if stats["dias_medios_venta"] is not None:
+                st.metric("⏱️ Días medios hasta venta", f"{stats['dias_medios_venta']:.0f}")
+            if stats["ventas_por_mes"]:
+                with st.expander("📅 Ventas por mes", expanded=False):
+                    st.dataframe(stats["ventas_por_mes"], hide_index=True, use_container_width=True)
 
-
+    except psycopg2.Error as e:
+        st.error("Error al cargar estadísticas")
+        st.metric("🔵 En El Rastro", 0)
+        st.metric("🔴 En Regueros", 0)
+        st.metric("💰 Vendidos", 0)
 
 # --- Barra lateral ---
+# --- Estado de los trabajos encolados por esta sesión ---
+ETIQUETAS_TRABAJO = {
+    "procesar_imagenes": "Fotos", "borrar_blobs": "Limpieza de imágenes",
+    "exportar": "Exportación", "regenerar_variantes": "Variantes de imágenes",
+}
+ICONOS_ESTADO = {"pendiente": "🕓", "en_curso": "⚙️", "hecho": "✅", "fallido": "❌"}
+
+def al_encolar(tipo, datos):
+    with db_cursor() as c:
+        encolar_trabajo(c, tipo, datos)
+
+def al_exportar_en_cola(formato, con_imagenes, con_ventas):
+    al_encolar("exportar", {"formato": formato, "con_imagenes": con_imagenes,
+                            "con_ventas": con_ventas, "url_imagenes": URL_IMAGENES})
+
+def panel_trabajos():
+    if not st.session_state.get('trabajos'):
+        st.caption("Esta sesión no ha encolado trabajos")
+        return
+    # Mientras quede alguno sin terminar, el fragmento se sondea solo cada 3 s
+    activos = st.session_state.get('trabajos_activos', True)
+    st.fragment(_pintar_trabajos, run_every="3s" if activos else None)()
+
+def _pintar_trabajos():
+    from trabajos import estado_trabajos
+    ids = st.session_state.get('trabajos', [])
+    with db_cursor() as c:
+        estados = estado_trabajos(c, ids)
+    activos = any(t['estado'] in ("pendiente", "en_curso") for t in estados.values())
+    if st.session_state.get('trabajos_activos', True) and not activos:
+        # Todo terminado: un rerun completo para dejar de sondear y mostrar los cambios
+        st.session_state['trabajos_activos'] = False
+        st.rerun()
+    aplicados = st.session_state.setdefault('trabajos_aplicados', set())
+    for trabajo_id in reversed(ids):
+        t = estados.get(trabajo_id)
+        if not t:
+            continue
+        texto = f"{ICONOS_ESTADO[t['estado']]} {ETIQUETAS_TRABAJO.get(t['tipo'], t['tipo'])} #{trabajo_id}"
+        if t['estado'] == "pendiente" and t['intentos']:
+            texto += f" · reintento {t['intentos']}/{t['max_intentos']}"
+        st.caption(texto)
+        if t['estado'] == "fallido":
+            st.caption(f"Error: {(t['error'] or '').strip().splitlines()[-1]}")
+        if t['estado'] == "hecho" and t['tipo'] == "exportar":
+            r = t['resultado']
+            st.download_button(f"Descargar {r['nombre']}", data=lambda clave=r['clave']: BytesIO(get_almacen().leer(clave)),
+                               file_name=r['nombre'], mime=FORMATOS_EXPORTACION[r['formato']],
+                               key=f"descargar_trabajo_{trabajo_id}", on_click="ignore")
+        if t['estado'] == "hecho" and t['tipo'] == "procesar_imagenes" and trabajo_id not in aplicados:
+            # Las fotos ya están: las lecturas cacheadas de ese mueble dejan de valer
+            aplicados.add(trabajo_id)
+            invalidar_catalogo("imagenes", t['datos']['mueble_id'])
+
+seccion("barra_lateral")
 with st.sidebar:
     if not st.session_state.es_admin:
         with st.expander("🔑 Acceso Administradores", expanded=False):
@@ -460,52 +586,77 @@ with st.sidebar:
             st.rerun()
     
     # Estadísticas
-    st.markdown("## 📊 Estadísticas")
-    try:
-        c.execute("SELECT COUNT(*) as count FROM muebles WHERE vendido = FALSE AND tienda = 'El Rastro'")
-        en_rastro = c.fetchone()["count"] or 0
-        
-        c.execute("SELECT COUNT(*) as count FROM muebles WHERE vendido = FALSE AND tienda = 'Regueros'")
-        en_regueros = c.fetchone()["count"] or 0
-        
-        c.execute("SELECT COUNT(*) as count FROM muebles WHERE vendido = TRUE")
-        vendidos = c.fetchone()["count"] or 0
-
-        
-        st.metric("🔵 En El Rastro", en_rastro)
-        st.metric("🔴 En Regueros", en_regueros)
-        st.metric("💰 Vendidos", vendidos)
-        
-    except psycopg2.Error as e:
-        st.error("Error al cargar estadísticas")
-        st.metric("🔵 En El Rastro", 0)
-        st.metric("🔴 En Regueros", 0)
-        st.metric("💰 Vendidos", 0)
+    bloque_estadisticas()
 
     if st.session_state.es_admin:
-        if st.button("⬇️ Exportar inventario CSV"):
-            c.execute("SELECT * FROM muebles")
-            data = c.fetchall()
-            if data:
-                import pandas as pd
-                df = pd.DataFrame(data)
-                st.download_button("Descargar CSV", df.to_csv(index=False).encode(), "muebles.csv", "text/csv")
-
-def mostrar_galeria_imagenes(imagenes, mueble_id):
+        with st.expander("⬇️ Exportar inventario", expanded=False):
+            formato = st.selectbox("Formato", list(FORMATOS_EXPORTACION), format_func=str.upper,
+                                   key="formato_exportacion")
+            con_imagenes = st.checkbox("Incluir URLs de imágenes", key="exportar_imagenes")
+            con_ventas = st.checkbox("Incluir fechas de venta", value=True, key="exportar_ventas")
+            pool = get_db_pool()
+            # El fichero se genera al pulsar, en un hilo aparte y en streaming
+            # a un temporal en disco, así que no bloquea la página; la descarga
+            # sí lo guarda entero en la memoria de Streamlit (ver exportar.py)
+            st.download_button(
+                f"Descargar {formato.upper()}",
+                data=lambda: exportar_a_temporal(pool, formato, con_imagenes=con_imagenes,
+                                                 con_ventas=con_ventas, url_imagenes=URL_IMAGENES),
+                file_name=nombre_fichero(formato),
+                mime=FORMATOS_EXPORTACION[formato],
+                on_click="ignore",
+            )
+            if COLA_TRABAJOS:
+                st.button("⏳ Exportar en segundo plano", key="exportar_en_cola", on_click=al_exportar_en_cola,
+                          args=(formato, con_imagenes, con_ventas))
+
+        if COLA_TRABAJOS:
+            with st.expander("⏳ Trabajos en segundo plano", expanded=bool(st.session_state.get('trabajos'))):
+                st.button("🔁 Regenerar variantes de imágenes", key="regenerar_variantes",
+                          on_click=al_encolar, args=("regenerar_variantes", {}))
+                panel_trabajos()
+
+        with st.expander("🔌 Pool de conexiones", expanded=False):
+            m = get_db_pool().metricas()
+            st.caption(f"En uso: {m['en_uso']}/{m['maxconn']} · Checkouts: {m['checkouts']}")
+            st.caption(f"Espera media: {m['espera_media_ms']:.1f} ms · Máx: {m['espera_max_s'] * 1000:.0f} ms")
+            st.caption(f"Esperas >100 ms: {m['esperas_lentas']} · Timeouts: {m['timeouts']} · Reconexiones: {m['reconexiones']}")
+
+        with st.expander("🖼️ Caché de imágenes", expanded=False):
+            m = get_cache_imagenes().metricas()
+            st.caption(f"Entradas: {m['entradas']} · {m['bytes'] / 1e6:.1f} de {m['max_bytes'] / 1e6:.0f} MB")
+            st.caption(f"Aciertos: {m['aciertos']} · Fallos: {m['fallos']} ({m['tasa_aciertos']:.0%} aciertos)")
+            st.caption(f"Expulsiones: {m['expulsiones']} · Invalidaciones: {m['invalidaciones']}")
+
+def mostrar_galeria_imagenes(imagenes, mueble_id, ancho_principal=ANCHO_TARJETA, contexto="listado"):
+    # `imagenes` puede traer solo la principal (listados); `total` dice cuántas hay
     if not imagenes:
         return
     
     # Mostrar la imagen principal
-    img_principal = imagenes[0]['imagen_base64']
-    st.image(base64_to_image(img_principal), use_column_width=True)
+    mostrar_imagen(imagenes[0], ancho_principal)
     
     # Mostrar imágenes secundarias si existen
-    if len(imagenes) > 1:
-        with st.expander(f"📸 Ver más imágenes ({len(imagenes)-1})", expanded=False):
-            cols = st.columns(min(3, len(imagenes)-1))
-            for i, img_dict in enumerate(imagenes[1:], start=1):
-                with cols[(i-1) % len(cols)]:
-                    st.image(base64_to_image(img_dict['imagen_base64']), use_column_width=True)
+    total = imagenes[0].get('total') or len(imagenes)
+    if total > 1:
+        galeria_secundaria(mueble_id, total, imagenes if len(imagenes) == total else None, contexto)
+
+@st.fragment
+@perfilado("galeria")
+def galeria_secundaria(mueble_id, total, imagenes, contexto):
+    # Fragmento: abrir la galería solo re-ejecuta esto, y las secundarias
+    # no se piden ni se envían al navegador hasta que se abre
+    if not st.toggle(f"📸 Ver más imágenes ({total-1})", key=f"galeria_{contexto}_{mueble_id}"):
+        return
+    if imagenes is None:
+        imagenes = cargar_imagenes_mueble(mueble_id, get_versiones().version_mueble(mueble_id))
+    secundarias = imagenes[1:]
+    if not secundarias:
+        return
+    cols = st.columns(min(3, len(secundarias)))
+    for i, img_dict in enumerate(secundarias):
+        with cols[i % len(cols)]:
+            mostrar_imagen(img_dict, ANCHO_MINIATURA)
 
 def es_nuevo(fecha_str):
     formatos_posibles = [
@@ -522,130 +673,179 @@ def es_nuevo(fecha_str):
     return False  # Si ninguno de los formatos funcionó
 
 
-def mostrar_formulario_edicion(mueble_id):
-    c.execute("SELECT * FROM muebles WHERE id = %s", (mueble_id,))
-    mueble = c.fetchone()
-
-    c.execute("SELECT imagen_base64, es_principal FROM imagenes_muebles WHERE mueble_id = %s ORDER BY es_principal DESC", (mueble_id,))
-    imagenes_actuales = c.fetchall()
+ETIQUETAS_MEDIDAS = {
+    'alto': "Alto",
+    'largo': "Largo",
+    'fondo': "Fondo",
+    'diametro': "Diámetro",
+    'diametro_base': "Ø Base",
+    'diametro_boca': "Ø Boca",
+    'alto_respaldo': "Alto respaldo",
+    'alto_asiento': "Alto asiento",
+    'ancho': "Ancho"
+}
 
-    etiquetas = {
-        'alto': "Alto",
-        'largo': "Largo",
-        'fondo': "Fondo",
-        'diametro': "Diámetro",
-        'diametro_base': "Ø Base",
-        'diametro_boca': "Ø Boca",
-        'alto_respaldo': "Alto respaldo",
-        'alto_asiento': "Alto asiento",
-        'ancho': "Ancho"
+# --- Acciones del admin sobre una tarjeta ---
+# Son callbacks de los botones: tras escribir, st.rerun([...]) con las claves de
+# fragmento repinta solo la tarjeta afectada y las estadísticas, no la página.
+def al_editar(mueble_id):
+    st.session_state['editar_mueble_id'] = mueble_id
+
+def al_cancelar_edicion(tarjeta):
+    st.session_state.pop('editar_mueble_id', None)
+    st.rerun(tarjeta)
+
+@accion("editar")
+def guardar_edicion(mueble_id, tarjeta, tenia_imagenes, imagenes_listas=()):
+    s = st.session_state
+    campos = {
+        "nombre": s[f"nombre_{mueble_id}"], "precio": s[f"precio_{mueble_id}"],
+        "descripcion": s[f"descripcion_{mueble_id}"], "tienda": s[f"tienda_{mueble_id}"],
+        "vendido": s[f"edit_vendido_{mueble_id}"],
+        **{clave: s[f"{clave}_{mueble_id}"] or None for clave in ETIQUETAS_MEDIDAS},
     }
 
+    with db_cursor() as c:
+        actualizar_mueble(c, mueble_id, campos, imagenes_listas, primera_principal=not tenia_imagenes)
+        if COLA_TRABAJOS and s.get(f"uploader_{mueble_id}"):
+            encolar_fotos(c, mueble_id, s[f"uploader_{mueble_id}"], primera_principal=not tenia_imagenes)
+
+    # st.toast en un callback que repinta solo fragmentos no se muestra:
+    # lo saca la tarjeta al repintarse
+    st.session_state[f"guardado_{tarjeta}"] = True
+    st.session_state.pop('editar_mueble_id', None)
+    invalidar_catalogo("editar", mueble_id)
+
+def al_guardar_edicion(mueble_id, tarjeta, tenia_imagenes):
+    if st.session_state.get(f"uploader_{mueble_id}") and not COLA_TRABAJOS:
+        # Con fotos nuevas, las procesa el formulario al repintarse: lo que pinta
+        # un callback no se ve, y así la barra de progreso sí
+        st.session_state[f"fotos_pendientes_{mueble_id}"] = True
+        return
+    guardar_edicion(mueble_id, tarjeta, tenia_imagenes)
+    st.rerun([tarjeta, "estadisticas"])
+
+def guardar_edicion_con_fotos(mueble_id, tarjeta, tenia_imagenes):
+    # Se codifican antes de abrir la transacción: si falla una, no se escribe nada
+    imagenes_listas = preparar_imagenes(st.session_state[f"uploader_{mueble_id}"],
+                                        st.progress(0.0, text="Procesando imágenes..."))
+    guardar_edicion(mueble_id, tarjeta, tenia_imagenes, imagenes_listas)
+    # Repintar solo unos fragmentos por clave solo se puede desde un callback
+    st.rerun()
+
+@accion("eliminar")
+def al_eliminar(mueble_id, tarjeta, clave_confirmacion):
+    if not st.session_state.get(clave_confirmacion):
+        # Primer clic: pedir confirmación (la tarjeta se repinta sola)
+        st.session_state[clave_confirmacion] = True
+        return
+    st.session_state.pop(clave_confirmacion, None)
+    with db_cursor() as c:
+        claves = borrar_mueble(c, mueble_id)
+        if COLA_TRABAJOS:
+            encolar_trabajo(c, "borrar_blobs", {"claves": claves})
+    if not COLA_TRABAJOS:
+        with db_cursor() as c:
+            borrar_blobs_sin_referencias(c, get_almacen(), claves)
+    get_cache_imagenes().invalidar(claves)
+    invalidar_catalogo("eliminar", mueble_id)
+    st.rerun([tarjeta, "estadisticas"])
+
+@accion("vendido")
+def al_marcar_vendido(mueble_id, vendido, tarjeta):
+    with db_cursor() as c:
+        marcar_vendido(c, mueble_id, vendido)
+    invalidar_catalogo("vendido", mueble_id)
+    st.rerun([tarjeta, "estadisticas"])
+
+@accion("borrar_imagen")
+def al_borrar_imagen(mueble_id, img_dict, tarjeta):
+    with db_cursor() as c:
+        claves = borrar_imagen(c, mueble_id, img_dict)
+        if COLA_TRABAJOS:
+            encolar_trabajo(c, "borrar_blobs", {"claves": claves})
+    if not COLA_TRABAJOS:
+        with db_cursor() as c:
+            borrar_blobs_sin_referencias(c, get_almacen(), claves)
+    olvidar_imagenes([img_dict])
+    invalidar_catalogo("imagenes", mueble_id)
+    st.rerun(tarjeta)
+
+@accion("principal")
+def al_marcar_principal(mueble_id, img_dict, tarjeta):
+    with db_cursor() as c:
+        marcar_imagen_principal(c, mueble_id, img_dict)
+    invalidar_catalogo("imagenes", mueble_id)
+    st.rerun(tarjeta)
+
+
+@st.fragment
+@perfilado("edicion")
+def mostrar_formulario_edicion(mueble_id, tarjeta):
+    # Fragmento dentro de la tarjeta: sus botones solo re-ejecutan el formulario,
+    # y al guardar se repinta la tarjeta entera con los datos nuevos
+    mueble, imagenes_actuales = cargar_mueble(mueble_id, get_versiones().version_mueble(mueble_id))
+    if not mueble:
+        return
+    if st.session_state.pop(f"fotos_pendientes_{mueble_id}", False):
+        guardar_edicion_con_fotos(mueble_id, tarjeta, bool(imagenes_actuales))
 
     with st.form(key=f"form_editar_{mueble_id}"):
         st.markdown(f"### Editando: {mueble['nombre']}")
 
         col1, col2 = st.columns(2)
         with col1:
-            tienda = st.radio("Tienda", options=["El Rastro", "Regueros"],
-                              index=0 if mueble['tienda'] == "El Rastro" else 1)
+            st.radio("Tienda", options=["El Rastro", "Regueros"],
+                     index=0 if mueble['tienda'] == "El Rastro" else 1, key=f"tienda_{mueble_id}")
         with col2:
-            vendido = st.checkbox("Marcar como vendido", value=mueble['vendido'])
+            st.checkbox("Marcar como vendido", value=mueble['vendido'], key=f"edit_vendido_{mueble_id}")
 
-        nombre = st.text_input("Nombre*", value=mueble['nombre'])
-        precio = st.number_input("Precio (€)*", min_value=0.0, value=float(mueble['precio']))
+        st.text_input("Nombre*", value=mueble['nombre'], key=f"nombre_{mueble_id}")
+        st.number_input("Precio (€)*", min_value=0.0, value=float(mueble['precio']), key=f"precio_{mueble_id}")
 
-        descripcion = st.text_area("Descripción", value=mueble['descripcion'])
+        st.text_area("Descripción", value=mueble['descripcion'], key=f"descripcion_{mueble_id}")
 
         st.markdown("### Medidas")
-        medidas = {}
-        for clave in etiquetas:
+        for clave, etiqueta in ETIQUETAS_MEDIDAS.items():
             valor = mueble.get(clave)
-            medidas[clave] = st.number_input(etiquetas[clave], min_value=0.0, step=0.5, value=float(valor or 0), key=f"{clave}_{mueble_id}")
+            st.number_input(etiqueta, min_value=0.0, step=0.5, value=float(valor or 0), key=f"{clave}_{mueble_id}")
 
         st.markdown("### Añadir nuevas imágenes")
-        nuevas_imagenes = st.file_uploader("Seleccionar imágenes",
-                                           type=["jpg", "jpeg", "png"],
-                                           accept_multiple_files=True,
-                                           key=f"uploader_{mueble_id}")
+        st.file_uploader("Seleccionar imágenes",
+                         type=["jpg", "jpeg", "png"],
+                         accept_multiple_files=True,
+                         key=f"uploader_{mueble_id}")
 
         # SOLO UN SUBMIT BUTTON
-        guardar = st.form_submit_button("💾 Guardar cambios")
+        st.form_submit_button("💾 Guardar cambios", on_click=al_guardar_edicion,
+                              args=(mueble_id, tarjeta, bool(imagenes_actuales)))
 
     # Cancelar edición se gestiona con un botón afuera
-    if st.button("❌ Cancelar edición", key=f"cancelar_{mueble_id}"):
-        st.session_state.pop('editar_mueble_id', None)
-        st.rerun()
-
-    if guardar:
-        c.execute("""
-            UPDATE muebles SET
-                nombre = %s, precio = %s, descripcion = %s,
-                tienda = %s, vendido = %s,
-                alto = %s, largo = %s, fondo = %s,
-                diametro = %s, diametro_base = %s, diametro_boca = %s,
-                alto_respaldo = %s, alto_asiento = %s, ancho = %s
-            WHERE id = %s
-
-        """, (
-            nombre, precio, descripcion, tienda, vendido,
-            medidas["alto"] or None,
-            medidas["largo"] or None,
-            medidas["fondo"] or None,
-            medidas["diametro"] or None,
-            medidas["diametro_base"] or None,
-            medidas["diametro_boca"] or None,
-            medidas["alto_respaldo"] or None,
-            medidas["alto_asiento"] or None,
-            medidas["ancho"] or None,
-            mueble_id
-        ))
-
-        if nuevas_imagenes:
-            for img in nuevas_imagenes:
-                img_base64 = image_to_base64(img)
-                es_principal = 0 if imagenes_actuales == [] else 1
-                c.execute("""
-                    INSERT INTO imagenes_muebles (mueble_id, imagen_base64, es_principal)
-                    VALUES (%s, %s, %s)
-                """, (mueble_id, img_base64, es_principal))
-
-        conn.commit()
-        st.success("¡Cambios guardados!")
-        st.session_state.pop('editar_mueble_id', None)
-        st.rerun()
+    st.button("❌ Cancelar edición", key=f"cancelar_{mueble_id}",
+              on_click=al_cancelar_edicion, args=(tarjeta,))
 
     # 🔁 Mostrar imágenes actuales y botones fuera del form
     st.markdown("### Imágenes actuales")
     if imagenes_actuales:
         try:
-            mostrar_galeria_imagenes(imagenes_actuales, mueble_id)
+            mostrar_galeria_imagenes(imagenes_actuales, mueble_id, ancho_principal=None, contexto="edicion")
         except:
             st.warning("Error al cargar la galería de imágenes")
 
         cols = st.columns(min(3, len(imagenes_actuales)))
         for i, img_dict in enumerate(imagenes_actuales):
-            img_base64 = img_dict['imagen_base64']
             es_principal = img_dict['es_principal']
             with cols[i % len(cols)]:
-                if st.button(f"❌ Eliminar imagen {i+1}", key=f"del_img_{i}_{mueble_id}"):
-                    c.execute("DELETE FROM imagenes_muebles WHERE imagen_base64 = %s", (img_base64,))
-                    conn.commit()
-                    st.rerun()
+                st.button(f"❌ Eliminar imagen {i+1}", key=f"del_img_{i}_{mueble_id}",
+                          on_click=al_borrar_imagen, args=(mueble_id, img_dict, tarjeta))
 
                 if not es_principal:
-                    if st.button(f"⭐️ Marcar como principal", key=f"principal_img_{i}_{mueble_id}"):
-                        c.execute("UPDATE imagenes_muebles SET es_principal = FALSE WHERE mueble_id = %s", (mueble_id,))
-                        c.execute("UPDATE imagenes_muebles SET es_principal = TRUE WHERE mueble_id = %s AND imagen_base64 = %s", (mueble_id, img_base64))
-                        conn.commit()
-                        st.rerun()
+                    st.button(f"⭐️ Marcar como principal", key=f"principal_img_{i}_{mueble_id}",
+                              on_click=al_marcar_principal, args=(mueble_id, img_dict, tarjeta))
 
 
 
 
-# Galería de imágenes mejorada con miniaturas, ampliación visual y scroll horizontal
-from streamlit.components.v1 import html
-
 def mostrar_medidas_extendido(mueble):
     etiquetas = {
         'alto': "Alto",
@@ -666,19 +866,250 @@ def mostrar_medidas_extendido(mueble):
             partes.append(f"{nombre}: {valor}cm")
     return " · ".join(partes) if partes else "Sin medidas"
 
+def enlace_whatsapp(mueble_id):
+    share_url = f"https://muebles-app-kntlnhehoh6c2o9bbvofft.streamlit.app/?id={mueble_id}"
+    mensaje = f"Mira este mueble: {share_url}"
+    mensaje_codificado = urllib.parse.quote(mensaje)
+    return f"https://wa.me/?text={mensaje_codificado}"
+
+def mostrar_detalle_mueble(mueble_id):
+    mueble, imagenes = cargar_mueble(mueble_id, get_versiones().version_mueble(mueble_id))
+    if st.button("⬅️ Ver todo el catálogo", key="volver_catalogo"):
+        del st.query_params["id"]
+        st.rerun()
+    if not mueble:
+        st.info("Este mueble ya no está en el catálogo")
+        return
+
+    with st.container(border=True):
+        col_img, col_info = st.columns([1, 2])
+        with col_img:
+            if imagenes:
+                try:
+                    mostrar_galeria_imagenes(imagenes, mueble['id'], ancho_principal=None, contexto="detalle")
+                except:
+                    st.warning("Error al cargar imágenes")
+        with col_info:
+            st.markdown(f"### {mueble['nombre']}")
+            if mueble['vendido']:
+                st.markdown("<span style='color: #b00020; font-size: 1.2em;'>Vendido</span>", unsafe_allow_html=True)
+            st.markdown(f"**Tipo:** {mueble['tipo']}")
+            st.markdown(f"**Precio:** {mueble['precio']} €")
+            st.markdown(f"**Tienda:** {mueble['tienda']}")
+            st.markdown(f"**Medidas:** {mostrar_medidas_extendido(mueble)}")
+            if mueble['descripcion']:
+                st.markdown(f"**Descripción:** {mueble['descripcion']}")
+            st.markdown(f"[📱 Compartir por WhatsApp]({enlace_whatsapp(mueble['id'])})", unsafe_allow_html=True)
+
+def tarjeta_mueble(mueble, imagenes_mueble, version, contexto="listado"):
+    # Cada tarjeta es un fragmento con clave propia: sus botones solo la
+    # re-ejecutan a ella, y las acciones la repintan con st.rerun(tarjeta)
+    tarjeta = f"tarjeta_{contexto}_{mueble['id']}"
+    st.fragment(_pintar_tarjeta, key=tarjeta)(mueble, imagenes_mueble, version, contexto, tarjeta)
+
+@perfilado("tarjeta")
+def _pintar_tarjeta(mueble, imagenes_mueble, version, contexto, tarjeta):
+    if st.session_state.pop(f"guardado_{tarjeta}", False):
+        st.toast("¡Cambios guardados!")
+    # Si el mueble ha cambiado desde que se pintó el listado, se relee por su id
+    mueble_id = mueble['id']
+    actual = get_versiones().version_mueble(mueble_id)
+    if actual != version:
+        mueble, imagenes_mueble = cargar_mueble(mueble_id, actual)
+        if not mueble:
+            st.info("🗑️ Mueble eliminado")
+            return
+        if mueble['vendido'] != (contexto == "vendidos"):
+            st.success(f"✔️ {mueble['nombre']}: vendido" if mueble['vendido']
+                       else f"↩️ {mueble['nombre']}: de nuevo disponible")
+            return
+    sufijo = "v_" if contexto == "vendidos" else ""
+
+    with st.container(border=True):
+        col_img, col_info = st.columns([1, 3])
+
+        with col_img:
+            if imagenes_mueble:
+                try:
+                    mostrar_galeria_imagenes(imagenes_mueble, mueble_id, contexto=contexto)
+                except:
+                    st.warning("Error al cargar imágenes")
+
+        with col_info:
+            st.markdown(f"### {mueble['nombre']}")
+            if es_nuevo(mueble['fecha']):
+                st.markdown("<span style='color: green; font-size: 1.2em;'>🆕 Nuevo</span>", unsafe_allow_html=True)
+            st.markdown(f"**Tipo:** {mueble['tipo']}")
+            st.markdown(f"**Precio:** {mueble['precio']} €")
+            st.markdown(f"**Tienda:** {mueble['tienda']}")
+            st.markdown(f"**Medidas:** {mostrar_medidas_extendido(mueble)}")
+
+            if contexto == "vendidos":
+                st.markdown(f"**Fecha registro:** {mueble['fecha']}")
+                if mueble['descripcion']:
+                    st.markdown(f"**Descripción:** {mueble['descripcion']}")
+            else:
+                fecha_formateada = mueble['fecha'].strftime("%d/%m/%Y")
+                st.markdown(f"**Fecha registro:** {fecha_formateada}")
+
+                desc = mueble['descripcion']
+                if desc:
+                    if len(desc) > 200:
+                        resumen = desc[:200] + "..."
+                        if st.button(f"🔎 Ver más", key=f"desc_{mueble_id}"):
+                            st.markdown(f"**Descripción completa:** {desc}")
+                        else:
+                            st.markdown(f"**Descripción:** {resumen}")
+                    else:
+                        st.markdown(f"**Descripción:** {desc}")
+
+                st.markdown(f"[📱 Compartir por WhatsApp]({enlace_whatsapp(mueble_id)})", unsafe_allow_html=True)
+
+            if st.session_state.get('editar_mueble_id') == mueble_id:
+                mostrar_formulario_edicion(mueble_id, tarjeta)
+
+            if st.session_state.es_admin:
+                col1, col2, col3 = st.columns(3)
+
+                with col1:
+                    st.button(f"✏️ Editar", key=f"editar_{sufijo}{mueble_id}",
+                              on_click=al_editar, args=(mueble_id,))
+
+                with col2:
+                    confirmacion = f"confirm_eliminar_{sufijo}{mueble_id}"
+                    st.button(f"🗑️ Eliminar", key=f"eliminar_{sufijo}{mueble_id}",
+                              on_click=al_eliminar, args=(mueble_id, tarjeta, confirmacion))
+                    if st.session_state.get(confirmacion):
+                        st.warning("¿Confirmar eliminación?")
+
+                with col3:
+                    if contexto == "vendidos":
+                        st.button(f"↩️ Marcar como disponible", key=f"revertir_{mueble_id}",
+                                  on_click=al_marcar_vendido, args=(mueble_id, False, tarjeta))
+                    else:
+                        st.button(f"✔️ Marcar como vendido", key=f"vendido_{mueble_id}",
+                                  on_click=al_marcar_vendido, args=(mueble_id, True, tarjeta))
+
+# --- Listado paginado ---
+# La sesión solo recuerda cuántas páginas se han cargado con los filtros
+# actuales; cada página sale de la caché compartida, encadenando cursores.
+TAMANOS_PAGINA = [12, 24, 48]
+
+def obtener_listado(filtros):
+    estado = st.session_state.get('listado')
+    if not estado or estado['filtros'] != filtros:
+        estado = {'filtros': filtros, 'paginas': 1}
+        st.session_state['listado'] = estado
+    tienda, tipo, orden, tamano_pagina = filtros
+    version = get_versiones().version("listado")
+    instantanea = cargar_instantanea(version)
+    if instantanea is not None:
+        return instantanea.listado(tienda, tipo, orden, limite=estado['paginas'] * tamano_pagina)
+    muebles, imagenes, cursor = [], {}, None
+    for _ in range(estado['paginas']):
+        filas, cursor, imagenes_pagina = cargar_pagina(tienda, tipo, orden, cursor, tamano_pagina, version)
+        muebles.extend(filas)
+        imagenes.update(imagenes_pagina)
+        if cursor is None:
+            break
+    return muebles, imagenes, cursor is None
+
+# Los enlaces compartidos (?id=) solo necesitan ese mueble, no el listado
+if mueble_id_destacado is not None:
+    seccion("detalle")
+    mostrar_detalle_mueble(mueble_id_destacado)
+    terminar_perfil()
+    st.stop()
+
+seccion("busqueda")
 if 'filtro_nombre' not in st.session_state:
     st.session_state.filtro_nombre = ""
 
-filtro_nombre = st.text_input("🔍 Buscar por nombre", value=st.session_state.filtro_nombre)
+# Búsqueda al escribir: componente propio que envía el texto tras 300 ms sin teclear
+busqueda_en_vivo = st.components.v1.declare_component(
+    "busqueda_en_vivo",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "componentes", "busqueda_en_vivo"),
+)
+
+col_busqueda, col_modo = st.columns([5, 1])
+with col_modo:
+    en_vivo = st.toggle("⚡ Al escribir", key="modo_busqueda_en_vivo", help="Buscar mientras escribes")
+with col_busqueda:
+    if en_vivo:
+        st.markdown("🔍 Buscar por nombre")
+        filtro_nombre = busqueda_en_vivo(valor=st.session_state.filtro_nombre, espera_ms=300,
+                                         placeholder="Cómoda, espejo isabelino…",
+                                         key="busqueda_vivo", default=st.session_state.filtro_nombre)
+    else:
+        filtro_nombre = st.text_input("🔍 Buscar por nombre", value=st.session_state.filtro_nombre)
+filtro_nombre = (filtro_nombre or "").strip()
 if filtro_nombre != st.session_state.filtro_nombre:
     st.session_state.filtro_nombre = filtro_nombre
 
-if filtro_nombre:
-    query += " AND LOWER(nombre) LIKE %s"
-    params.append(f"%{filtro_nombre.lower()}%")
+
+# --- Análisis de ventas (admin) ---
+# Solo lee los resúmenes diarios de ventas.py: tarda lo mismo con cien ventas
+# que con cien mil. Es un fragmento para que cambiar el periodo no repinte la página.
+PERIODOS_VENTAS = {"Últimos 30 días": 30, "Últimos 90 días": 90, "Último año": 365}
+
+def _porcentaje(valor):
+    return f"{valor:.0%}" if valor is not None else "—"
+
+def _redondeo(valor, decimales=0):
+    return round(valor, decimales) if valor is not None else None
+
+@st.fragment
+@perfilado("analisis_ventas")
+def panel_ventas():
+    col1, col2 = st.columns(2)
+    with col1:
+        periodo = st.selectbox("Periodo", list(PERIODOS_VENTAS), key="ventas_periodo")
+    with col2:
+        tienda = st.selectbox("Tienda", ["Todas", "El Rastro", "Regueros"], key="ventas_tienda")
+    hasta = date.today()
+    desde = hasta - timedelta(days=PERIODOS_VENTAS[periodo] - 1)
+    preparar_resumen_ventas(hasta)
+    resumen = cargar_resumen_ventas(desde, hasta, tienda if tienda != "Todas" else None,
+                                    get_versiones().version("ventas"))
+
+    totales = resumen["totales"]
+    cols = st.columns(5)
+    cols[0].metric("💶 Ingresos", f"{totales['ingresos']:,.0f} €")
+    cols[1].metric("🧾 Ventas", totales["ventas"])
+    cols[2].metric("🎟️ Ticket medio", f"{totales['ticket_medio']:,.0f} €" if totales["ticket_medio"] else "—")
+    cols[3].metric("⏱️ Días en tienda", f"{totales['dias_medios']:.0f}" if totales["dias_medios"] is not None else "—",
+                   help="Media de días desde el alta hasta la venta")
+    cols[4].metric("🔄 Sell-through", _porcentaje(totales["sell_through"]),
+                   help="Vendidos / (vendidos + en venta)")
+
+    if resumen["por_dia"]:
+        st.markdown("**Ingresos por día**")
+        st.bar_chart(resumen["por_dia"], x="dia", y="ingresos", x_label="", y_label="€")
+
+    st.markdown("**Velocidad por banda de precio**")
+    st.dataframe([{
+        "Precio": f["banda"], "Ventas": f["ventas"], "Ventas/mes": _redondeo(f["ventas_al_mes"], 1),
+        "Días en tienda": _redondeo(f["dias_medios"]), "Ingresos (€)": _redondeo(f["ingresos"]),
+        "En venta": f["en_venta"], "Sell-through": _porcentaje(f["sell_through"]),
+    } for f in resumen["por_banda"]], hide_index=True, use_container_width=True)
+
+    if resumen["por_tipo"]:
+        st.markdown("**Por tipo de mueble**")
+        st.dataframe([{
+            "Tipo": TIPOS_PLURAL.get(f["tipo"], f["tipo"]) or "Sin tipo", "Ventas": f["ventas"],
+            "Ingresos (€)": _redondeo(f["ingresos"]), "Días en tienda": _redondeo(f["dias_medios"]),
+            "En venta": f["en_venta"], "Sell-through": _porcentaje(f["sell_through"]),
+        } for f in resumen["por_tipo"]], hide_index=True, use_container_width=True)
+
+    if resumen["existencias_a"]:
+        st.caption(f"Existencias según la foto del {resumen['existencias_a']:%d/%m/%Y}.")
+    else:
+        st.caption("Aún no hay foto de existencias: sin ella no se calcula el sell-through.")
 
 
-tab1, tab2 = st.tabs(["📦 En venta", "💰 Vendidos"])
+seccion("listado")
+pestanas = ["📦 En venta", "💰 Vendidos"] + (["📈 Análisis"] if st.session_state.es_admin else [])
+tab1, tab2, *tab_analisis = st.tabs(pestanas)
 
 # Pestaña 1: En venta
 with tab1:
@@ -690,211 +1121,93 @@ with tab1:
         filtro_tienda = st.selectbox("Filtrar por tienda", ["Todas", "El Rastro", "Regueros"])
     
     with col_filtros[1]:
-        c.execute("SELECT DISTINCT tipo FROM muebles")
-        tipos_db = [tipo["tipo"] for tipo in c.fetchall()]
+        tipos_db = cargar_tipos(get_versiones().version("tipos"))
         opciones_filtro = ["Todos"] + [TIPOS_PLURAL.get(tipo, tipo) for tipo in tipos_db]
         filtro_tipo_plural = st.selectbox("Filtrar por tipo", opciones_filtro)
         tipo_para_consulta = next((k for k, v in TIPOS_PLURAL.items() if v == filtro_tipo_plural), filtro_tipo_plural) if filtro_tipo_plural != "Todos" else None
     
     with col_filtros[2]:
-        orden = st.selectbox("Ordenar por", ["Más reciente", "Más antiguo", "Precio (↑)", "Precio (↓)"])
-    
-    # Consulta con parámetros
-    query = "SELECT * FROM muebles WHERE vendido = FALSE"
-    params = []
-    
-    if filtro_tienda != "Todas":
-        query += " AND tienda = %s"
-        params.append(filtro_tienda)
-    
-    if filtro_tipo_plural != "Todos":
-        query += " AND tipo = %s"
-        params.append(tipo_para_consulta)
-    
-    if orden == "Más reciente":
-        query += " ORDER BY id DESC"
-    elif orden == "Más antiguo":
-        query += " ORDER BY id ASC"
-    elif orden == "Precio (↑)":
-        query += " ORDER BY precio ASC"
+        orden = st.selectbox("Ordenar por", list(ORDENES))
+
+    with col_filtros[3]:
+        tamano_pagina = st.selectbox("Por página", TAMANOS_PAGINA, index=1)
+
+    if filtro_nombre:
+        # Con búsqueda, los resultados van ordenados por relevancia
+        muebles, imagenes_listado = cargar_busqueda(
+            filtro_nombre,
+            filtro_tienda if filtro_tienda != "Todas" else None,
+            tipo_para_consulta,
+            get_versiones().version("listado"),
+        )
+        listado_completo = True
+        st.caption(f"{len(muebles)} resultados para «{filtro_nombre}», por relevancia")
     else:
-        query += " ORDER BY precio DESC"
-    
-    c.execute(query, params)
-    muebles = c.fetchall()
+        muebles, imagenes_listado, listado_completo = obtener_listado((
+            filtro_tienda if filtro_tienda != "Todas" else None,
+            tipo_para_consulta,
+            orden,
+            tamano_pagina,
+        ))
 
     if not muebles:
         st.info("No hay muebles disponibles")
     else:
-        mueble_destacado = st.session_state.get('mueble_destacado')
-
         for mueble in muebles:
-            if mueble_destacado and mueble['id'] != mueble_destacado:
-                continue  # solo mostrar el mueble solicitado por parámetro ?id=
-
-            with st.container(border=True):
-                col_img, col_info = st.columns([1, 3])
-                
-                with col_img:
-                    c.execute("""
-                        SELECT imagen_base64, es_principal 
-                        FROM imagenes_muebles 
-                        WHERE mueble_id = %s
-                        ORDER BY es_principal DESC
-                    """, (mueble['id'],))
-                    imagenes_mueble = c.fetchall()
-                    
-                    if imagenes_mueble:
-                        try:
-                            mostrar_galeria_imagenes(imagenes_mueble, mueble['id'])
-                        except:
-                            st.warning("Error al cargar imágenes")
-                
-                with col_info:
-                    st.markdown(f"### {mueble['nombre']}")
-                    if es_nuevo(mueble['fecha']):
-                        st.markdown("<span style='color: green; font-size: 1.2em;'>🆕 Nuevo</span>", unsafe_allow_html=True)
-                    st.markdown(f"**Tipo:** {mueble['tipo']}")
-                    st.markdown(f"**Precio:** {mueble['precio']} €")
-                    st.markdown(f"**Tienda:** {mueble['tienda']}")
-                    st.markdown(f"**Medidas:** {mostrar_medidas_extendido(mueble)}")
-                    fecha_formateada = mueble['fecha'].strftime("%d/%m/%Y")
-                    st.markdown(f"**Fecha registro:** {fecha_formateada}")
-
-
-                    desc = mueble['descripcion']
-                    if desc:
-                        if len(desc) > 200:
-                            resumen = desc[:200] + "..."
-                            if st.button(f"🔎 Ver más", key=f"desc_{mueble['id']}"):
-                                st.markdown(f"**Descripción completa:** {desc}")
-                            else:
-                                st.markdown(f"**Descripción:** {resumen}")
-                        else:
-                            st.markdown(f"**Descripción:** {desc}")
-
-                    import urllib.parse
-                    share_url = f"https://muebles-app-kntlnhehoh6c2o9bbvofft.streamlit.app/?id={mueble['id']}"
-                    mensaje = f"Mira este mueble: {share_url}"
-                    mensaje_codificado = urllib.parse.quote(mensaje)
-                    whatsapp_url = f"https://wa.me/?text={mensaje_codificado}"
-                    st.markdown(f"[📱 Compartir por WhatsApp]({whatsapp_url})", unsafe_allow_html=True)
-
-                    if st.session_state.get('editar_mueble_id') == mueble['id']:
-                        mostrar_formulario_edicion(mueble['id'])
-
-                    if st.session_state.es_admin:
-                        col1, col2, col3 = st.columns(3)
-
-                        with col1:
-                            if st.button(f"✏️ Editar", key=f"editar_{mueble['id']}"):
-                                st.session_state['editar_mueble_id'] = mueble['id']
-                                st.rerun()
-
-                        with col2:
-                            if st.button(f"🗑️ Eliminar", key=f"eliminar_{mueble['id']}"):
-                                if st.session_state.get(f'confirm_eliminar_{mueble["id"]}'):
-                                    c.execute("DELETE FROM imagenes_muebles WHERE mueble_id = %s", (mueble['id'],))
-                                    c.execute("DELETE FROM muebles WHERE id = %s", (mueble['id'],))
-                                    conn.commit()
-                                    st.rerun()
-                                else:
-                                    st.session_state[f'confirm_eliminar_{mueble["id"]}'] = True
-                                    st.rerun()
-
-                            if st.session_state.get(f'confirm_eliminar_{mueble["id"]}'):
-                                st.warning("¿Confirmar eliminación?")
-
-                        with col3:
-                            if st.button(f"✔️ Marcar como vendido", key=f"vendido_{mueble['id']}"):
-                                c.execute("UPDATE muebles SET vendido = TRUE WHERE id = %s", (mueble['id'],))
-                                conn.commit()
-                                st.rerun()
-
-        # Limpiar el estado tras mostrar el mueble
-        if mueble_destacado:
-            st.session_state.pop('mueble_destacado', None)
+            tarjeta_mueble(mueble, imagenes_listado.get(mueble['id'], []),
+                           get_versiones().version_mueble(mueble['id']))
+
+        if not listado_completo:
+            if st.button("⬇️ Cargar más", key="cargar_mas", use_container_width=True):
+                st.session_state['listado']['paginas'] += 1
+                st.rerun()
 
 
 # Pestaña 2: Vendidos (solo para admin)
+seccion("vendidos")
 with tab2:
     if st.session_state.es_admin:
         st.markdown('<h2 class="vendidos-title">✔️ Muebles vendidos</h2>', unsafe_allow_html=True)
-        c.execute("SELECT * FROM muebles WHERE vendido = TRUE ORDER BY fecha DESC")
-        muebles_vendidos = c.fetchall()
+        with db_cursor() as c:
+            muebles_vendidos = listar_vendidos(c)
+            imagenes_vendidos = principales_por_mueble(c, [m['id'] for m in muebles_vendidos])
         
         if not muebles_vendidos:
             st.info("No hay muebles vendidos registrados")
         else:
             for mueble in muebles_vendidos:
-                with st.container(border=True):
-                    col_img, col_info = st.columns([1, 3])
-                    
-                    with col_img:
-                        c.execute("""
-                            SELECT imagen_base64, es_principal 
-                            FROM imagenes_muebles 
-                            WHERE mueble_id = %s
-                            ORDER BY es_principal DESC
-                        """, (mueble['id'],))
-                        imagenes_mueble = c.fetchall()
-                        
-                        if imagenes_mueble:
-                            try:
-                                mostrar_galeria_imagenes(imagenes_mueble, mueble['id'])
-                            except:
-                                st.warning("Error al cargar imágenes")
-                                        
-                    with col_info:
-                        st.markdown(f"### {mueble['nombre']}")
-                        if es_nuevo(mueble['fecha']):
-                            st.markdown("<span style='color: green; font-size: 1.2em;'>🆕 Nuevo</span>", unsafe_allow_html=True)
-                        st.markdown(f"**Tipo:** {mueble['tipo']}")
-                        st.markdown(f"**Precio:** {mueble['precio']} €")
-                        st.markdown(f"**Tienda:** {mueble['tienda']}")
-                        st.markdown(f"**Medidas:** {mostrar_medidas_extendido(mueble)}")
-
-                        st.markdown(f"**Fecha registro:** {mueble['fecha']}")
-                        
-                        if mueble['descripcion']:
-                            st.markdown(f"**Descripción:** {mueble['descripcion']}")
-                        
-                        if st.session_state.get('editar_mueble_id') == mueble['id']:
-                            mostrar_formulario_edicion(mueble['id'])
-                        
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            if st.button(f"✏️ Editar", key=f"editar_v_{mueble['id']}"):
-                                st.session_state['editar_mueble_id'] = mueble['id']
-                                st.rerun()
-                        
-                        with col2:
-                            if st.button(f"🗑️ Eliminar", key=f"eliminar_v_{mueble['id']}"):
-                                if st.session_state.get(f'confirm_eliminar_v_{mueble['id']}'):
-                                    c.execute("DELETE FROM imagenes_muebles WHERE mueble_id = %s", (mueble['id'],))
-                                    c.execute("DELETE FROM muebles WHERE id = %s", (mueble['id'],))
-                                    conn.commit()
-                                    st.rerun()
-                                else:
-                                    st.session_state[f'confirm_eliminar_v_{mueble['id']}'] = True
-                                    st.rerun()
-                            
-                            if st.session_state.get(f"confirm_eliminar_v_{mueble['id']}"):
-                                st.warning("¿Confirmar eliminación?")
-                        
-                        with col3:
-                            if st.button(f"↩️ Marcar como disponible", key=f"revertir_{mueble['id']}"):
-                                c.execute("UPDATE muebles SET vendido = FALSE WHERE id = %s", (mueble['id'],))
-                                conn.commit()
-                                st.rerun()
+                tarjeta_mueble(mueble, imagenes_vendidos.get(mueble['id'], []),
+                               get_versiones().version_mueble(mueble['id']), "vendidos")
     else:
         st.info("🔒 Esta sección solo está disponible para administradores")
 
-# Cerrar conexión
-if 'conn' in locals():
-    conn.close()
-
-
-
-
+# Pestaña 3: Análisis de ventas (solo admin)
+if tab_analisis:
+    seccion("analisis_ventas")
+    with tab_analisis[0]:
+        panel_ventas()
+
+# --- Panel de rendimiento (oculto: admin y ?perfil=1 en la URL) ---
+def mostrar_panel_perfil():
+    recientes = perfiles_recientes(10)
+    if not recientes:
+        st.caption("Aún no hay ejecuciones medidas")
+        return
+    st.markdown("**Últimas ejecuciones**")
+    st.dataframe([{**p.resumen(), "fecha": datetime.fromtimestamp(p.fecha).strftime("%H:%M:%S")}
+                  for p in recientes], hide_index=True, use_container_width=True)
+    st.markdown("**Consultas más lentas**")
+    st.dataframe(consultas_lentas(10), hide_index=True, use_container_width=True)
+    elegida = st.selectbox("Desglose de", range(len(recientes)), key="perfil_elegido",
+                           format_func=lambda i: f"{recientes[i].nombre} · "
+                                                 f"{recientes[i].resumen()['ms']:.0f} ms · "
+                                                 f"{datetime.fromtimestamp(recientes[i].fecha):%H:%M:%S}")
+    st.markdown(html_llamas(recientes[elegida]), unsafe_allow_html=True)
+    st.download_button("📈 Métricas (Prometheus)", METRICAS.prometheus(), "muebles.prom", "text/plain",
+                       on_click="ignore")
+
+if st.session_state.es_admin and st.query_params.get("perfil"):
+    with st.expander("⏱️ Perfil de ejecuciones", expanded=True):
+        mostrar_panel_perfil()
+
+terminar_perfil()
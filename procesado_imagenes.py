@@ -0,0 +1,64 @@
+# --- Procesado de imágenes subidas: variantes en varios tamaños y formatos ---
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+
+# Anchos de las variantes: miniatura de galería, tarjeta del listado y vista completa
+TAMANOS = (160, 400, 800)
+FORMATOS = ("webp", "avif") if features.check("avif") else ("webp",)
+CALIDAD = {"webp": 85, "avif": 60}
+
+
+def _codificar(img, formato):
+    buffered = BytesIO()
+    img.save(buffered, format=formato.upper(), quality=CALIDAD[formato])
+    return buffered.getvalue()
+
+
+def generar_variantes(origen, tamanos=TAMANOS, formatos=FORMATOS):
+    """Devuelve {(formato, tamaño): (bytes, ancho, alto)} a partir de un fichero o bytes.
+
+    Es una función de módulo sin estado para poder ejecutarse en un
+    ProcessPoolExecutor.
+    """
+    if isinstance(origen, (bytes, bytearray)):
+        origen = BytesIO(origen)
+    img = Image.open(origen)
+    # JPEG: decodificar ya a escala 1/2, 1/4 u 1/8 en vez de a resolución completa
+    mayor = max(tamanos)
+    img.draft("RGB", (mayor, mayor))
+    # Fotos de móvil: girar según la orientación EXIF antes de redimensionar
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    variantes = {}
+    # De mayor a menor: cada reducción parte de la anterior, que ya es pequeña
+    for tamano in sorted(tamanos, reverse=True):
+        if max(img.size) > tamano:
+            img = img.copy()
+            img.thumbnail((tamano, tamano))
+        for formato in formatos:
+            variantes[(formato, tamano)] = (_codificar(img, formato), img.width, img.height)
+    return variantes
+
+
+# st.image solo deja pasar tal cual JPEG o PNG de hasta este ancho; cualquier
+# otra cosa (WEBP, fotos enormes) la decodifica y recodifica en cada rerun
+ANCHO_MAX_STREAMLIT = 2 * 730
+
+
+def preparar_para_mostrar(datos):
+    """Bytes que st.image puede enviar sin tocarlos: JPEG (o PNG si hay transparencia)."""
+    img = Image.open(BytesIO(datos))
+    if img.format in ("JPEG", "PNG") and img.width <= ANCHO_MAX_STREAMLIT:
+        return datos
+    if img.width > ANCHO_MAX_STREAMLIT:
+        img.draft("RGB", (ANCHO_MAX_STREAMLIT, ANCHO_MAX_STREAMLIT))
+        img = img.copy()
+        img.thumbnail((ANCHO_MAX_STREAMLIT, ANCHO_MAX_STREAMLIT * 10))
+    salida = BytesIO()
+    if img.mode in ("RGBA", "LA", "P") or "transparency" in img.info:
+        img.save(salida, format="PNG")
+    else:
+        img.convert("RGB").save(salida, format="JPEG", quality=90)
+    return salida.getvalue()
@@ -0,0 +1,439 @@
+# --- Capa de acceso a datos del catálogo ---
+# Las funciones reciben un cursor (RealDictCursor) para poder agruparse en una
+# misma transacción desde la app, los scripts de línea de comandos o el worker.
+from collections import defaultdict
+
+from psycopg2.extras import Json, execute_values
+
+from ventas import registrar_ventas
+
+# Columnas que lee la app; se listan explícitamente para no arrastrar
+# columnas auxiliares como el tsvector de búsqueda
+COLUMNAS_MUEBLE = """
+    id, nombre, precio, descripcion, tienda, vendido, tipo, fecha, fecha_venta,
+    alto, largo, fondo, diametro, diametro_base, diametro_boca,
+    alto_respaldo, alto_asiento, ancho
+"""
+
+
+def imagenes_por_mueble(c, mueble_ids):
+    """Carga en una sola consulta las imágenes de varios muebles.
+
+    Devuelve {mueble_id: [filas]} con la imagen principal primero.
+    """
+    ids = list(dict.fromkeys(mueble_ids))
+    if not ids:
+        return {}
+    c.execute("""
+        SELECT id, mueble_id, clave, formato, ancho, alto, variantes, imagen_base64, es_principal
+        FROM imagenes_muebles
+        WHERE mueble_id = ANY(%s)
+        ORDER BY mueble_id, es_principal DESC
+    """, (ids,))
+    agrupadas = defaultdict(list)
+    for fila in c.fetchall():
+        agrupadas[fila["mueble_id"]].append(fila)
+    return dict(agrupadas)
+
+
+def principales_por_mueble(c, mueble_ids):
+    """Solo la imagen principal de cada mueble, con el total de imágenes en `total`.
+
+    Devuelve el mismo formato que imagenes_por_mueble() (listas de una fila);
+    las secundarias se cargan aparte cuando se abre la galería.
+    """
+    ids = list(dict.fromkeys(mueble_ids))
+    if not ids:
+        return {}
+    c.execute("""
+        SELECT DISTINCT ON (mueble_id)
+               id, mueble_id, clave, formato, ancho, alto, variantes, imagen_base64, es_principal,
+               COUNT(*) OVER (PARTITION BY mueble_id) AS total
+        FROM imagenes_muebles
+        WHERE mueble_id = ANY(%s)
+        ORDER BY mueble_id, es_principal DESC
+    """, (ids,))
+    return {fila["mueble_id"]: [fila] for fila in c.fetchall()}
+
+
+def asegurar_busqueda(c):
+    c.execute("CREATE EXTENSION IF NOT EXISTS unaccent SCHEMA public")
+    c.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public")
+    # unaccent() no es IMMUTABLE y no se puede indexar; este envoltorio sí
+    c.execute("""
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+    c.execute("""
+        ALTER TABLE muebles ADD COLUMN IF NOT EXISTS busqueda tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('spanish', f_unaccent(coalesce(nombre, ''))), 'A') ||
+            setweight(to_tsvector('spanish', f_unaccent(coalesce(descripcion, ''))), 'B')
+        ) STORED
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS muebles_busqueda_idx ON muebles USING gin (busqueda)")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS muebles_nombre_trgm_idx
+        ON muebles USING gin (f_unaccent(lower(nombre)) gin_trgm_ops)
+    """)
+
+
+# Estado anterior de la fila, bloqueada: para apuntar solo los cambios reales de vendido
+_ANTES = "FROM (SELECT id, vendido FROM muebles WHERE id = %s FOR UPDATE) antes WHERE m.id = antes.id"
+
+
+def marcar_vendido(c, mueble_id, vendido):
+    c.execute(f"""
+        UPDATE muebles m
+        SET vendido = %s, fecha_venta = CASE WHEN %s THEN COALESCE(m.fecha_venta, NOW()) END
+        {_ANTES}
+        RETURNING antes.vendido AS antes
+    """, (vendido, vendido, mueble_id))
+    fila = c.fetchone()
+    if fila and fila["antes"] != vendido:
+        registrar_ventas(c, [mueble_id], vendido)
+
+
+# --- Imágenes en el almacén direccionado por contenido ---
+def _filas_imagenes(mueble_id, imagenes, primera_principal):
+    return [(int(mueble_id), im["clave"], im["formato"], im["ancho"], im["alto"], im["bytes"],
+             Json(im["variantes"]), primera_principal and i == 0)
+            for i, im in enumerate(imagenes)]
+
+
+def _insertar_filas_imagenes(c, filas):
+    if not filas:
+        return
+    execute_values(c, """
+        INSERT INTO imagenes_muebles (mueble_id, clave, formato, ancho, alto, bytes, variantes, es_principal)
+        VALUES %s
+    """, filas, page_size=1000)
+
+
+def insertar_imagenes(c, mueble_id, imagenes, primera_principal=False):
+    """Inserta en un solo INSERT las imágenes ya guardadas en el almacén.
+
+    `imagenes` son dicts con clave, formato, ancho, alto, bytes y variantes.
+    """
+    _insertar_filas_imagenes(c, _filas_imagenes(mueble_id, imagenes, primera_principal))
+
+
+def insertar_imagenes_muebles(c, imagenes_por_id):
+    """Como insertar_imagenes, para varios muebles a la vez: {mueble_id: [imágenes]}.
+
+    La primera imagen de cada mueble queda como principal.
+    """
+    _insertar_filas_imagenes(c, [fila for mueble_id, imagenes in imagenes_por_id.items()
+                                 for fila in _filas_imagenes(mueble_id, imagenes, True)])
+
+
+# Columnas que se rellenan al dar de alta un mueble
+CAMPOS_ALTA = (
+    "nombre", "precio", "descripcion", "tienda", "vendido", "tipo", "fecha", "fecha_venta",
+    "alto", "largo", "fondo", "diametro", "diametro_base", "diametro_boca",
+    "alto_respaldo", "alto_asiento", "ancho",
+)
+
+
+def insertar_muebles(c, muebles):
+    """Da de alta varios muebles en un solo INSERT ... RETURNING id.
+
+    `muebles` son dicts con CAMPOS_ALTA (los que falten van a NULL). Devuelve
+    los ids en el mismo orden.
+    """
+    if not muebles:
+        return []
+    filas = execute_values(
+        c,
+        f"INSERT INTO muebles ({', '.join(CAMPOS_ALTA)}) VALUES %s RETURNING id",
+        [tuple(m.get(campo) for campo in CAMPOS_ALTA) for m in muebles],
+        # Una sola sentencia: RETURNING devuelve las filas en el orden de VALUES
+        page_size=len(muebles),
+        fetch=True,
+    )
+    ids = [f["id"] for f in filas]
+    registrar_ventas(c, [i for i, m in zip(ids, muebles) if m.get("vendido")], True)
+    return ids
+
+
+def crear_mueble(c, mueble, imagenes=()):
+    """Alta de un mueble con sus imágenes: INSERT ... RETURNING id y un INSERT por lotes.
+
+    Todo va en la transacción de `c`: o queda el mueble con sus fotos o nada.
+    """
+    mueble_id = insertar_muebles(c, [mueble])[0]
+    insertar_imagenes(c, mueble_id, list(imagenes), primera_principal=True)
+    return mueble_id
+
+
+# Columnas que se cambian desde el formulario de edición
+CAMPOS_EDICION = (
+    "nombre", "precio", "descripcion", "tienda", "vendido",
+    "alto", "largo", "fondo", "diametro", "diametro_base", "diametro_boca",
+    "alto_respaldo", "alto_asiento", "ancho",
+)
+
+
+def actualizar_mueble(c, mueble_id, campos, imagenes=(), primera_principal=False):
+    """Guarda la edición y añade las imágenes nuevas. Devuelve False si el mueble ya no existe."""
+    asignaciones = ", ".join(f"{campo} = %s" for campo in CAMPOS_EDICION)
+    vendido = bool(campos.get("vendido"))
+    c.execute(f"""
+        UPDATE muebles m SET {asignaciones},
+            fecha_venta = CASE WHEN %s THEN COALESCE(m.fecha_venta, NOW()) END
+        {_ANTES}
+        RETURNING antes.vendido AS antes
+    """, [campos.get(campo) for campo in CAMPOS_EDICION] + [vendido, mueble_id])
+    fila = c.fetchone()
+    if fila is None:
+        return False
+    if fila["antes"] != vendido:
+        registrar_ventas(c, [mueble_id], vendido)
+    insertar_imagenes(c, mueble_id, list(imagenes), primera_principal=primera_principal)
+    return True
+
+
+def _filtro_imagen(fila):
+    # Por clave primaria (migración 4); el base64 solo si la fila es anterior
+    if fila.get("id") is not None:
+        return "id = %s", fila["id"]
+    if fila.get("clave"):
+        return "clave = %s", fila["clave"]
+    return "imagen_base64 = %s", fila["imagen_base64"]
+
+
+def borrar_imagen(c, mueble_id, fila):
+    """Borra la imagen y devuelve las claves del almacén que usaba."""
+    condicion, valor = _filtro_imagen(fila)
+    c.execute(f"""
+        DELETE FROM imagenes_muebles WHERE mueble_id = %s AND {condicion}
+        RETURNING clave, variantes
+    """, (mueble_id, valor))
+    return [clave for f in c.fetchall() for clave in claves_de_fila(f)]
+
+
+def marcar_imagen_principal(c, mueble_id, fila):
+    # Una sola sentencia: la elegida a TRUE y el resto a FALSE
+    condicion, valor = _filtro_imagen(fila)
+    c.execute(f"UPDATE imagenes_muebles SET es_principal = COALESCE({condicion}, FALSE) WHERE mueble_id = %s",
+              (valor, mueble_id))
+
+
+def claves_de_mueble(c, mueble_id):
+    c.execute("SELECT clave, variantes FROM imagenes_muebles WHERE mueble_id = %s AND clave IS NOT NULL", (mueble_id,))
+    return [clave for f in c.fetchall() for clave in claves_de_fila(f)]
+
+
+def borrar_mueble(c, mueble_id):
+    """Borra el mueble (sus imágenes caen por ON DELETE CASCADE).
+
+    Devuelve las claves del almacén que usaban sus imágenes, para pasarlas a
+    borrar_blobs_sin_referencias() una vez confirmada la transacción.
+    """
+    # Un solo viaje: la CTE lee las imágenes antes de que las borre la cascada
+    c.execute("""
+        WITH borrado AS (DELETE FROM muebles WHERE id = %s RETURNING id)
+        SELECT clave, variantes FROM imagenes_muebles
+        WHERE mueble_id = %s AND clave IS NOT NULL
+    """, (mueble_id, mueble_id))
+    return [clave for f in c.fetchall() for clave in claves_de_fila(f)]
+
+
+def claves_de_fila(fila):
+    """Todas las claves del almacén que usa una fila: la original y sus variantes."""
+    claves = [fila["clave"]] if fila.get("clave") else []
+    for por_tamano in (fila.get("variantes") or {}).values():
+        claves.extend(por_tamano.values())
+    return claves
+
+
+def borrar_blobs_sin_referencias(c, almacen, claves):
+    """Borra del almacén las claves que ya no usa ninguna fila (el mismo contenido
+    puede estar compartido entre varias imágenes) ni ningún trabajo por hacer
+    (los originales de procesar_imagenes, que se reintenta)."""
+    claves = list(set(claves))
+    if not claves:
+        return
+    c.execute("""
+        SELECT clave FROM imagenes_muebles WHERE clave = ANY(%(claves)s)
+        UNION
+        SELECT v.clave
+        FROM imagenes_muebles,
+             jsonb_each(COALESCE(variantes, '{}'::jsonb)) AS f(formato, por_tamano),
+             jsonb_each_text(por_tamano) AS v(tamano, clave)
+        WHERE v.clave = ANY(%(claves)s)
+        UNION
+        SELECT o.clave
+        FROM trabajos, jsonb_array_elements_text(datos->'originales') AS o(clave)
+        WHERE tipo = 'procesar_imagenes' AND estado IN ('pendiente', 'en_curso')
+          AND o.clave = ANY(%(claves)s)
+    """, {"claves": claves})
+    en_uso = {f["clave"] for f in c.fetchall()}
+    for clave in claves:
+        if clave not in en_uso:
+            almacen.borrar(clave)
+
+
+# --- Listado en venta con paginación por clave (keyset) ---
+# Cada orden lleva el id como desempate para que el cursor sea único
+ORDENES = {
+    "Más reciente": ("id", "DESC"),
+    "Más antiguo": ("id", "ASC"),
+    "Precio (↑)": ("precio", "ASC"),
+    "Precio (↓)": ("precio", "DESC"),
+}
+
+
+def listar_disponibles(c, tienda=None, tipo=None, orden="Más reciente", despues=None, limite=24):
+    """Una página de muebles en venta.
+
+    `despues` es el cursor que devolvió la página anterior (None para la primera).
+    Devuelve (filas, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    columna, sentido = ORDENES[orden]
+    condiciones = ["vendido = FALSE"]
+    params = []
+    if tienda:
+        condiciones.append("tienda = %s")
+        params.append(tienda)
+    if tipo:
+        condiciones.append("tipo = %s")
+        params.append(tipo)
+    if despues is not None:
+        comparador = ">" if sentido == "ASC" else "<"
+        if columna == "id":
+            condiciones.append(f"id {comparador} %s")
+        else:
+            condiciones.append(f"(precio, id) {comparador} (%s, %s)")
+        params.extend(despues)
+    orden_sql = f"id {sentido}" if columna == "id" else f"precio {sentido}, id {sentido}"
+
+    c.execute(f"""
+        SELECT {COLUMNAS_MUEBLE} FROM muebles
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY {orden_sql}
+        LIMIT %s
+    """, params + [limite + 1])
+    filas = c.fetchall()
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultimo = filas[-1]
+    cursor = (ultimo["id"],) if columna == "id" else (ultimo["precio"], ultimo["id"])
+    return filas, cursor
+
+
+def listar_todos_disponibles(c, maximo):
+    """Todos los muebles en venta ordenados por id, o None si hay más de `maximo`."""
+    c.execute(f"""
+        SELECT {COLUMNAS_MUEBLE} FROM muebles
+        WHERE vendido = FALSE
+        ORDER BY id
+        LIMIT %s
+    """, (maximo + 1,))
+    filas = c.fetchall()
+    return None if len(filas) > maximo else filas
+
+
+def principales_disponibles(c):
+    """Como principales_por_mueble(), para todos los muebles en venta."""
+    c.execute("""
+        SELECT DISTINCT ON (i.mueble_id)
+               i.id, i.mueble_id, i.clave, i.formato, i.ancho, i.alto, i.variantes,
+               i.imagen_base64, i.es_principal,
+               COUNT(*) OVER (PARTITION BY i.mueble_id) AS total
+        FROM imagenes_muebles i
+        JOIN muebles m ON m.id = i.mueble_id AND m.vendido = FALSE
+        ORDER BY i.mueble_id, i.es_principal DESC
+    """)
+    return {fila["mueble_id"]: [fila] for fila in c.fetchall()}
+
+
+def obtener_mueble(c, mueble_id):
+    """Un mueble por clave primaria con sus imágenes, o (None, []) si no existe."""
+    c.execute(f"SELECT {COLUMNAS_MUEBLE} FROM muebles WHERE id = %s", (mueble_id,))
+    mueble = c.fetchone()
+    if not mueble:
+        return None, []
+    return mueble, imagenes_por_mueble(c, [mueble_id]).get(mueble_id, [])
+
+
+def tipos_en_catalogo(c):
+    c.execute("SELECT DISTINCT tipo FROM muebles")
+    return [f["tipo"] for f in c.fetchall()]
+
+
+def estadisticas(c):
+    """Todas las métricas de la barra lateral en una sola consulta.
+
+    GROUPING SETS da en el mismo recorrido la fila de totales (mes NULL,
+    total = 1) y una fila por mes de venta para el resumen del admin.
+    """
+    c.execute("""
+        SELECT
+            date_trunc('month', fecha_venta) AS mes,
+            GROUPING(date_trunc('month', fecha_venta)) AS total,
+            COUNT(*) FILTER (WHERE NOT vendido AND tienda = 'El Rastro') AS en_rastro,
+            COUNT(*) FILTER (WHERE NOT vendido AND tienda = 'Regueros') AS en_regueros,
+            COUNT(*) FILTER (WHERE vendido) AS vendidos,
+            COALESCE(SUM(precio) FILTER (WHERE NOT vendido AND tienda = 'El Rastro'), 0) AS valor_rastro,
+            COALESCE(SUM(precio) FILTER (WHERE NOT vendido AND tienda = 'Regueros'), 0) AS valor_regueros,
+            COALESCE(SUM(precio) FILTER (WHERE vendido), 0) AS ingresos,
+            AVG(EXTRACT(EPOCH FROM fecha_venta - fecha) / 86400)
+                FILTER (WHERE vendido AND fecha_venta IS NOT NULL) AS dias_medios_venta
+        FROM muebles
+        GROUP BY GROUPING SETS ((), (date_trunc('month', fecha_venta)))
+        ORDER BY mes DESC NULLS LAST
+    """)
+    stats = {"en_rastro": 0, "en_regueros": 0, "vendidos": 0, "valor_rastro": 0,
+             "valor_regueros": 0, "dias_medios_venta": None, "ventas_por_mes": []}
+    for fila in c.fetchall():
+        if fila["total"]:
+            stats.update({k: fila[k] for k in ("en_rastro", "en_regueros", "vendidos", "valor_rastro",
+                                               "valor_regueros", "dias_medios_venta")})
+        elif fila["mes"] is not None:
+            stats["ventas_por_mes"].append({"mes": fila["mes"].strftime("%Y-%m"),
+                                            "ventas": fila["vendidos"], "ingresos": fila["ingresos"]})
+    return stats
+
+
+def listar_vendidos(c):
+    c.execute(f"SELECT {COLUMNAS_MUEBLE} FROM muebles WHERE vendido = TRUE ORDER BY fecha DESC")
+    return c.fetchall()
+
+
+# --- Búsqueda ---
+def buscar_muebles(c, termino, tienda=None, tipo=None, limite=48):
+    """Muebles en venta que coinciden con `termino`, ordenados por relevancia.
+
+    Ignora tildes y mayúsculas ("comoda" encuentra "Cómoda"), aplica stemming
+    en español sobre nombre y descripción y tolera erratas en el nombre
+    mediante similitud de trigramas.
+    """
+    consulta = "websearch_to_tsquery('spanish', f_unaccent(%(termino)s))"
+    texto = "f_unaccent(lower(%(termino)s))"
+    nombre = "f_unaccent(lower(nombre))"
+    condiciones = ["vendido = FALSE", f"""(
+        busqueda @@ {consulta}
+        OR {nombre} LIKE '%%' || f_unaccent(lower(%(literal)s)) || '%%' ESCAPE '\\'
+        OR {texto} <%% {nombre}
+    )"""]
+    # En el LIKE, % y _ del usuario son texto, no comodines
+    literal = termino.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    params = {"termino": termino, "literal": literal, "limite": limite}
+    if tienda:
+        condiciones.append("tienda = %(tienda)s")
+        params["tienda"] = tienda
+    if tipo:
+        condiciones.append("tipo = %(tipo)s")
+        params["tipo"] = tipo
+    c.execute(f"""
+        SELECT {COLUMNAS_MUEBLE},
+               ts_rank(busqueda, {consulta}) * 2 + word_similarity({texto}, {nombre}) AS relevancia
+        FROM muebles
+        WHERE {" AND ".join(condiciones)}
+        ORDER BY relevancia DESC, id DESC
+        LIMIT %(limite)s
+    """, params)
+    return c.fetchall()
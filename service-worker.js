@@ -1,4 +1,4 @@
-const CACHE_NAME = 'v3_cache'; // ⚠️ CAMBIADO para forzar renovación
+const CACHE_NAME = 'v4_cache'; // ⚠️ CAMBIADO para forzar renovación
 const urlsToCache = [
   '/muebles-app/',
   '/muebles-app/manifest.json',
@@ -39,4 +39,3 @@ self.addEventListener('fetch', event => {
     caches.match(event.request).then(response => response || fetch(event.request))
   );
 });
-
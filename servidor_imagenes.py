@@ -0,0 +1,123 @@
+# --- Servidor HTTP de imágenes con URLs por contenido ---
+# Sirve /img/<sha256> desde el almacén de imágenes con caché inmutable, ETag
+# y peticiones Range, para que el navegador reutilice cada foto entre visitas.
+#
+# Desarrollo:  python servidor_imagenes.py --puerto 8502
+# Producción:  gunicorn -w 2 servidor_imagenes:aplicacion
+import argparse
+import re
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+from almacen_imagenes import crear_almacen, tipo_mime
+from db import cargar_secrets
+
+RUTA = re.compile(r"^/img/([0-9a-f]{64})(?:\.(?:webp|avif|jpg|png))?$")
+RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+ESTADOS = {
+    200: "200 OK", 206: "206 Partial Content", 304: "304 Not Modified",
+    404: "404 Not Found", 405: "405 Method Not Allowed", 416: "416 Range Not Satisfiable",
+}
+
+
+def _rango(cabecera, longitud):
+    """(inicio, fin) inclusivos de un único rango "bytes=a-b", o None si no es válido."""
+    m = RANGO.match(cabecera.strip())
+    if not m or m.groups() == ("", ""):
+        return None
+    inicio, fin = m.groups()
+    if inicio == "":
+        # "bytes=-n": los últimos n bytes
+        n = int(fin)
+        if n == 0:
+            return None
+        return max(0, longitud - n), longitud - 1
+    inicio = int(inicio)
+    fin = min(int(fin), longitud - 1) if fin else longitud - 1
+    if inicio > fin or inicio >= longitud:
+        return None
+    return inicio, fin
+
+
+class AplicacionImagenes:
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def __call__(self, environ, start_response):
+        metodo = environ.get("REQUEST_METHOD", "GET")
+        m = RUTA.match(environ.get("PATH_INFO", ""))
+        if not m:
+            return self._responder(start_response, 404, [], b"")
+        if metodo not in ("GET", "HEAD"):
+            return self._responder(start_response, 405, [("Allow", "GET, HEAD")], b"")
+
+        clave = m.group(1)
+        etag = f'"{clave}"'
+        cabeceras = [
+            ("ETag", etag),
+            ("Cache-Control", CACHE_INMUTABLE),
+            ("Accept-Ranges", "bytes"),
+            # Las páginas que las usan (la app, el catálogo publicado) viven en otros orígenes
+            ("Access-Control-Allow-Origin", "*"),
+        ]
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH", "")
+        if etag in if_none_match or if_none_match.strip() == "*":
+            return self._responder(start_response, 304, cabeceras, b"")
+
+        try:
+            datos = self.almacen.leer(clave)
+        except Exception:
+            return self._responder(start_response, 404, [], b"")
+        cabeceras.append(("Content-Type", tipo_mime(datos)))
+
+        estado = 200
+        rango = environ.get("HTTP_RANGE")
+        if rango:
+            limites = _rango(rango, len(datos))
+            if limites is None:
+                return self._responder(start_response, 416,
+                                       cabeceras + [("Content-Range", f"bytes */{len(datos)}")], b"")
+            inicio, fin = limites
+            cabeceras.append(("Content-Range", f"bytes {inicio}-{fin}/{len(datos)}"))
+            datos = datos[inicio:fin + 1]
+            estado = 206
+
+        cuerpo = b"" if metodo == "HEAD" else datos
+        cabeceras.append(("Content-Length", str(len(datos))))
+        start_response(ESTADOS[estado], cabeceras)
+        return [cuerpo]
+
+    def _responder(self, start_response, estado, cabeceras, cuerpo):
+        start_response(ESTADOS[estado], cabeceras + [("Content-Length", str(len(cuerpo)))])
+        return [cuerpo]
+
+
+_aplicacion = None
+
+
+def aplicacion(environ, start_response):
+    """Punto de entrada WSGI; crea el almacén desde secrets.toml en la primera petición."""
+    global _aplicacion
+    if _aplicacion is None:
+        _aplicacion = AplicacionImagenes(crear_almacen(cargar_secrets().get("imagenes")))
+    return _aplicacion(environ, start_response)
+
+
+class ServidorConHilos(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve las imágenes del almacén por HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--puerto", type=int, default=8502)
+    args = parser.parse_args()
+    with make_server(args.host, args.puerto, aplicacion, server_class=ServidorConHilos) as servidor:
+        print(f"Sirviendo imágenes en http://{args.host}:{args.puerto}/img/<clave>")
+        servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# --- Números del CSV en formato español ---
+import pytest
+
+from importar import _numero
+
+
+@pytest.mark.parametrize("texto,valor", [
+    ("1.200", 1200),
+    ("1.200,50", 1200.5),
+    ("12,5", 12.5),
+    ("1200", 1200),
+    ("1.200.000", 1_200_000),
+    ("1.200 €", 1200),
+    ("12.5", 12.5),
+    ("0.75", 0.75),
+    ("", None),
+])
+def test_numero(texto, valor):
+    assert _numero(texto) == valor
+
+
+def test_numero_no_numerico():
+    with pytest.raises(ValueError):
+        _numero("mil")
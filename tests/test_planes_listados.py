@@ -0,0 +1,121 @@
+# --- Planes de los listados: deben usar los índices parciales de m006 ---
+# Siembra un catálogo sintético en un esquema propio, aplica las migraciones y
+# pide EXPLAIN de las consultas reales de repositorio.py. Necesita Postgres:
+#
+#     BENCH_DSN=postgresql://... python -m pytest tests/test_planes_listados.py
+#
+# Sin BENCH_DSN se omite.
+import os
+
+import pytest
+
+from repositorio import ORDENES, imagenes_por_mueble, listar_disponibles, obtener_mueble, principales_por_mueble
+
+pytestmark = pytest.mark.skipif(not os.environ.get("BENCH_DSN"), reason="necesita BENCH_DSN (Postgres de pruebas)")
+
+ESQUEMA = "test_planes"
+FILAS = 20_000
+TABLAS = {"muebles", "imagenes_muebles"}
+
+
+class CursorExplain:
+    """Envuelve un cursor: cada execute() pide el plan en vez de ejecutar."""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.planes = []
+
+    def execute(self, sql, params=None):
+        self.cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        self.planes.append(self.cursor.fetchone()["QUERY PLAN"][0]["Plan"])
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+def nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from nodos(hijo)
+
+
+def recorridos_secuenciales(planes):
+    return [n["Relation Name"] for plan in planes for n in nodos(plan)
+            if n["Node Type"] == "Seq Scan" and n.get("Relation Name") in TABLAS]
+
+
+def indices(planes):
+    return {n["Index Name"] for plan in planes for n in nodos(plan) if "Index Name" in n}
+
+
+@pytest.fixture(scope="module")
+def catalogo():
+    from psycopg2.extras import RealDictCursor
+
+    from bench.sintetico import conectar, crear_esquema, sembrar_imagenes, sembrar_muebles
+    from migraciones import migrar
+
+    conn = conectar()
+    conn.autocommit = True
+    with conn.cursor(cursor_factory=RealDictCursor) as c:
+        crear_esquema(c, ESQUEMA)
+        migrar(c)
+        sembrar_muebles(c, FILAS)
+        sembrar_imagenes(c)
+        c.execute("ANALYZE")
+        c.execute("SELECT id FROM muebles WHERE vendido = FALSE ORDER BY id LIMIT 50")
+        ids = [f["id"] for f in c.fetchall()]
+        yield c, ids
+        c.execute(f"DROP SCHEMA {ESQUEMA} CASCADE")
+    conn.close()
+
+
+def planes(c, consulta):
+    explain = CursorExplain(c)
+    consulta(explain)
+    return explain.planes
+
+
+FILTROS = [(None, None), ("El Rastro", None), (None, "Cómoda"), ("Regueros", "Mesa")]
+
+
+@pytest.mark.parametrize("segunda_pagina", [False, True], ids=["pagina1", "pagina2"])
+@pytest.mark.parametrize("tienda,tipo", FILTROS, ids=lambda v: str(v))
+@pytest.mark.parametrize("orden", list(ORDENES))
+def test_listado_usa_indice_parcial(catalogo, orden, tienda, tipo, segunda_pagina):
+    c, ids = catalogo
+    despues = None
+    if segunda_pagina:
+        despues = (ids[-1],) if ORDENES[orden][0] == "id" else (1000, ids[-1])
+    p = planes(c, lambda cur: listar_disponibles(cur, tienda, tipo, orden, despues, 24))
+
+    assert recorridos_secuenciales(p) == []
+    assert any(i.startswith("muebles_disponibles_") for i in indices(p)), indices(p)
+
+
+def test_principales_de_una_pagina(catalogo):
+    c, ids = catalogo
+    p = planes(c, lambda cur: principales_por_mueble(cur, ids[:24]))
+
+    assert recorridos_secuenciales(p) == []
+    assert "imagenes_muebles_mueble_idx" in indices(p)
+
+
+def test_galeria_de_un_mueble(catalogo):
+    c, ids = catalogo
+    p = planes(c, lambda cur: imagenes_por_mueble(cur, ids[:1]))
+
+    assert recorridos_secuenciales(p) == []
+    assert "imagenes_muebles_mueble_idx" in indices(p)
+
+
+def test_detalle_por_id(catalogo):
+    # Sin filas, obtener_mueble() no llega a pedir las imágenes: esas van en la galería
+    c, ids = catalogo
+    p = planes(c, lambda cur: obtener_mueble(cur, ids[0]))
+
+    assert recorridos_secuenciales(p) == []
+    assert "muebles_pkey" in indices(p)
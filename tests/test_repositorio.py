@@ -0,0 +1,96 @@
+# --- Consultas por página del listado ---
+# Un cursor falso cuenta las consultas que lanza repositorio.py al cargar una
+# página de tarjetas (como cargar_pagina() de la app): las imágenes de toda la
+# página deben llegar en una sola consulta, sea cual sea el tamaño de la página
+# y el del catálogo (sin N+1: el número de consultas no crece con los muebles).
+import pytest
+
+from repositorio import imagenes_por_mueble, listar_disponibles, listar_vendidos, principales_por_mueble
+
+
+class CursorContador:
+    """Imita un RealDictCursor sobre un catálogo de `n` muebles con `fotos` imágenes cada uno."""
+
+    def __init__(self, n, fotos=3):
+        self.muebles = [{"id": i, "precio": 100 + i, "vendido": False} for i in range(n, 0, -1)]
+        self.fotos = fotos
+        self.consultas = []
+        self._filas = []
+
+    def execute(self, sql, params=None):
+        self.consultas.append(sql)
+        if "FROM imagenes_muebles" in sql:
+            ids = params[0]
+            self._filas = [{"id": m * 100 + k, "mueble_id": m, "es_principal": k == 0, "total": self.fotos}
+                           for m in ids for k in range(self.fotos)]
+        elif "FROM muebles" in sql:
+            limite = params[-1] if "LIMIT" in sql else len(self.muebles)
+            self._filas = self.muebles[:limite]
+        else:
+            self._filas = []
+
+    def fetchall(self):
+        return self._filas
+
+    def fetchone(self):
+        return self._filas[0] if self._filas else None
+
+    def de_imagenes(self):
+        return [sql for sql in self.consultas if "imagenes_muebles" in sql]
+
+
+@pytest.mark.parametrize("limite", [1, 24, 96])
+def test_pagina_del_listado_una_consulta_de_imagenes(limite):
+    c = CursorContador(200)
+    filas, siguiente = listar_disponibles(c, limite=limite)
+    principales = principales_por_mueble(c, [m["id"] for m in filas])
+
+    assert len(filas) == limite and siguiente is not None
+    assert set(principales) == {m["id"] for m in filas}
+    assert len(c.de_imagenes()) == 1
+    assert len(c.consultas) == 2
+
+
+def consultas_al_cargar(n, fotos):
+    """Consultas de la primera página, la siguiente y la pestaña de vendidos (que lo lista todo)."""
+    c = CursorContador(n, fotos)
+    filas, siguiente = listar_disponibles(c, limite=24)
+    principales_por_mueble(c, [m["id"] for m in filas])
+    if siguiente:
+        filas, _ = listar_disponibles(c, despues=siguiente, limite=24)
+        principales_por_mueble(c, [m["id"] for m in filas])
+    vendidos = listar_vendidos(c)
+    imagenes = principales_por_mueble(c, [m["id"] for m in vendidos])
+    assert len(imagenes) == n
+    return len(c.consultas), len(c.de_imagenes())
+
+
+@pytest.mark.parametrize("fotos", [1, 5])
+def test_consultas_no_crecen_con_el_catalogo(fotos):
+    # 500 muebles (más de una página) frente a 30: mismas consultas
+    assert consultas_al_cargar(30, fotos) == consultas_al_cargar(500, fotos) == (6, 3)
+
+
+def test_galerias_de_varios_muebles_una_consulta():
+    c = CursorContador(50)
+    imagenes = imagenes_por_mueble(c, [1, 2, 3, 2, 1])
+
+    assert sorted(imagenes) == [1, 2, 3]
+    assert all(len(filas) == 3 for filas in imagenes.values())
+    assert len(c.consultas) == 1
+
+
+def test_pestana_vendidos_una_consulta_de_imagenes():
+    c = CursorContador(40)
+    vendidos = listar_vendidos(c)
+    principales_por_mueble(c, [m["id"] for m in vendidos])
+
+    assert len(c.de_imagenes()) == 1
+
+
+def test_sin_muebles_no_consulta_imagenes():
+    c = CursorContador(0)
+    filas, _ = listar_disponibles(c)
+
+    assert principales_por_mueble(c, [m["id"] for m in filas]) == {}
+    assert c.de_imagenes() == []
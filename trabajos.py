@@ -0,0 +1,326 @@
+# --- Cola de trabajos en segundo plano ---
+# Las operaciones pesadas del admin (procesar fotos, exportar, regenerar
+# variantes, borrar blobs del almacén) se apuntan en la tabla `trabajos` y las
+# ejecuta un worker aparte, fuera de la sesión de Streamlit:
+#
+#     python trabajos.py [--intervalo 1]
+#
+# Se pueden lanzar varios workers: cada uno toma el siguiente trabajo con
+# FOR UPDATE SKIP LOCKED, así que nunca dos cogen el mismo. Un trabajo que
+# falla vuelve a la cola con espera exponencial hasta agotar max_intentos.
+#
+# Cada trabajo se ejecuta en la misma transacción que lo marca como hecho: si
+# el worker muere a medias no queda nada escrito. Mientras ejecuta, el worker
+# refresca cada INTERVALO_LATIDO_S la columna `latido` desde otra conexión; un
+# trabajo en curso sin latido en TIMEOUT_EN_CURSO_MIN vuelve a la cola, por
+# largo que sea. Las tareas deben poder repetirse sin efectos dobles (las
+# escrituras en el almacén lo son: las claves son el contenido).
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+
+from psycopg2.extras import Json
+
+from almacen_imagenes import crear_almacen, guardar_variantes, registro_imagen
+from db import cargar_secrets, crear_pool
+from exportar import exportar_a_temporal, nombre_fichero
+from migraciones import migrar
+from procesado_imagenes import FORMATOS, TAMANOS, generar_variantes
+from repositorio import borrar_blobs_sin_referencias, insertar_imagenes
+from ventas import mantenimiento_diario
+
+logger = logging.getLogger("trabajos")
+
+ESPERA_BASE_S = 5
+ESPERA_MAX_S = 600
+INTERVALO_LATIDO_S = 60
+TIMEOUT_EN_CURSO_MIN = 5
+DIAS_HISTORIAL = 7
+LOTE_VARIANTES = 50
+
+
+# --- Cola ---
+def encolar(c, tipo, datos=None, max_intentos=5):
+    """Apunta un trabajo; se verá cuando se confirme la transacción de `c`."""
+    c.execute("""
+        INSERT INTO trabajos (tipo, datos, max_intentos) VALUES (%s, %s, %s) RETURNING id
+    """, (tipo, Json(datos or {}), max_intentos))
+    return c.fetchone()["id"]
+
+
+def tomar(c):
+    """El siguiente trabajo disponible, ya marcado en_curso; None si no hay."""
+    c.execute("""
+        UPDATE trabajos SET estado = 'en_curso', intentos = intentos + 1, empezado = NOW(), latido = NOW()
+        WHERE id = (
+            SELECT id FROM trabajos
+            WHERE estado = 'pendiente' AND disponible_en <= NOW()
+            ORDER BY disponible_en, id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, tipo, datos, intentos, max_intentos
+    """)
+    return c.fetchone()
+
+
+def latir(c, trabajo_id):
+    c.execute("UPDATE trabajos SET latido = NOW() WHERE id = %s AND estado = 'en_curso'", (trabajo_id,))
+
+
+def terminar(c, trabajo_id, resultado=None):
+    c.execute("""
+        UPDATE trabajos SET estado = 'hecho', terminado = NOW(), error = NULL, resultado = %s
+        WHERE id = %s
+    """, (Json(resultado), trabajo_id))
+
+
+def espera_reintento(intentos):
+    # 5 s, 10 s, 20 s... con un poco de azar para que los fallos no se sincronicen
+    espera = min(ESPERA_MAX_S, ESPERA_BASE_S * 2 ** (intentos - 1))
+    return espera * random.uniform(1.0, 1.25)
+
+
+def fallar(c, trabajo, error):
+    """Devuelve el trabajo a la cola con espera, o lo da por fallido si no le quedan intentos."""
+    if trabajo["intentos"] >= trabajo["max_intentos"]:
+        c.execute("""
+            UPDATE trabajos SET estado = 'fallido', terminado = NOW(), error = %s WHERE id = %s
+        """, (error, trabajo["id"]))
+    else:
+        c.execute("""
+            UPDATE trabajos
+            SET estado = 'pendiente', error = %s,
+                disponible_en = NOW() + make_interval(secs => %s)
+            WHERE id = %s
+        """, (error, espera_reintento(trabajo["intentos"]), trabajo["id"]))
+
+
+def recuperar_atascados(c, minutos=TIMEOUT_EN_CURSO_MIN):
+    """Devuelve a la cola los trabajos en curso cuyo worker dejó de dar señales.
+
+    Los que ya agotaron sus intentos quedan fallidos: un trabajo que tumba al
+    worker no debe repetirse para siempre. Devuelve (devueltos, fallidos).
+    """
+    c.execute("""
+        UPDATE trabajos SET
+            estado = CASE WHEN intentos >= max_intentos THEN 'fallido' ELSE 'pendiente' END,
+            terminado = CASE WHEN intentos >= max_intentos THEN NOW() END,
+            error = CASE WHEN intentos >= max_intentos THEN %s ELSE error END,
+            disponible_en = NOW()
+        WHERE estado = 'en_curso' AND COALESCE(latido, empezado) < NOW() - make_interval(mins => %s)
+        RETURNING estado
+    """, (f"Sin latido en {minutos} min (¿se cayó el worker?) y sin intentos restantes", minutos))
+    estados = [f["estado"] for f in c.fetchall()]
+    return estados.count("pendiente"), estados.count("fallido")
+
+
+def estado_trabajos(c, ids):
+    """{id: fila} con el estado de los trabajos pedidos (para el sondeo de la UI)."""
+    if not ids:
+        return {}
+    c.execute("""
+        SELECT id, tipo, datos, estado, intentos, max_intentos, error, resultado, creado, terminado
+        FROM trabajos WHERE id = ANY(%s)
+    """, (list(ids),))
+    return {f["id"]: f for f in c.fetchall()}
+
+
+def purgar(c, almacen, dias=DIAS_HISTORIAL):
+    """Borra los trabajos terminados hace más de `dias` y los ficheros exportados."""
+    c.execute("""
+        DELETE FROM trabajos
+        WHERE estado IN ('hecho', 'fallido') AND terminado < NOW() - make_interval(days => %s)
+        RETURNING tipo, resultado
+    """, (dias,))
+    claves = {f["resultado"]["clave"] for f in c.fetchall() if f["tipo"] == "exportar" and f["resultado"]}
+    for clave in claves:
+        # Dos exportaciones idénticas comparten clave: solo si ya no la usa ninguna
+        c.execute("SELECT 1 FROM trabajos WHERE tipo = 'exportar' AND resultado->>'clave' = %s", (clave,))
+        if not c.fetchone():
+            almacen.borrar(clave)
+
+
+# --- Tareas ---
+class Contexto:
+    """Lo que necesita una tarea: pool, almacén y acciones para después del commit."""
+
+    def __init__(self, pool, almacen):
+        self.pool = pool
+        self.almacen = almacen
+        self.tras_confirmar = []
+
+
+TAREAS = {}
+
+
+def tarea(nombre):
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+@tarea("procesar_imagenes")
+def procesar_imagenes(c, ctx, mueble_id, originales, primera_principal=False):
+    # `originales`: claves en el almacén de las fotos tal como se subieron
+    imagenes = [registro_imagen(ctx.almacen, generar_variantes(ctx.almacen.leer(clave)))
+                for clave in originales]
+    c.execute("SELECT 1 FROM muebles WHERE id = %s", (mueble_id,))
+    if c.fetchone():
+        insertar_imagenes(c, mueble_id, imagenes, primera_principal=primera_principal)
+    # Los originales ya no hacen falta, pero solo se borran cuando lo anterior es firme
+    ctx.tras_confirmar.append(lambda: _borrar_sin_referencias(ctx, originales))
+    return {"mueble_id": mueble_id, "imagenes": len(imagenes)}
+
+
+@tarea("borrar_blobs")
+def borrar_blobs(c, ctx, claves):
+    borrar_blobs_sin_referencias(c, ctx.almacen, claves)
+    return {"claves": len(claves)}
+
+
+@tarea("exportar")
+def exportar(c, ctx, formato, con_imagenes=False, con_ventas=False, url_imagenes=""):
+    # El fichero va al almacén (compartido con la app) y se descarga desde ahí
+    with exportar_a_temporal(ctx.pool, formato, con_imagenes=con_imagenes, con_ventas=con_ventas,
+                             url_imagenes=url_imagenes) as fichero:
+        datos = fichero.read()
+    return {"clave": ctx.almacen.guardar(datos), "nombre": nombre_fichero(formato),
+            "formato": formato, "bytes": len(datos)}
+
+
+@tarea("regenerar_variantes")
+def regenerar_variantes(c, ctx, desde_id=0):
+    """Genera los tamaños y formatos que falten, por lotes de LOTE_VARIANTES imágenes.
+
+    Parte de la variante WEBP más grande guardada; cada lote encola el siguiente.
+    """
+    c.execute("""
+        SELECT id, clave, variantes FROM imagenes_muebles
+        WHERE id > %s AND clave IS NOT NULL
+        ORDER BY id
+        LIMIT %s
+    """, (desde_id, LOTE_VARIANTES))
+    filas = c.fetchall()
+    regeneradas = 0
+    for fila in filas:
+        variantes = fila["variantes"] or {}
+        if all(str(t) in variantes.get(f, {}) for f in FORMATOS for t in TAMANOS):
+            continue
+        indice = guardar_variantes(ctx.almacen, generar_variantes(ctx.almacen.leer(fila["clave"])))
+        c.execute("UPDATE imagenes_muebles SET variantes = %s WHERE id = %s", (Json(indice), fila["id"]))
+        regeneradas += 1
+    if len(filas) == LOTE_VARIANTES:
+        encolar(c, "regenerar_variantes", {"desde_id": filas[-1]["id"]})
+    return {"revisadas": len(filas), "regeneradas": regeneradas}
+
+
+def _borrar_sin_referencias(ctx, claves):
+    with ctx.pool.cursor() as c:
+        borrar_blobs_sin_referencias(c, ctx.almacen, claves)
+
+
+# --- Worker ---
+class Latido:
+    """Hilo que refresca el latido del trabajo en curso hasta que se para."""
+
+    def __init__(self, pool, trabajo_id, intervalo=INTERVALO_LATIDO_S):
+        self.pool = pool
+        self.trabajo_id = trabajo_id
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._latir, daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+
+    def _latir(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                # Transacción propia: la del trabajo no se confirma hasta el final
+                with self.pool.cursor() as c:
+                    latir(c, self.trabajo_id)
+            except Exception:
+                logger.warning("Trabajo %s: no se pudo refrescar el latido", self.trabajo_id, exc_info=True)
+
+
+def ejecutar_uno(pool, almacen):
+    """Toma y ejecuta un trabajo. Devuelve False si la cola estaba vacía."""
+    with pool.cursor() as c:
+        trabajo = tomar(c)
+    if trabajo is None:
+        return False
+    ctx = Contexto(pool, almacen)
+    inicio = time.perf_counter()
+    try:
+        funcion = TAREAS[trabajo["tipo"]]
+        with Latido(pool, trabajo["id"]), pool.cursor() as c:
+            resultado = funcion(c, ctx, **trabajo["datos"])
+            terminar(c, trabajo["id"], resultado)
+    except Exception:
+        logger.exception("Trabajo %s (%s) fallido, intento %d/%d", trabajo["id"], trabajo["tipo"],
+                         trabajo["intentos"], trabajo["max_intentos"])
+        with pool.cursor() as c:
+            fallar(c, trabajo, traceback.format_exc(limit=5))
+        return True
+    logger.info("Trabajo %s (%s) hecho en %.1f s", trabajo["id"], trabajo["tipo"],
+                time.perf_counter() - inicio)
+    for accion in ctx.tras_confirmar:
+        try:
+            accion()
+        except Exception:
+            logger.exception("Trabajo %s: fallo en la limpieza posterior", trabajo["id"])
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de trabajos")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="segundos entre sondeos con la cola vacía")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s [{os.getpid()}] %(message)s")
+
+    secrets = cargar_secrets(args.secrets)
+    # La del trabajo, la del latido y la de exportar (que lee con su propio cursor)
+    pool = crear_pool({**secrets["postgres"], "pool_max": 3})
+    almacen = crear_almacen(secrets.get("imagenes"))
+    with pool.cursor() as c:
+        migrar(c)
+    logger.info("Worker en marcha; tareas: %s", ", ".join(sorted(TAREAS)))
+    ultimo_mantenimiento = 0.0
+    try:
+        while True:
+            if time.monotonic() - ultimo_mantenimiento > 60:
+                ultimo_mantenimiento = time.monotonic()
+                try:
+                    with pool.cursor() as c:
+                        devueltos, fallidos = recuperar_atascados(c)
+                        if devueltos or fallidos:
+                            logger.warning("Trabajos atascados: %d devueltos a la cola, %d fallidos",
+                                           devueltos, fallidos)
+                        purgar(c, almacen)
+                        # Una vez al día: repaso de los resúmenes de ventas y foto de existencias
+                        if mantenimiento_diario(c):
+                            logger.info("Resúmenes de ventas al día")
+                except Exception:
+                    logger.exception("Error en el mantenimiento de la cola")
+            if not ejecutar_uno(pool, almacen):
+                time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# --- Analítica de ventas con resúmenes diarios precalculados ---
+# Cada vez que un mueble pasa a vendido (o vuelve a estar en venta) se apunta
+# un evento en eventos_venta y, en la misma transacción, se suma a
+# ventas_diarias: una fila por día, tienda, tipo y banda de precio. La vista
+# de análisis del admin solo lee los resúmenes, así que su coste depende de
+# los días del periodo y no de cuántas ventas acumule el historial.
+#
+# Una vez al día (el worker de trabajos.py, la vista de análisis al abrirse, o
+# un cron) se rehacen los últimos días a partir de los eventos, por si algo se
+# desvió, y se guarda la foto de existencias en venta (stock_diario) con la
+# que se calcula el sell-through:
+#
+#     python ventas.py             rehace los DIAS_REPASO últimos días y la foto de hoy
+#     python ventas.py --todo      rehace los resúmenes desde el primer evento
+import argparse
+from datetime import date, timedelta
+
+from db import cargar_secrets, crear_pool
+
+# Límites (€) de las bandas de precio: banda 0 es "< 100 €", banda 4 "≥ 3000 €"
+BANDAS_PRECIO = (100, 300, 1000, 3000)
+DIAS_REPASO = 2
+
+_BANDA = "width_bucket(precio, %(bandas)s::numeric[])"
+
+
+def etiqueta_banda(banda):
+    if banda == 0:
+        return f"< {BANDAS_PRECIO[0]} €"
+    if banda >= len(BANDAS_PRECIO):
+        return f"≥ {BANDAS_PRECIO[-1]} €"
+    return f"{BANDAS_PRECIO[banda - 1]}–{BANDAS_PRECIO[banda]} €"
+
+
+# --- Escritura (en la transacción del cambio de estado) ---
+_SUMAR_AL_RESUMEN = """
+    INSERT INTO ventas_diarias (dia, tienda, tipo, banda, ventas, ingresos, dias_en_tienda)
+    SELECT dia, tienda, tipo, banda, SUM(signo), SUM(signo * precio), SUM(signo * dias_en_tienda)
+    FROM evento
+    GROUP BY dia, tienda, tipo, banda
+    ON CONFLICT (dia, tienda, tipo, banda) DO UPDATE SET
+        ventas = ventas_diarias.ventas + EXCLUDED.ventas,
+        ingresos = ventas_diarias.ingresos + EXCLUDED.ingresos,
+        dias_en_tienda = ventas_diarias.dias_en_tienda + EXCLUDED.dias_en_tienda
+"""
+
+
+def registrar_ventas(c, mueble_ids, vendido):
+    """Apunta la venta (o su anulación) de los muebles y la suma a ventas_diarias.
+
+    La anulación copia día, tienda, tipo, banda y precio de la última venta
+    del mueble, así que resta exactamente lo que sumó; sin venta previa
+    apuntada (vendidos antes de existir los eventos) no hace nada.
+    """
+    if not mueble_ids:
+        return
+    if vendido:
+        origen = f"""
+            SELECT id, 'venta', 1, COALESCE(fecha_venta, NOW())::date, tienda, COALESCE(tipo, ''),
+                   {_BANDA}, precio,
+                   GREATEST(EXTRACT(EPOCH FROM COALESCE(fecha_venta, NOW()) - fecha) / 86400, 0)
+            FROM muebles WHERE id = ANY(%(ids)s)
+        """
+    else:
+        origen = """
+            SELECT mueble_id, 'anulacion', -1, dia, tienda, tipo, banda, precio, dias_en_tienda
+            FROM (
+                SELECT DISTINCT ON (mueble_id) * FROM eventos_venta
+                WHERE mueble_id = ANY(%(ids)s)
+                ORDER BY mueble_id, id DESC
+            ) ultimo
+            WHERE evento = 'venta'
+        """
+    c.execute(f"""
+        WITH evento AS (
+            INSERT INTO eventos_venta (mueble_id, evento, signo, dia, tienda, tipo, banda, precio, dias_en_tienda)
+            {origen}
+            RETURNING dia, tienda, tipo, banda, signo, precio, dias_en_tienda
+        )
+        {_SUMAR_AL_RESUMEN}
+    """, {"ids": list(mueble_ids), "bandas": list(BANDAS_PRECIO)})
+
+
+# --- Mantenimiento diario ---
+def recalcular_resumen(c, desde=None):
+    """Rehace ventas_diarias desde los eventos (todo, o a partir del día `desde`)."""
+    if desde is None:
+        c.execute("TRUNCATE ventas_diarias")
+    else:
+        c.execute("DELETE FROM ventas_diarias WHERE dia >= %s", (desde,))
+    c.execute("""
+        INSERT INTO ventas_diarias (dia, tienda, tipo, banda, ventas, ingresos, dias_en_tienda)
+        SELECT dia, tienda, tipo, banda, SUM(signo), SUM(signo * precio), SUM(signo * dias_en_tienda)
+        FROM eventos_venta
+        WHERE %(desde)s::date IS NULL OR dia >= %(desde)s::date
+        GROUP BY dia, tienda, tipo, banda
+    """, {"desde": desde})
+
+
+def fotografiar_existencias(c):
+    """Guarda (o rehace) la foto de hoy de los muebles en venta por tienda, tipo y banda."""
+    c.execute("DELETE FROM stock_diario WHERE dia = CURRENT_DATE")
+    c.execute(f"""
+        INSERT INTO stock_diario (dia, tienda, tipo, banda, en_venta)
+        SELECT CURRENT_DATE, tienda, COALESCE(tipo, ''), {_BANDA}, COUNT(*)
+        FROM muebles
+        WHERE vendido = FALSE
+        GROUP BY 1, 2, 3, 4
+    """, {"bandas": list(BANDAS_PRECIO)})
+
+
+def mantenimiento_diario(c):
+    """Repaso de los últimos días y foto de existencias, si hoy aún no se ha hecho.
+
+    Lo llaman el worker y la vista de análisis de la app; el cerrojo de
+    transacción evita que dos a la vez repitan el trabajo. Devuelve True si
+    ha trabajado.
+    """
+    c.execute("SELECT pg_try_advisory_xact_lock(hashtext('ventas.mantenimiento_diario')) AS libre")
+    if not c.fetchone()["libre"]:
+        return False
+    c.execute("SELECT 1 FROM stock_diario WHERE dia = CURRENT_DATE LIMIT 1")
+    if c.fetchone():
+        return False
+    recalcular_resumen(c, date.today() - timedelta(days=DIAS_REPASO))
+    fotografiar_existencias(c)
+    return True
+
+
+# --- Lectura para la vista de análisis ---
+def _ratio(parte, total):
+    return parte / total if total else None
+
+
+def _por(filas, campo):
+    # GROUPING(campo) = 0 en las filas del conjunto agrupado por ese campo
+    return {f[campo]: f for f in filas if not f[f"sin_{campo}"]}
+
+
+def _total(filas):
+    return next((f for f in filas if all(v for k, v in f.items() if k.startswith("sin_"))), None)
+
+
+def _metricas(venta, stock, meses, hay_foto=True):
+    # Sin foto de existencias no se sabe cuánto hay en venta: ni en_venta ni
+    # sell-through (que saldría 100 % con en_venta = 0)
+    n = int(venta["ventas"] or 0) if venta else 0
+    ingresos = float(venta["ingresos"] or 0) if venta else 0.0
+    en_venta = (int(stock["en_venta"]) if stock else 0) if hay_foto else None
+    return {
+        "ventas": n,
+        "ingresos": ingresos,
+        "ticket_medio": _ratio(ingresos, n),
+        "dias_medios": _ratio(float(venta["dias_en_tienda"]), n) if n else None,
+        "ventas_al_mes": n / meses,
+        "en_venta": en_venta,
+        "sell_through": _ratio(n, n + en_venta) if hay_foto else None,
+    }
+
+
+def resumen_ventas(c, desde, hasta, tienda=None):
+    """Métricas del periodo [desde, hasta], leyendo solo ventas_diarias y stock_diario.
+
+    Ventas, ingresos, ticket medio, días medios en tienda, ventas al mes y
+    sell-through (ventas / (ventas + en venta en la última foto)), en total,
+    por banda de precio y por tipo; y la serie de ventas por día.
+    """
+    filtro = "AND tienda = %(tienda)s" if tienda else ""
+    params = {"desde": desde, "hasta": hasta, "tienda": tienda}
+    c.execute(f"""
+        SELECT dia, banda, tipo,
+               GROUPING(dia) AS sin_dia, GROUPING(banda) AS sin_banda, GROUPING(tipo) AS sin_tipo,
+               SUM(ventas) AS ventas, SUM(ingresos) AS ingresos, SUM(dias_en_tienda) AS dias_en_tienda
+        FROM ventas_diarias
+        WHERE dia BETWEEN %(desde)s AND %(hasta)s {filtro}
+        GROUP BY GROUPING SETS ((), (dia), (banda), (tipo))
+    """, params)
+    ventas = c.fetchall()
+    c.execute(f"""
+        SELECT dia, banda, tipo, GROUPING(banda) AS sin_banda, GROUPING(tipo) AS sin_tipo,
+               SUM(en_venta) AS en_venta
+        FROM stock_diario
+        WHERE dia = (SELECT MAX(dia) FROM stock_diario WHERE dia <= %(hasta)s) {filtro}
+        GROUP BY GROUPING SETS ((dia), (dia, banda), (dia, tipo))
+    """, params)
+    existencias = c.fetchall()
+
+    meses = ((hasta - desde).days + 1) / 30
+    hay_foto = bool(existencias)
+    ventas_banda, stock_banda = _por(ventas, "banda"), _por(existencias, "banda")
+    ventas_tipo, stock_tipo = _por(ventas, "tipo"), _por(existencias, "tipo")
+    return {
+        "totales": _metricas(_total(ventas), _total(existencias), meses, hay_foto),
+        "por_banda": [{"banda": etiqueta_banda(b),
+                       **_metricas(ventas_banda.get(b), stock_banda.get(b), meses, hay_foto)}
+                      for b in range(len(BANDAS_PRECIO) + 1)],
+        "por_tipo": sorted(({"tipo": t, **_metricas(ventas_tipo.get(t), stock_tipo.get(t), meses, hay_foto)}
+                            for t in ventas_tipo.keys() | stock_tipo.keys()),
+                           key=lambda f: (-f["ingresos"], -(f["en_venta"] or 0), f["tipo"])),
+        "por_dia": [{"dia": d, "ventas": int(f["ventas"]), "ingresos": float(f["ingresos"])}
+                    for d, f in sorted(_por(ventas, "dia").items())],
+        "existencias_a": existencias[0]["dia"] if existencias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rehace los resúmenes de ventas y la foto de existencias")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    parser.add_argument("--todo", action="store_true", help="rehacer desde el primer evento")
+    args = parser.parse_args()
+
+    pool = crear_pool(cargar_secrets(args.secrets)["postgres"])
+    with pool.cursor() as c:
+        recalcular_resumen(c, None if args.todo else date.today() - timedelta(days=DIAS_REPASO))
+        fotografiar_existencias(c)
+    pool.cerrar()
+    print("Resúmenes de ventas al día")
+
+
+if __name__ == "__main__":
+    main()